@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Acumulador colunar dos itens extraídos dos XMLs
+
+Em vez de um dict de 8 chaves por item, cada coluna é guardada em um array
+tipado: quantidades e preços em int64 de ponto fixo (ver precos.py), e os
+campos de texto (protocolo, conta, item, arquivo, prestadores) como
+códigos int32 de um vocabulário próprio da coluna. O DataFrame final é
+montado a partir dos arrays, com as colunas de texto como Categorical, sem
+passar por linhas.
+"""
+
+from array import array
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_TEXTO = (
+    'NR_SEQ_PROTOCOLO',
+    'NR_INTERNO_CONTA',
+    'ITEM_CD_CONVENIO',
+    'ARQUIVO_XML',
+    'COD_PRESTADOR',
+    'COD_EXECUTANTE',
+    'CD_DESPESA',
+)
+COLUNAS_NUMERICAS = ('QT_ITEM', 'PRECO_UNITARIO', 'PRECO_TOTAL', 'REDUCAO_ACRESCIMO', 'GUIA')
+
+# Mesma ordem de colunas do antigo pd.DataFrame(lista_de_dicts), com o
+# prestador executante da guia e os campos da conferência de totais no fim
+ORDEM_COLUNAS = (
+    'NR_SEQ_PROTOCOLO',
+    'NR_INTERNO_CONTA',
+    'ITEM_CD_CONVENIO',
+    'QT_ITEM',
+    'PRECO_UNITARIO',
+    'PRECO_TOTAL',
+    'ARQUIVO_XML',
+    'COD_PRESTADOR',
+    'COD_EXECUTANTE',
+    'CD_DESPESA',
+    'REDUCAO_ACRESCIMO',
+    'GUIA',
+)
+
+
+class _Vocabulario:
+    """Interna os textos de uma coluna; None vira o código -1 (NaN no Categorical)"""
+
+    def __init__(self):
+        self.codigos = {}
+        self.valores = []
+
+    def codigo(self, valor):
+        if valor is None:
+            return -1
+        codigo = self.codigos.get(valor)
+        if codigo is None:
+            codigo = len(self.valores)
+            self.codigos[valor] = codigo
+            self.valores.append(valor)
+        return codigo
+
+    def __getstate__(self):
+        # O dict é reconstruído na leitura: só a lista vai para o pickle
+        return self.valores
+
+    def __setstate__(self, valores):
+        self.valores = valores
+        self.codigos = {valor: i for i, valor in enumerate(valores)}
+
+
+class AcumuladorItens:
+    """Itens de análise de preço/quantidade, guardados por coluna"""
+
+    def __init__(self):
+        self._vocabularios = {nome: _Vocabulario() for nome in COLUNAS_TEXTO}
+        self._codigos = {nome: array('i') for nome in COLUNAS_TEXTO}
+        self._valores = {nome: array('q') for nome in COLUNAS_NUMERICAS}
+
+    def __len__(self):
+        return len(self._valores['QT_ITEM'])
+
+    def adicionar(self, protocolo, conta, item, qtd, valor_unit, valor_total, arquivo,
+                  cod_prestador, cod_executante=None, reducao=100, cd_despesa=None, guia=-1):
+        """
+        Acrescenta um item. qtd vem em décimos de milésimo e os valores em
+        centavos (inteiros); cod_prestador vem do próprio procedimento e
+        cod_executante do contratadoExecutante da guia.
+
+        reducao é o reducaoAcrescimo em centésimos (100 = 1.00), cd_despesa
+        o codigoDespesa (None nos procedimentos) e guia a posição da guia
+        no arquivo, para a conferência dos totais da guia.
+        """
+        textos = (protocolo, conta, item, arquivo, cod_prestador, cod_executante, cd_despesa)
+        for nome, texto in zip(COLUNAS_TEXTO, textos):
+            self._codigos[nome].append(self._vocabularios[nome].codigo(texto))
+        self._valores['QT_ITEM'].append(qtd)
+        self._valores['PRECO_UNITARIO'].append(valor_unit)
+        self._valores['PRECO_TOTAL'].append(valor_total)
+        self._valores['REDUCAO_ACRESCIMO'].append(reducao)
+        self._valores['GUIA'].append(guia)
+
+    def adicionar_guia(self, protocolo, conta, arquivo, cod_executante, itens_guia, guia=-1):
+        """
+        Acrescenta de uma vez os itens de uma guia, cada um como (item, qtd,
+        valor_unit, valor_total, cod_prestador, reducao, cd_despesa), nas
+        unidades de adicionar. Os textos comuns à guia (protocolo, conta,
+        arquivo e executante) são traduzidos uma única vez.
+        """
+        quantidade = len(itens_guia)
+        if not quantidade:
+            return
+        codigos = self._codigos
+        vocabularios = self._vocabularios
+        for nome, texto in (('NR_SEQ_PROTOCOLO', protocolo), ('NR_INTERNO_CONTA', conta),
+                            ('ARQUIVO_XML', arquivo), ('COD_EXECUTANTE', cod_executante)):
+            codigos[nome].extend([vocabularios[nome].codigo(texto)] * quantidade)
+
+        item, qtd, valor_unit, valor_total, cod_prestador, reducao, cd_despesa = zip(*itens_guia)
+        for nome, textos in (('ITEM_CD_CONVENIO', item), ('COD_PRESTADOR', cod_prestador),
+                             ('CD_DESPESA', cd_despesa)):
+            codigo = vocabularios[nome].codigo
+            codigos[nome].extend([codigo(texto) for texto in textos])
+        self._valores['QT_ITEM'].extend(qtd)
+        self._valores['PRECO_UNITARIO'].extend(valor_unit)
+        self._valores['PRECO_TOTAL'].extend(valor_total)
+        self._valores['REDUCAO_ACRESCIMO'].extend(reducao)
+        self._valores['GUIA'].extend([guia] * quantidade)
+
+    def estender(self, outro, cod_prestador=None, excluir_contas=None, usar_executante=False, contas=None):
+        """
+        Acrescenta os itens de outro acumulador (ex.: o de um arquivo),
+        traduzindo os códigos para o vocabulário deste. Com cod_prestador,
+        só entram os itens desse código de prestador; com contas, só os
+        dessas contas; os itens das contas em excluir_contas ficam de fora.
+
+        Com usar_executante, o item sem código no procedimento conta como
+        do prestador executante da guia.
+        """
+        if not len(outro):
+            return
+
+        selecao = None
+        if cod_prestador is not None:
+            selecao = outro.selecionar_prestador(cod_prestador, usar_executante)
+            if not selecao.any():
+                return
+
+        if contas is not None:
+            das_contas = outro.selecionar_contas(contas)
+            selecao = das_contas if selecao is None else selecao & das_contas
+            if not selecao.any():
+                return
+
+        manter = outro.manter_contas(excluir_contas)
+        if manter is not None:
+            selecao = manter if selecao is None else selecao & manter
+
+        for nome in COLUNAS_TEXTO:
+            vocabulario = self._vocabularios[nome]
+            # O -1 no fim faz mapa[-1] == -1, preservando os valores ausentes
+            mapa = np.array(
+                [vocabulario.codigo(valor) for valor in outro._vocabularios[nome].valores] + [-1],
+                dtype=np.int32
+            )
+            codigos = np.frombuffer(outro._codigos[nome], dtype=np.int32)
+            if selecao is not None:
+                codigos = codigos[selecao]
+            self._codigos[nome].frombytes(mapa[codigos].tobytes())
+
+        for nome in COLUNAS_NUMERICAS:
+            valores = np.frombuffer(outro._valores[nome], dtype=np.int64)
+            if selecao is not None:
+                valores = valores[selecao]
+            self._valores[nome].frombytes(valores.tobytes())
+
+    def manter_contas(self, excluir_contas):
+        """Máscara booleana dos itens fora de excluir_contas, ou None se nenhum item é excluído"""
+        if not excluir_contas:
+            return None
+        vocabulario_contas = self._vocabularios['NR_INTERNO_CONTA'].codigos
+        excluidas = [vocabulario_contas[conta] for conta in excluir_contas if conta in vocabulario_contas]
+        if not excluidas:
+            return None
+        return ~np.isin(self.coluna('NR_INTERNO_CONTA'), excluidas)
+
+    def selecionar_contas(self, contas):
+        """Máscara booleana dos itens das contas"""
+        vocabulario_contas = self._vocabularios['NR_INTERNO_CONTA'].codigos
+        return np.isin(self.coluna('NR_INTERNO_CONTA'),
+                       [vocabulario_contas[conta] for conta in contas if conta in vocabulario_contas])
+
+    def coluna(self, nome):
+        """
+        Array numpy da coluna, sem cópia: os códigos int32 nas colunas de
+        texto (o texto é textos(nome)[codigo]) e os int64 nas numéricas
+        """
+        if nome in self._codigos:
+            return np.frombuffer(self._codigos[nome], dtype=np.int32)
+        return np.frombuffer(self._valores[nome], dtype=np.int64)
+
+    def textos(self, nome):
+        """Vocabulário da coluna de texto nome, na ordem dos códigos"""
+        return self._vocabularios[nome].valores
+
+    def selecionar_prestador(self, cod_prestador, usar_executante=False):
+        """Máscara booleana dos itens de cod_prestador"""
+        codigos = np.frombuffer(self._codigos['COD_PRESTADOR'], dtype=np.int32)
+        codigo_local = self._vocabularios['COD_PRESTADOR'].codigos.get(cod_prestador, -2)
+        selecao = codigos == codigo_local
+        if usar_executante:
+            executante_local = self._vocabularios['COD_EXECUTANTE'].codigos.get(cod_prestador, -2)
+            executantes = np.frombuffer(self._codigos['COD_EXECUTANTE'], dtype=np.int32)
+            selecao |= (codigos == -1) & (executantes == executante_local)
+        return selecao
+
+    def pares_guia_item(self):
+        """
+        Pares (posição da guia, código do item) distintos, sem montar o
+        DataFrame; os itens sem posição de guia ficam de fora
+        """
+        guias = np.frombuffer(self._valores['GUIA'], dtype=np.int64).tolist()
+        codigos = np.frombuffer(self._codigos['ITEM_CD_CONVENIO'], dtype=np.int32).tolist()
+        valores_itens = self._vocabularios['ITEM_CD_CONVENIO'].valores
+        return [(guia, valores_itens[codigo])
+                for guia, codigo in dict.fromkeys(zip(guias, codigos))
+                if guia >= 0 and codigo >= 0]
+
+    def para_dataframe(self):
+        """Monta o DataFrame direto dos arrays (texto como Categorical)"""
+        dados = {}
+        for nome in ORDEM_COLUNAS:
+            if nome in self._codigos:
+                codigos = np.frombuffer(self._codigos[nome], dtype=np.int32).copy()
+                dados[nome] = pd.Categorical.from_codes(
+                    codigos, categories=pd.Index(self._vocabularios[nome].valores, dtype=object)
+                )
+            else:
+                dados[nome] = np.frombuffer(self._valores[nome], dtype=np.int64).copy()
+        return pd.DataFrame(dados)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de ponta a ponta da comparação sobre corpus sintéticos
+
+Para cada escala (múltiplo do volume real da pasta xml/), gera ou
+reaproveita um corpus com corpus_sintetico e roda as quatro etapas do
+comparar_contas_v3 sobre ele, medindo cada uma separadamente:
+- extracao: extrair_dados_xmls (sem cache, para medir a leitura)
+- excel: processar_excel
+- comparacao: comparar_dados (com --em-camadas, a comparação em camadas)
+- relatorio: gerar_relatorio (num diretório temporário)
+
+Cada etapa é medida com instrumentacao.Metricas: tempo de relógio, tempo
+de CPU (do processo e dos processos filhos já encerrados, com --workers),
+pico de memória residente (RSS, amostrado durante a etapa), RSS ao final
+e as vazões (arquivos/s, guias/s, itens/s). Os XMLs mais lentos da
+extração também vão para o registro. Com --tracemalloc, também o pico de
+memória alocada pelo Python na etapa; o rastreamento deixa as etapas mais
+lentas, então os tempos dessa execução não são comparáveis com os das
+outras.
+
+Cada repetição vira uma linha JSON acrescentada ao arquivo de resultados
+(JSON Lines), com data, commit, versões e o volume do corpus, para
+acompanhar regressões entre mudanças.
+
+Uso:
+
+    python benchmark.py --escalas 1,10 --repeticoes 3
+    python benchmark.py --escalas 0.1 --tracemalloc
+
+O corpus de escala 100 tem dezenas de GB e fica fora do padrão (1,10): só é
+gerado e medido com --escalas 100 explícito.
+"""
+
+import io
+import os
+import json
+import platform
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import comparar_contas_v3 as v3
+from corpus_sintetico import ler_escala, preparar_corpus
+from instrumentacao import Metricas
+
+PASTA_CORPUS = '.corpus_sintetico'
+ARQUIVO_RESULTADOS = 'benchmark_resultados.jsonl'
+# A escala 100 (dezenas de GB) fica de fora do padrão: só com --escalas 100
+ESCALAS_PADRAO = '1,10'
+ETAPAS = ('extracao', 'excel', 'comparacao', 'relatorio')
+
+# Arquivos mais lentos guardados em cada registro
+LIMITE_MAIS_LENTOS = 10
+
+MB = 2 ** 20
+
+
+def medir_etapas(pasta_corpus, manifesto, workers=1, verificar_hash=True, verboso=False, em_camadas=False):
+    """Roda as quatro etapas sobre o corpus e retorna (Metricas da execução, contagens)"""
+    pasta_xml = os.path.join(pasta_corpus, manifesto['pasta_xml'])
+    arquivo_excel = os.path.join(pasta_corpus, manifesto['arquivo_excel'])
+    metricas = Metricas()
+
+    saida = contextlib.nullcontext() if verboso else contextlib.redirect_stdout(io.StringIO())
+    with saida, tempfile.TemporaryDirectory(prefix='benchmark_') as pasta_relatorio:
+        with metricas.etapa('extracao'):
+            resultado_xml = v3.extrair_dados_xmls(workers=workers, pasta_xml=pasta_xml,
+                                                  verificar_hash=verificar_hash, metricas=metricas)
+        (itens_xml, protocolos_xml, contas_xml, arquivos_por_protocolo,
+         protocolos_duplicados, protocolo_por_conta_xml, contas_por_arquivo,
+         assinaturas_por_protocolo, hashes_por_arquivo, posicoes_guias, totais_guias) = resultado_xml
+
+        with metricas.etapa('excel') as etapa:
+            resultado_excel = v3.processar_excel(arquivo_excel=arquivo_excel)
+            etapa.contar(linhas=len(resultado_excel[1]))
+        (df_excel_agrupado, df_excel_original, protocolos_excel,
+         contas_excel, protocolo_por_conta_excel) = resultado_excel
+
+        with metricas.etapa('comparacao') as etapa:
+            resultados = v3.comparar_dados(
+                df_excel_agrupado, itens_xml,
+                protocolos_excel, protocolos_xml,
+                contas_excel, contas_xml,
+                arquivos_por_protocolo, protocolos_duplicados,
+                protocolo_por_conta_xml, protocolo_por_conta_excel,
+                contas_por_arquivo,
+                assinaturas_por_protocolo=assinaturas_por_protocolo,
+                hashes_por_arquivo=hashes_por_arquivo if verificar_hash else None,
+                posicoes_guias=posicoes_guias,
+                totais_guias=totais_guias,
+                em_camadas=em_camadas
+            )
+            etapa.contar(itens=len(itens_xml), linhas_excel=len(df_excel_agrupado))
+
+        with metricas.etapa('relatorio') as etapa:
+            v3.gerar_relatorio(*resultados, arquivo_saida=os.path.join(pasta_relatorio, 'relatorio.xlsx'))
+            etapa.contar(linhas=sum(len(df) for df in resultados if df is not None))
+
+    contagens = {
+        'contas_xml': len(contas_xml),
+        'itens_analise_xml': len(itens_xml),
+        'linhas_excel_agrupadas': len(df_excel_agrupado),
+        'linhas_abas': [len(df) if df is not None else 0 for df in resultados],
+    }
+    return metricas, contagens
+
+
+def _commit_atual():
+    """Commit (abreviado) da árvore do script, ou None fora de um repositório git"""
+    try:
+        saida = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return saida.stdout.strip() or None
+
+
+def _ambiente():
+    return {
+        'commit': _commit_atual(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'processador': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+    }
+
+
+def gravar_resultado(caminho, registro):
+    """Acrescenta o registro como uma linha JSON ao arquivo de resultados"""
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    with open(caminho, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+
+
+def executar_benchmark(escalas, pasta_corpus=PASTA_CORPUS, arquivo_resultados=ARQUIVO_RESULTADOS,
+                       workers=1, repeticoes=1, semente=1, verificar_hash=True, usar_tracemalloc=False,
+                       verboso=False, em_camadas=False):
+    """Roda o benchmark em cada escala e retorna a lista de registros gravados"""
+    ambiente = _ambiente()
+    registros = []
+
+    for escala in escalas:
+        pasta = os.path.join(pasta_corpus, f'escala_{escala}')
+        manifesto = preparar_corpus(pasta, escala, semente)
+        corpus = {chave: manifesto[chave] for chave in
+                  ('arquivos', 'arquivos_reenvio', 'bytes_xml', 'guias', 'itens', 'linhas_excel', 'excel_truncado')}
+
+        print("\n" + "=" * 70)
+        print(f"BENCHMARK - escala {escala} ({manifesto['arquivos']} arquivos, "
+              f"{manifesto['bytes_xml'] / MB:.0f} MB, {sum(manifesto['itens'].values())} itens)")
+        print("=" * 70)
+
+        for repeticao in range(1, repeticoes + 1):
+            if usar_tracemalloc:
+                tracemalloc.start()
+            try:
+                metricas, contagens = medir_etapas(pasta, manifesto, workers, verificar_hash, verboso, em_camadas)
+            finally:
+                if usar_tracemalloc:
+                    tracemalloc.stop()
+
+            etapas = metricas.etapas
+            resumo = metricas.relatorio()
+            registro = dict(
+                data_hora=datetime.now().isoformat(timespec='seconds'),
+                escala=escala,
+                semente=semente,
+                repeticao=repeticao,
+                workers=workers,
+                verificar_hash=verificar_hash,
+                tracemalloc=usar_tracemalloc,
+                em_camadas=em_camadas,
+                total_s=round(sum(metricas['tempo_s'] for metricas in etapas.values()), 3),
+                etapas=etapas,
+                arquivos_lentos=resumo['arquivos']['lentos'],
+                mais_lentos=[{campo: arquivo[campo] for campo in ('arquivo', 'mes', 'bytes', 'itens', 'tempo_s')}
+                             for arquivo in resumo['mais_lentos'][:LIMITE_MAIS_LENTOS]],
+                corpus=corpus,
+                contagens=contagens,
+                ambiente=ambiente,
+            )
+            gravar_resultado(arquivo_resultados, registro)
+            registros.append(registro)
+
+            print(f"\n  Repeticao {repeticao}: {registro['total_s']:.2f} s")
+            for nome in ETAPAS:
+                medidas = etapas[nome]
+                memoria = f"  pico RSS {medidas['pico_rss_mb']:8.1f} MB" if 'pico_rss_mb' in medidas else ''
+                python = f"  pico Python {medidas['pico_python_mb']:8.1f} MB" if 'pico_python_mb' in medidas else ''
+                vazao = f"  {medidas['itens_por_s']:9.0f} itens/s" if medidas.get('itens_por_s') else ''
+                print(f"    {nome:<11} {medidas['tempo_s']:8.2f} s  CPU {medidas['cpu_s']:8.2f} s"
+                      f"{memoria}{python}{vazao}")
+
+    print(f"\n  Resultados acrescentados em: {arquivo_resultados}")
+    return registros
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark das etapas da comparacao sobre corpus sinteticos')
+    parser.add_argument('--escalas', default=ESCALAS_PADRAO,
+                        help=f'multiplos do volume real da pasta xml/, separados por virgula (padrao: {ESCALAS_PADRAO}; '
+                             'a escala 100 so com --escalas 100)')
+    parser.add_argument('--pasta-corpus', default=PASTA_CORPUS,
+                        help='pasta dos corpus gerados, um por escala (reaproveitados entre execucoes)')
+    parser.add_argument('--saida', default=ARQUIVO_RESULTADOS,
+                        help='arquivo JSON Lines onde cada repeticao e acrescentada')
+    parser.add_argument('--workers', type=int, default=1, help='processos para leitura dos XMLs (padrao: 1)')
+    parser.add_argument('--repeticoes', type=int, default=1, help='execucoes por escala (padrao: 1)')
+    parser.add_argument('--semente', type=int, default=1, help='semente do gerador do corpus (padrao: 1)')
+    parser.add_argument('--sem-verificar-hash', action='store_true', help='mede a extracao sem conferir o hash TISS')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='mede tambem o pico de memoria do Python por etapa (deixa as etapas mais lentas)')
+    parser.add_argument('--em-camadas', action='store_true',
+                        help='mede a comparacao em camadas (assinatura por conta antes do item a item)')
+    parser.add_argument('--verboso', action='store_true', help='mostra a saida das etapas')
+    args = parser.parse_args()
+
+    try:
+        escalas = [ler_escala(escala) for escala in args.escalas.split(',')]
+    except (ValueError, argparse.ArgumentTypeError) as e:
+        parser.error(str(e))
+
+    executar_benchmark(
+        escalas,
+        pasta_corpus=args.pasta_corpus,
+        arquivo_resultados=args.saida,
+        workers=args.workers,
+        repeticoes=args.repeticoes,
+        semente=args.semente,
+        verificar_hash=not args.sem_verificar_hash,
+        usar_tracemalloc=args.tracemalloc,
+        verboso=args.verboso,
+        em_camadas=args.em_camadas,
+    )
+
+
+if __name__ == "__main__":
+    main()
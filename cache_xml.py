@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Cache em disco do resultado da leitura de cada arquivo XML TISS
+
+O nome de cada arquivo TISS já traz o hash do epílogo (ex.:
+305763_61487cf....xml). A entrada do cache é identificada por esse nome,
+pelo tamanho e pela data de modificação do arquivo, e por uma assinatura
+da configuração de extração. Assim, a validade de uma entrada é conferida
+só com os.stat, sem abrir o XML: arquivos de meses já fechados nunca são
+lidos de novo, e arquivos novos ou alterados geram uma entrada nova.
+
+Cada arquivo XML fica com uma única entrada: ao gravar a nova, as
+anteriores do mesmo arquivo (outro tamanho, data, versão do cache ou
+configuração) são apagadas, para a pasta não crescer a cada mudança. A
+pasta é listada uma vez por execução (entradas_por_arquivo), não a cada
+gravação.
+"""
+
+import os
+import re
+import pickle
+import hashlib
+
+# Incrementar quando o formato do resultado de processar_arquivo_xml mudar
+VERSAO_CACHE = 10
+
+
+def assinatura_extracao(*parametros):
+    """Resumo curto da versão do cache e dos parâmetros que afetam a extração"""
+    texto = repr((VERSAO_CACHE,) + parametros)
+    return hashlib.md5(texto.encode('utf-8')).hexdigest()[:12]
+
+
+# Nome de uma entrada: <nome do xml>_<tamanho>_<mtime_ns>_<assinatura>.pkl
+_NOME_ENTRADA = re.compile(r'(.+)_\d+_\d+_[0-9a-f]{12}\.pkl')
+
+
+def caminho_entrada(pasta_cache, caminho_xml, assinatura):
+    """Caminho da entrada de cache correspondente ao estado atual do arquivo"""
+    st = os.stat(caminho_xml)
+    nome = os.path.splitext(os.path.basename(caminho_xml))[0]
+    return os.path.join(pasta_cache, f"{nome}_{st.st_size}_{st.st_mtime_ns}_{assinatura}.pkl")
+
+
+def entradas_por_arquivo(pasta_cache):
+    """
+    Nomes das entradas que já estão na pasta, por nome do arquivo XML:
+    {nome: [entradas]}. Outros arquivos da pasta são ignorados.
+    """
+    entradas = {}
+    if not os.path.isdir(pasta_cache):
+        return entradas
+    for nome in os.listdir(pasta_cache):
+        entrada = _NOME_ENTRADA.fullmatch(nome)
+        if entrada is not None:
+            entradas.setdefault(entrada.group(1), []).append(nome)
+    return entradas
+
+
+def entradas_antigas(existentes, caminho_entrada_cache):
+    """
+    Caminhos das outras entradas do mesmo arquivo XML, a partir da
+    listagem de entradas_por_arquivo
+    """
+    pasta, nome_entrada = os.path.split(caminho_entrada_cache)
+    entrada = _NOME_ENTRADA.fullmatch(nome_entrada)
+    if entrada is None:
+        return []
+    return [os.path.join(pasta, nome) for nome in existentes.get(entrada.group(1), ()) if nome != nome_entrada]
+
+
+def ler_cache(caminho_entrada_cache):
+    """Retorna o resultado guardado, ou None se a entrada não existir ou estiver corrompida"""
+    try:
+        with open(caminho_entrada_cache, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def gravar_cache(caminho_entrada_cache, resultado, antigas=()):
+    """
+    Grava a entrada de forma atômica (arquivo temporário + os.replace) e
+    depois apaga as entradas antigas (caminhos de entradas_antigas)
+    """
+    os.makedirs(os.path.dirname(caminho_entrada_cache), exist_ok=True)
+    temporario = f"{caminho_entrada_cache}.{os.getpid()}.tmp"
+    with open(temporario, 'wb') as f:
+        pickle.dump(resultado, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporario, caminho_entrada_cache)
+    for antiga in antigas:
+        try:
+            os.remove(antiga)
+        except OSError:
+            pass
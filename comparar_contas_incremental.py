@@ -0,0 +1,501 @@
+# -*- coding: utf-8 -*-
+"""
+Comparação incremental de contas médicas entre Excel (TASY) e XML (TISS)
+
+Guarda o estado da última execução e, na seguinte, refaz só o que mudou,
+com custo proporcional às pastas e contas alteradas:
+- XML: cada pasta de mês (REF MM.AAAA) tem seu estado já consolidado
+  (itens do prestador, arquivos e protocolo de cada conta, assinaturas das
+  guias e posições), e o índice guarda as contas e protocolos de cada
+  pasta. Só as pastas novas ou alteradas são lidas de novo; das outras, só
+  são carregadas as que têm alguma conta ou protocolo afetado.
+- Excel: a exportação do TASY só é relida quando o arquivo muda. Cada conta
+  tem uma assinatura (hash das linhas agrupadas) e só as contas com
+  assinatura diferente contam como alteradas.
+- Abas: as linhas das contas afetadas (abas 2 a 6: contas das pastas
+  alteradas + contas alteradas no Excel) e dos protocolos afetados (abas 1
+  e 7) são refeitas e trocadas nas abas salvas. As abas 8 a 10 dependem só
+  de cada arquivo: ficam no índice, por pasta de mês, e são concatenadas.
+
+Uso:
+
+    python comparar_contas_incremental.py --pasta-xml xml --excel tasy.xlsx \
+        --saida relatorio.xlsx --pasta-estado .estado_incremental
+
+Sem as opções, valem as configurações de comparar_contas_v3 e a pasta de
+estado PASTA_ESTADO. Um estado só vale para a mesma pasta de XMLs,
+prestador, contas ignoradas e tolerância; com outra configuração, a
+execução é completa.
+"""
+
+import os
+import argparse
+from collections import OrderedDict, defaultdict
+
+import pandas as pd
+
+import comparar_contas_v3 as v3
+from acumulador_itens import AcumuladorItens
+from cache_xml import ler_cache, gravar_cache
+from saida_colunar import FORMATOS_PADRAO
+
+# Relativa à pasta de execução (--pasta-estado muda)
+PASTA_ESTADO = '.estado_incremental'
+
+# Incrementar quando o formato do estado mudar
+VERSAO_ESTADO = 11
+
+# Colunas que definem a ordem de cada aba de itens numa execução completa.
+# Dentro de uma mesma conta a ordem já vem certa de comparar_itens.
+ORDEM_ABAS_ITENS = (
+    ['NR_INTERNO_CONTA'],
+    ['NR_INTERNO_CONTA'],
+    ['NR_SEQ_PROTOCOLO', 'NR_INTERNO_CONTA'],
+    ['NR_SEQ_PROTOCOLO', 'NR_INTERNO_CONTA'],
+)
+
+# Abas 1 a 7 guardadas no estado: (coluna da chave, ordem). As linhas das
+# chaves afetadas são trocadas pelas recalculadas; as abas 1 e 2 não têm
+# ordem definida na execução completa.
+CHAVES_ABAS = (
+    ('NR_SEQ_PROTOCOLO', None),
+    ('NR_INTERNO_CONTA', None),
+) + tuple(('NR_INTERNO_CONTA', ordem) for ordem in ORDEM_ABAS_ITENS) + (
+    ('NR_SEQ_PROTOCOLO', ['NR_SEQ_PROTOCOLO']),
+)
+
+
+def trabalho_padrao(**campos):
+    """
+    Configuração de uma execução, com as chaves dos trabalhos de
+    reconciliar.py (pasta_xml, arquivo_excel, arquivo_saida,
+    codigo_prestador, contas_ignorar, tolerancia_preco, usar_executante)
+    mais pasta_estado. Os campos não informados (ou None) ficam com as
+    configurações de comparar_contas_v3 e PASTA_ESTADO.
+    """
+    trabalho = {
+        'pasta_xml': v3.PASTA_XML,
+        'arquivo_excel': v3.ARQUIVO_EXCEL,
+        'arquivo_saida': v3.ARQUIVO_SAIDA,
+        'pasta_estado': PASTA_ESTADO,
+        'codigo_prestador': v3.CODIGO_PRESTADOR_VALIDO,
+        'contas_ignorar': v3.CONTAS_IGNORAR,
+        'tolerancia_preco': v3.TOLERANCIA_PRECO,
+        'usar_executante': False,
+    }
+    trabalho.update({campo: valor for campo, valor in campos.items() if valor is not None})
+    return trabalho
+
+
+def configuracao_atual(trabalho):
+    """Parâmetros que, se mudarem, invalidam todo o estado salvo"""
+    return (VERSAO_ESTADO, os.path.abspath(trabalho['pasta_xml']), trabalho['codigo_prestador'],
+            sorted(trabalho['contas_ignorar']), trabalho['tolerancia_preco'], trabalho['usar_executante'])
+
+
+def _arquivo_estado(trabalho, nome):
+    return os.path.join(trabalho['pasta_estado'], nome)
+
+
+def listar_meses(pasta):
+    """Agrupa os XMLs por pasta de mês, na ordem do os.walk: {pasta_mes: [caminhos]}"""
+    meses = OrderedDict()
+    for caminho in v3.listar_arquivos_xml(pasta):
+        meses.setdefault(os.path.dirname(caminho), []).append(caminho)
+    return meses
+
+
+def impressao_mes(caminhos):
+    """Identifica o conteúdo de uma pasta de mês pelos nomes, tamanhos e datas dos arquivos"""
+    impressao = []
+    for caminho in caminhos:
+        st = os.stat(caminho)
+        impressao.append((os.path.basename(caminho), st.st_size, st.st_mtime_ns))
+    return tuple(impressao)
+
+
+def _arquivo_mes(trabalho, pasta_mes):
+    relativo = os.path.relpath(pasta_mes, trabalho['pasta_xml'])
+    return _arquivo_estado(trabalho, 'mes_' + relativo.replace(os.sep, '__').replace(' ', '_') + '.pkl')
+
+
+def consolidar_mes(resultados, trabalho=None):
+    """
+    Consolida os resultados da leitura de uma pasta de mês e retorna
+    (estado, entrada do índice). O estado tem o que a comparação das contas
+    afetadas usa; a entrada, o resumo da pasta (contas, protocolos,
+    quantidade de itens) e as linhas das abas 8 a 10 dos seus arquivos.
+    """
+    trabalho = trabalho or trabalho_padrao()
+    (itens, protocolos, contas, arquivos_por_protocolo, _, protocolo_por_conta,
+     contas_por_arquivo, assinaturas_por_protocolo, hashes_por_arquivo, posicoes_guias,
+     totais_guias) = v3.consolidar_arquivos_xml(
+        resultados, cod_prestador=trabalho['codigo_prestador'], contas_ignorar=trabalho['contas_ignorar'],
+        usar_executante=trabalho['usar_executante'], todas_assinaturas=True)
+    df_totais_guias, df_totais_itens = totais_guias.conferir()
+
+    estado = {
+        'itens': itens,
+        'arquivos_por_protocolo': dict(arquivos_por_protocolo),
+        'protocolo_por_conta': protocolo_por_conta,
+        'contas_por_arquivo': dict(contas_por_arquivo),
+        'assinaturas_por_protocolo': dict(assinaturas_por_protocolo),
+        'posicoes_guias': posicoes_guias,
+    }
+    entrada = {
+        'contas': contas,
+        'protocolos': protocolos,
+        'itens': len(itens),
+        'arquivos_verificados': len(hashes_por_arquivo),
+        'integridade': v3.verificar_integridade(hashes_por_arquivo),
+        'totais_guias': df_totais_guias,
+        'totais_itens': df_totais_itens,
+    }
+    return estado, entrada
+
+
+def ler_mes(trabalho, pasta_mes, caminhos, workers, pasta_cache):
+    """Lê e consolida uma pasta de mês, grava o estado e retorna (estado, entrada do índice)"""
+    print(f"  Lendo {os.path.relpath(pasta_mes, trabalho['pasta_xml'])} ({len(caminhos)} arquivos)")
+    estado, entrada = consolidar_mes(v3.processar_arquivos_xml(caminhos, workers, pasta_cache), trabalho)
+    entrada['impressao'] = impressao_mes(caminhos)
+    gravar_cache(_arquivo_mes(trabalho, pasta_mes), estado)
+    return estado, entrada
+
+
+def atualizar_meses(trabalho, indice, meses, workers, pasta_cache):
+    """
+    Lê de novo só as pastas de mês novas ou alteradas, atualizando o índice,
+    e retorna (estados das pastas relidas, contas afetadas, protocolos
+    afetados, pastas relidas ou removidas). As contas e protocolos da versão
+    anterior de cada pasta também contam como afetados.
+    """
+    estados = {}
+    contas_afetadas = set()
+    protocolos_afetados = set()
+    relidos = []
+
+    for pasta_mes, caminhos in meses.items():
+        salvo = indice['meses'].get(pasta_mes)
+        if (salvo is not None and salvo['impressao'] == impressao_mes(caminhos)
+                and os.path.exists(_arquivo_mes(trabalho, pasta_mes))):
+            continue
+
+        estado, entrada = ler_mes(trabalho, pasta_mes, caminhos, workers, pasta_cache)
+        for versao in (salvo, entrada):
+            if versao is not None:
+                contas_afetadas |= versao['contas']
+                protocolos_afetados |= versao['protocolos']
+        indice['meses'][pasta_mes] = entrada
+        estados[pasta_mes] = estado
+        relidos.append(pasta_mes)
+
+    # Pastas que sumiram: as contas delas também precisam ser refeitas
+    for pasta_mes in list(indice['meses']):
+        if pasta_mes not in meses:
+            salvo = indice['meses'].pop(pasta_mes)
+            contas_afetadas |= salvo['contas']
+            protocolos_afetados |= salvo['protocolos']
+            try:
+                os.remove(_arquivo_mes(trabalho, pasta_mes))
+            except OSError:
+                pass
+            relidos.append(pasta_mes)
+
+    # A ordem das pastas define o primeiro protocolo visto de cada conta
+    indice['meses'] = OrderedDict((pasta_mes, indice['meses'][pasta_mes]) for pasta_mes in meses)
+    return estados, contas_afetadas, protocolos_afetados, relidos
+
+
+def carregar_meses(trabalho, indice, meses, estados, contas_afetadas, protocolos_afetados, workers, pasta_cache):
+    """
+    Estados das pastas de mês com alguma conta ou protocolo afetado, na
+    ordem das pastas: os das relidas já estão em estados, os outros vêm do
+    disco (a pasta é relida se o estado salvo não puder ser lido)
+    """
+    carregados = []
+    for pasta_mes, entrada in indice['meses'].items():
+        estado = estados.get(pasta_mes)
+        if estado is None:
+            if entrada['contas'].isdisjoint(contas_afetadas) and entrada['protocolos'].isdisjoint(protocolos_afetados):
+                continue
+            estado = ler_cache(_arquivo_mes(trabalho, pasta_mes))
+            if estado is None:
+                estado, indice['meses'][pasta_mes] = ler_mes(trabalho, pasta_mes, meses[pasta_mes], workers,
+                                                             pasta_cache)
+        carregados.append(estado)
+    return carregados
+
+
+def juntar_meses(estados, contas):
+    """
+    Junta os estados de pastas de mês (na ordem das pastas) como
+    consolidar_arquivos_xml faria com os arquivos delas, mas só com os itens
+    de contas. Retorna (itens, arquivos_por_protocolo, protocolo_por_conta,
+    contas_por_arquivo, assinaturas_por_protocolo, posicoes_guias).
+
+    Cada conta ou protocolo só sai completo se todas as pastas em que
+    aparece estão em estados (ver carregar_meses).
+    """
+    itens = AcumuladorItens()
+    arquivos_por_protocolo = defaultdict(list)
+    protocolo_por_conta = {}
+    contas_por_arquivo = defaultdict(set)
+    assinaturas_por_protocolo = defaultdict(list)
+    posicoes_guias = {}
+
+    for estado in estados:
+        itens.estender(estado['itens'], contas=contas)
+        for protocolo, arquivos in estado['arquivos_por_protocolo'].items():
+            arquivos_por_protocolo[protocolo].extend(arquivos)
+        for conta, protocolo in estado['protocolo_por_conta'].items():
+            protocolo_por_conta.setdefault(conta, protocolo)
+        for conta, arquivos in estado['contas_por_arquivo'].items():
+            contas_por_arquivo[conta] |= arquivos
+        for protocolo, assinaturas in estado['assinaturas_por_protocolo'].items():
+            assinaturas_por_protocolo[protocolo].extend(assinaturas)
+        for chave, posicoes in estado['posicoes_guias'].items():
+            posicoes_guias.setdefault(chave, []).extend(posicoes)
+
+    return (itens, arquivos_por_protocolo, protocolo_por_conta, contas_por_arquivo,
+            assinaturas_por_protocolo, posicoes_guias)
+
+
+def assinaturas_por_conta(df_excel_agrupado):
+    """Hash das linhas agrupadas do Excel, somado por conta (independe da ordem)"""
+    if len(df_excel_agrupado) == 0:
+        return {}
+    hashes = pd.util.hash_pandas_object(df_excel_agrupado, index=False)
+    return hashes.groupby(df_excel_agrupado['NR_INTERNO_CONTA'].to_numpy()).sum().to_dict()
+
+
+def contas_alteradas(assinaturas_antigas, assinaturas_novas):
+    """Contas novas, removidas ou com assinatura diferente"""
+    todas = set(assinaturas_antigas) | set(assinaturas_novas)
+    return {conta for conta in todas
+            if assinaturas_antigas.get(conta) != assinaturas_novas.get(conta)}
+
+
+def atualizar_excel(trabalho, estado_excel, pasta_cache):
+    """
+    Relê a exportação do TASY só se o arquivo mudou e retorna (estado do
+    Excel, DataFrame agrupado ou None se não foi relido, contas alteradas,
+    protocolos que entraram ou saíram). O estado tem as contas, protocolos,
+    protocolo de cada conta e assinaturas; o DataFrame agrupado fica à
+    parte, em excel.pkl, e só é carregado quando há contas afetadas.
+    """
+    arquivo_excel = trabalho['arquivo_excel']
+    st = os.stat(arquivo_excel)
+    impressao = (os.path.abspath(arquivo_excel), st.st_size, st.st_mtime_ns)
+    if (estado_excel is not None and estado_excel['impressao'] == impressao
+            and os.path.exists(_arquivo_estado(trabalho, 'excel.pkl'))):
+        print("\n" + "=" * 70)
+        print("ETAPA 2: Arquivo Excel sem alteracao desde a ultima execucao")
+        print("=" * 70)
+        return estado_excel, None, set(), set()
+
+    (df_excel_agrupado, _, protocolos_excel,
+     contas_excel, protocolo_por_conta_excel) = v3.processar_excel(
+        pasta_cache=pasta_cache, arquivo_excel=arquivo_excel, contas_ignorar=trabalho['contas_ignorar'])
+    novo = {
+        'impressao': impressao,
+        'assinaturas': assinaturas_por_conta(df_excel_agrupado),
+        'contas': contas_excel,
+        'protocolos': protocolos_excel,
+        'protocolo_por_conta': protocolo_por_conta_excel,
+    }
+    anterior = estado_excel or {'assinaturas': {}, 'protocolos': set()}
+    gravar_cache(_arquivo_estado(trabalho, 'excel.pkl'), df_excel_agrupado)
+    return (novo, df_excel_agrupado, contas_alteradas(anterior['assinaturas'], novo['assinaturas']),
+            anterior['protocolos'] ^ protocolos_excel)
+
+
+def juntar_aba(salva, nova, coluna, chaves, ordem=None):
+    """Troca, na aba salva, as linhas das chaves afetadas (valores de coluna) pelas recalculadas"""
+    partes = []
+    if salva is not None and len(salva) > 0:
+        partes.append(salva[~salva[coluna].isin(chaves)])
+    if nova is not None and len(nova) > 0:
+        partes.append(nova)
+    partes = [parte for parte in partes if len(parte) > 0]
+    if not partes:
+        modelo = nova if nova is not None else salva
+        return modelo.iloc[0:0] if modelo is not None else pd.DataFrame()
+    aba = pd.concat(partes, ignore_index=True)
+    if ordem is not None:
+        aba = aba.sort_values(ordem, kind='mergesort').reset_index(drop=True)
+    return aba
+
+
+def juntar_abas_meses(indice, nome):
+    """Aba 8, 9 ou 10: as linhas de cada pasta de mês, na ordem das pastas"""
+    abas = [entrada[nome] for entrada in indice['meses'].values()]
+    if not abas:
+        return pd.DataFrame()
+    com_linhas = [aba for aba in abas if len(aba) > 0]
+    return pd.concat(com_linhas, ignore_index=True) if com_linhas else abas[0]
+
+
+def executar(workers=1, usar_cache=True, completo=False, formatos_colunares=None, trabalho=None,
+             pasta_cache=None):
+    """
+    Executa a comparação incremental de trabalho (trabalho_padrao), grava o
+    relatório e o estado para a próxima execução e retorna as abas. O cache
+    de leitura fica em pasta_cache (padrão: PASTA_CACHE de
+    comparar_contas_v3), ou não é usado sem usar_cache.
+    """
+    trabalho = trabalho or trabalho_padrao()
+    pasta_cache = (pasta_cache or v3.PASTA_CACHE) if usar_cache else None
+
+    indice = abas_salvas = None
+    if not completo:
+        indice = ler_cache(_arquivo_estado(trabalho, 'indice.pkl'))
+        if indice is not None and indice.get('configuracao') == configuracao_atual(trabalho):
+            abas_salvas = ler_cache(_arquivo_estado(trabalho, 'abas.pkl'))
+    if abas_salvas is None:
+        # Sem abas salvas não há o que juntar: tudo conta como afetado
+        print("  Sem estado valido: processamento completo")
+        indice = {'configuracao': configuracao_atual(trabalho), 'meses': OrderedDict(), 'excel': None}
+
+    # ETAPA 1: XML, só as pastas de mês alteradas
+    print("=" * 70)
+    print("ETAPA 1: Atualizando dados dos arquivos XML por mes")
+    print("=" * 70)
+    meses = listar_meses(trabalho['pasta_xml'])
+    estados, contas_afetadas, protocolos_afetados, relidos = atualizar_meses(
+        trabalho, indice, meses, workers, pasta_cache)
+    print(f"  Pastas relidas: {len(relidos)} de {len(meses)}")
+
+    # ETAPA 2: Excel, só se a exportação mudou
+    estado_excel, df_excel_agrupado, contas_excel_alteradas, protocolos_excel_alterados = atualizar_excel(
+        trabalho, indice['excel'], pasta_cache)
+    indice['excel'] = estado_excel
+    contas_afetadas |= contas_excel_alteradas
+    protocolos_afetados |= protocolos_excel_alterados
+
+    # ETAPA 3: comparação, só das contas e protocolos afetados
+    print("\n" + "=" * 70)
+    print("ETAPA 3: Comparando dados Excel vs XML (incremental)")
+    print("=" * 70)
+
+    estados_afetados = carregar_meses(trabalho, indice, meses, estados, contas_afetadas, protocolos_afetados,
+                                      workers, pasta_cache)
+    print(f"  Pastas carregadas: {len(estados_afetados)} de {len(meses)}")
+    (itens_xml, arquivos_por_protocolo, protocolo_por_conta_xml, contas_por_arquivo,
+     assinaturas_por_protocolo, posicoes_guias) = juntar_meses(estados_afetados, contas_afetadas)
+
+    contas_xml = set().union(*(entrada['contas'] & contas_afetadas for entrada in indice['meses'].values()))
+    protocolos_xml = set().union(*(entrada['protocolos'] & protocolos_afetados
+                                   for entrada in indice['meses'].values()))
+    protocolos_duplicados = {protocolo: arquivos for protocolo, arquivos in arquivos_por_protocolo.items()
+                             if protocolo in protocolos_afetados and len(set(arquivos)) > 1}
+
+    df_resumo_protocolos = v3.resumir_protocolos(
+        estado_excel['protocolos'] & protocolos_afetados, protocolos_xml, arquivos_por_protocolo,
+        protocolos_duplicados
+    )
+    df_resumo_contas = v3.resumir_contas(
+        estado_excel['contas'] & contas_afetadas, contas_xml, contas_por_arquivo,
+        protocolo_por_conta_xml, estado_excel['protocolo_por_conta']
+    )
+    df_duplicados = v3.comparar_conteudo_duplicados(protocolos_duplicados, assinaturas_por_protocolo)
+
+    if sum(entrada['itens'] for entrada in indice['meses'].values()) == 0:
+        print(f"  AVISO: Nenhum item com cod. prestador {trabalho['codigo_prestador']} encontrado nos XMLs!")
+    abas_novas = (None, None, None, None)
+    if contas_afetadas:
+        if df_excel_agrupado is None:
+            df_excel_agrupado = ler_cache(_arquivo_estado(trabalho, 'excel.pkl'))
+        # Contas sem itens no XML (ex.: de uma pasta removida) vão inteiras
+        # para a aba 5
+        df_dif_qtd, df_dif_preco, df_apenas_excel, df_apenas_xml = v3.comparar_itens(
+            df_excel_agrupado[df_excel_agrupado['NR_INTERNO_CONTA'].isin(contas_afetadas)],
+            itens_xml.para_dataframe(),
+            tolerancia_preco=trabalho['tolerancia_preco']
+        )
+        # As posições das guias só mudam com a pasta de mês, e as contas
+        # dela estão entre as afetadas: o TRECHO_XML das demais linhas vale
+        abas_novas = (v3.anexar_trechos_xml(df_dif_qtd, posicoes_guias),
+                      v3.anexar_trechos_xml(df_dif_preco, posicoes_guias),
+                      df_apenas_excel, df_apenas_xml)
+
+    abas_salvas = abas_salvas or (None,) * len(CHAVES_ABAS)
+    abas = tuple(
+        juntar_aba(salva, nova, coluna, contas_afetadas if coluna == 'NR_INTERNO_CONTA' else protocolos_afetados,
+                   ordem)
+        for salva, nova, (coluna, ordem) in zip(
+            abas_salvas, (df_resumo_protocolos, df_resumo_contas) + abas_novas + (df_duplicados,), CHAVES_ABAS)
+    )
+    (df_resumo_protocolos, df_resumo_contas, df_dif_qtd, df_dif_preco,
+     df_apenas_excel, df_apenas_xml, df_duplicados) = abas
+    df_integridade = juntar_abas_meses(indice, 'integridade')
+    df_totais_guias = juntar_abas_meses(indice, 'totais_guias')
+    df_totais_itens = juntar_abas_meses(indice, 'totais_itens')
+    arquivos_verificados = sum(entrada['arquivos_verificados'] for entrada in indice['meses'].values())
+
+    print(f"  Contas afetadas: {len(contas_afetadas)} de {len(df_resumo_contas)}")
+    print(f"  - Itens com diferenca de quantidade: {len(df_dif_qtd)}")
+    print(f"  - Itens com diferenca de preco (> tolerancia): {len(df_dif_preco)}")
+    print(f"  - Itens apenas no Excel: {len(df_apenas_excel)}")
+    print(f"  - Itens apenas no XML: {len(df_apenas_xml)}")
+    falhas, nome_divergente = v3.contar_integridade(df_integridade)
+    print(f"  - Arquivos com falha de integridade (hash divergente, sem hash ou invalido): "
+          f"{falhas} de {arquivos_verificados}")
+    print(f"  - Arquivos com nome divergente do hash (conteudo integro): {nome_divergente}")
+    print(f"  - Linhas de total de guia divergente: {len(df_totais_guias)}")
+    print(f"  - Itens com valor total divergente: {len(df_totais_itens)}")
+
+    # Estado para a próxima execução
+    gravar_cache(_arquivo_estado(trabalho, 'abas.pkl'), abas)
+    gravar_cache(_arquivo_estado(trabalho, 'indice.pkl'), indice)
+
+    resultados = (df_resumo_protocolos, df_resumo_contas, df_dif_qtd, df_dif_preco,
+                  df_apenas_excel, df_apenas_xml, df_duplicados, df_integridade,
+                  df_totais_guias, df_totais_itens)
+    pasta_saida = os.path.dirname(trabalho['arquivo_saida'])
+    if pasta_saida:
+        os.makedirs(pasta_saida, exist_ok=True)
+    v3.gerar_relatorio(*resultados, formatos_colunares=formatos_colunares, arquivo_saida=trabalho['arquivo_saida'])
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Comparacao incremental: Excel (TASY) vs XML (TISS)')
+    parser.add_argument('--pasta-xml', help='pasta com os XMLs TISS, com as pastas de mes (padrao: PASTA_XML)')
+    parser.add_argument('--excel', help='exportacao de contas do TASY (padrao: ARQUIVO_EXCEL)')
+    parser.add_argument('--saida', help='relatorio xlsx de saida (padrao: ARQUIVO_SAIDA)')
+    parser.add_argument('--pasta-estado', help=f'estado da ultima execucao (padrao: {PASTA_ESTADO})')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processos para leitura dos XMLs (padrao: 1, sem paralelismo)')
+    parser.add_argument('--pasta-cache', help=f'pasta do cache de leitura (padrao: {v3.PASTA_CACHE})')
+    parser.add_argument('--sem-cache', action='store_true',
+                        help='ignora os caches de leitura (XMLs e Excel) e le tudo de novo')
+    parser.add_argument('--completo', action='store_true',
+                        help='descarta o estado salvo e refaz tudo')
+    parser.add_argument('--colunar', nargs='?', const=",".join(FORMATOS_PADRAO), metavar='FORMATOS',
+                        help='grava tambem cada aba em formato colunar ao lado do xlsx '
+                             '(parquet, feather, csv; padrao: parquet,csv)')
+    parser.add_argument('--word', nargs='?', const='', metavar='ARQUIVO_DOCX',
+                        help='gera tambem o relatorio executivo Word na mesma execucao')
+    args = parser.parse_args()
+
+    print("\n" + "=" * 70)
+    print("COMPARACAO DE CONTAS MEDICAS - EXCEL vs XML (INCREMENTAL)")
+    print("=" * 70)
+
+    trabalho = trabalho_padrao(pasta_xml=args.pasta_xml, arquivo_excel=args.excel, arquivo_saida=args.saida,
+                               pasta_estado=args.pasta_estado)
+    resultados = executar(workers=args.workers, usar_cache=not args.sem_cache, completo=args.completo,
+                          formatos_colunares=args.colunar.split(',') if args.colunar else None,
+                          trabalho=trabalho, pasta_cache=args.pasta_cache)
+
+    if args.word is not None:
+        v3.gerar_relatorio_executivo(resultados[0], resultados[1], args.word, df_duplicados=resultados[6])
+
+    print("\n" + "=" * 70)
+    print("PROCESSAMENTO CONCLUIDO!")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,8 @@ import xml.etree.ElementTree as ET
 import warnings
 warnings.filterwarnings('ignore')
 
+from precos import numerar_grupos_com_tolerancia
+
 # Configurações
 PASTA_XML = r"C:\Users\AMH\Desktop\meu-site\xml"
 ARQUIVO_EXCEL = r"C:\Users\AMH\Desktop\meu-site\Unimed conta recalculadas.xlsx"
@@ -125,23 +127,9 @@ def agrupar_com_tolerancia(df, colunas_grupo, tolerancia):
     df = df.sort_values(['NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'PRECO_UNITARIO']).copy()
 
     # Criar grupo baseado em tolerância
-    df['GRUPO_PRECO'] = 0
-    grupo_atual = 0
-    ultimo_preco = None
-    ultima_chave = None
-
-    for idx, row in df.iterrows():
-        chave_atual = f"{row['NR_INTERNO_CONTA']}_{row['ITEM_CD_CONVENIO']}"
-
-        if chave_atual != ultima_chave:
-            grupo_atual += 1
-            ultimo_preco = row['PRECO_UNITARIO']
-        elif abs(row['PRECO_UNITARIO'] - ultimo_preco) > tolerancia:
-            grupo_atual += 1
-            ultimo_preco = row['PRECO_UNITARIO']
-
-        df.at[idx, 'GRUPO_PRECO'] = grupo_atual
-        ultima_chave = chave_atual
+    df['GRUPO_PRECO'] = numerar_grupos_com_tolerancia(
+        df, ['NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO'], tolerancia
+    )
 
     # Agrupar
     resultado = df.groupby(['NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'GRUPO_PRECO'], as_index=False).agg({
@@ -8,142 +8,363 @@ VERSÃO 3:
 """
 
 import os
+import re
+import argparse
+import numpy as np
 import pandas as pd
-from collections import defaultdict
-import xml.etree.ElementTree as ET
+from collections import Counter, defaultdict
+from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import warnings
 warnings.filterwarnings('ignore')
 
-# Configurações
+from leitor_tiss import (TAG_CODIGO_DESPESA, TAG_CODIGO_PRESTADOR, TAG_CONTRATADO_EXECUTANTE, TAG_DESPESA,
+                         TAG_NUMERO_CARTEIRA, TAG_NUMERO_GUIA, TAG_PROCEDIMENTO_EXECUTADO, TAG_SERVICOS_EXECUTADOS,
+                         LeitorTISS, ler_campos_item, ler_valor_total)
+from acumulador_itens import AcumuladorItens
+from cache_xml import (assinatura_extracao, caminho_entrada, entradas_antigas, entradas_por_arquivo, ler_cache,
+                       gravar_cache)
+from leitor_excel import ler_excel_tasy
+from escritor_xlsx import gravar_abas
+from saida_colunar import FORMATOS_PADRAO, gravar_abas_colunares, pasta_padrao
+from precos import (ESCALA_FATOR, ESCALA_QTD, ESCALA_VALOR, arredondar_centavos_com_tolerancia, para_inteiros,
+                    texto_para_inteiro, total_do_item)
+from totais_guias import TotaisGuias
+from instrumentacao import Metricas, medir_chamada, medir_etapa
+
+# Configurações padrão (reconciliar.py recebe outras por linha de comando
+# ou arquivo de configuração)
 PASTA_XML = r"C:\Users\AMH\Desktop\meu-site\xml"
 ARQUIVO_EXCEL = r"C:\Users\AMH\Desktop\meu-site\Unimed conta recalculadas.xlsx"
 ARQUIVO_SAIDA = r"C:\Users\AMH\Desktop\meu-site\Relatorio_Comparacao_v3.xlsx"
+# Relativa à pasta de execução, como no reconciliar.py (--pasta-cache muda)
+PASTA_CACHE = '.cache_xml'
 CODIGO_PRESTADOR_VALIDO = "110020"
 CONTAS_IGNORAR = {74078, 75059, 60282}
 TOLERANCIA_PRECO = 0.01
 
-NS = {'ans': 'http://www.ans.gov.br/padroes/tiss/schemas'}
 
+def processar_procedimento(proc):
+    """
+    Processa um procedimento e retorna
+    (codigo, qtd, valor_unit, valor_total, cod_prestador, reducao), ou None.
+    Quantidade em décimos de milésimo, valores em centavos e reducao (o
+    reducaoAcrescimo, 1.00 quando ausente) em centésimos, como inteiros.
+    """
+    cod_prestador, codigo, qtd_str, valor_unit_str, valor_total_str, reducao_str = ler_campos_item(proc)
 
-def extrair_texto(elemento, xpath):
-    el = elemento.find(xpath, NS)
-    return el.text.strip() if el is not None and el.text else None
-
-
-def arredondar_com_tolerancia(preco):
-    import math
-    return round(math.ceil(preco / 0.02) * 0.02, 2)
-
-
-def processar_procedimento(proc, numero_lote, numero_guia, arquivo_xml):
-    """Processa um procedimento e retorna dict com dados"""
-    cod_prestador = extrair_texto(proc, './/ans:codigoPrestadorNaOperadora')
-
-    codigo = extrair_texto(proc, './/ans:codigoProcedimento')
     if not codigo:
         return None
 
-    qtd_str = extrair_texto(proc, './/ans:quantidadeExecutada')
-    valor_unit_str = extrair_texto(proc, './/ans:valorUnitario')
-    valor_total_str = extrair_texto(proc, './/ans:valorTotal')
-
     if not all([qtd_str, valor_unit_str]):
         return None
 
     try:
-        qtd = float(qtd_str)
-        valor_unit = float(valor_unit_str)
-        valor_total = float(valor_total_str) if valor_total_str else qtd * valor_unit
+        qtd = texto_para_inteiro(qtd_str, ESCALA_QTD)
+        valor_unit = texto_para_inteiro(valor_unit_str, ESCALA_VALOR)
+        reducao = texto_para_inteiro(reducao_str, ESCALA_FATOR) if reducao_str else ESCALA_FATOR
+        valor_total = (texto_para_inteiro(valor_total_str, ESCALA_VALOR) if valor_total_str
+                       else total_do_item(qtd, valor_unit, reducao))
     except:
         return None
 
-    return {
-        'NR_SEQ_PROTOCOLO': numero_lote,
-        'NR_INTERNO_CONTA': numero_guia,
-        'ITEM_CD_CONVENIO': codigo,
-        'QT_ITEM': qtd,
-        'PRECO_UNITARIO': valor_unit,
-        'PRECO_TOTAL': valor_total,
-        'ARQUIVO_XML': arquivo_xml,
-        'COD_PRESTADOR': cod_prestador
-    }
-
-
-def processar_guia(guia, numero_lote, arquivo_xml):
-    """Processa uma guia e retorna: (numero_guia, lista_itens)"""
-    numero_guia = extrair_texto(guia, './/ans:numeroGuiaPrestador')
-    if not numero_guia:
-        return None, []
+    return codigo, qtd, valor_unit, valor_total, cod_prestador, reducao
 
+
+def conta_ignorada(numero_guia, contas_ignorar):
+    """A conta (numeroGuiaPrestador) está em contas_ignorar (comparação numérica)"""
     try:
-        if int(numero_guia) in CONTAS_IGNORAR:
-            return None, []
+        return int(numero_guia) in contas_ignorar
     except:
-        pass
+        return False
 
-    itens = []
 
-    for proc in guia.findall('.//ans:procedimentoExecutado', NS):
-        item = processar_procedimento(proc, numero_lote, numero_guia, arquivo_xml)
-        if item:
-            itens.append(item)
+def ler_valores_guia(guia):
+    """
+    Bloco valorTotal da guia em centavos, na ordem de CAMPOS_VALOR_TOTAL
+    (None nos campos ausentes ou ilegíveis), ou None se a guia não tiver o
+    bloco
+    """
+    textos = ler_valor_total(guia)
+    if textos is None:
+        return None
 
-    for serv in guia.findall('.//ans:servicosExecutados', NS):
-        item = processar_procedimento(serv, numero_lote, numero_guia, arquivo_xml)
-        if item:
-            itens.append(item)
+    valores = []
+    for texto in textos:
+        try:
+            valores.append(texto_para_inteiro(texto, ESCALA_VALOR) if texto else None)
+        except ValueError:
+            valores.append(None)
+    return tuple(valores)
 
-    return numero_guia, itens
 
+def primeiro_texto(elemento, tag):
+    """
+    Texto (sem espaços nas pontas) do primeiro descendente com a tag
+    completa, ou None: o mesmo que find('.//ans:nome', NS), sem o ElementPath
+    """
+    for encontrado in elemento.iter(tag):
+        if encontrado is not elemento:
+            return encontrado.text.strip() if encontrado.text else None
+    return None
+
+
+def processar_guia(guia, numero_lote, arquivo_xml, itens, conteudo_guias=None, posicao=-1):
+    """
+    Processa uma guia, acrescenta seus itens em itens e retorna o numero_guia.
+    Com conteudo_guias, guarda também a forma canônica (entrada_canonica)
+    de cada item em conteudo_guias[numero_guia], para a assinatura da guia.
+    posicao é a
+    posição da guia na lista de guias do arquivo, guardada em cada item.
+
+    Não aplica CONTAS_IGNORAR: a leitura é a mesma para qualquer
+    configuração, e as contas ignoradas são descartadas na consolidação.
+    """
+    numero_guia = primeiro_texto(guia, TAG_NUMERO_GUIA)
+    if not numero_guia:
+        return None
 
-def processar_arquivo_xml(caminho_xml):
+    # Prestador executante da guia, para itens sem código no procedimento
+    # (o primeiro contratadoExecutante/codigoPrestadorNaOperadora)
+    cod_executante = None
+    for contratado in guia.iter(TAG_CONTRATADO_EXECUTANTE):
+        codigo = contratado.find(TAG_CODIGO_PRESTADOR)
+        if codigo is not None:
+            cod_executante = codigo.text.strip() if codigo.text else None
+            break
+
+    conteudo = None
+    if conteudo_guias is not None:
+        conteudo = conteudo_guias.setdefault(numero_guia, [])
+        conteudo.append(entrada_canonica(('executante', cod_executante)))
+
+    # Itens da guia, acrescentados de uma vez no fim
+    itens_guia = []
+    for proc in guia.iter(TAG_PROCEDIMENTO_EXECUTADO):
+        dados = processar_procedimento(proc)
+        if dados:
+            itens_guia.append(dados + (None,))
+            if conteudo is not None:
+                conteudo.append(entrada_canonica(dados))
+
+    # servicosExecutados em qualquer ponto da guia. O codigoDespesa (o campo
+    # do valorTotal da guia em que o item é somado) vem da despesa em que o
+    # serviço está; fora de uma despesa fica None
+    codigos_despesa = {}
+    for despesa in guia.iter(TAG_DESPESA):
+        for serv in despesa.iterfind(TAG_SERVICOS_EXECUTADOS):
+            cd_despesa = despesa.findtext(TAG_CODIGO_DESPESA)
+            codigos_despesa[serv] = cd_despesa.strip() if cd_despesa else None
+    for serv in guia.iter(TAG_SERVICOS_EXECUTADOS):
+        dados = processar_procedimento(serv)
+        if dados:
+            itens_guia.append(dados + (codigos_despesa.get(serv),))
+            if conteudo is not None:
+                conteudo.append(entrada_canonica(dados))
+
+    itens.adicionar_guia(numero_lote, numero_guia, arquivo_xml, cod_executante, itens_guia, guia=posicao)
+    return numero_guia
+
+
+def entrada_canonica(dados):
+    """
+    Forma canônica (texto) de um item da guia, os campos de
+    processar_procedimento separados por '|', ou do executante da guia
+    ('executante|codigo'). Campo ausente fica vazio.
+    """
+    return '|'.join('' if campo is None else str(campo) for campo in dados)
+
+
+def assinar_guias(conteudo_guias):
+    """
+    Assinatura de cada guia: as entradas canônicas dos itens, ordenadas e
+    unidas por quebra de linha. Não depende da ordem dos itens no arquivo e,
+    ao contrário de um hash, permite listar os itens que mudaram entre dois
+    arquivos (comparar_conteudo_duplicados).
+    """
+    return {numero_guia: '\n'.join(sorted(conteudo)) for numero_guia, conteudo in conteudo_guias.items()}
+
+
+def processar_arquivo_xml(caminho_xml, verificar_hash=True):
     """
     Processa um arquivo XML e retorna:
     - numero_lote (protocolo)
     - set de contas encontradas (para resumo)
-    - lista de itens (para análise de preços)
+    - AcumuladorItens com os itens (para análise de preços)
+    - nome do arquivo
+    - assinatura do conteúdo de cada guia {numero_guia: texto}
+      (assinar_guias, para comparar arquivos do mesmo protocolo)
+    - (hash_epilogo, hash_calculado) da conferência do hash TISS, feita na
+      mesma leitura; None sem verificar_hash, (None, None) se o arquivo
+      não pôde ser lido
+    - lista de (numero_guia, numero_carteira, inicio, fim, valores) das
+      guias, na ordem do arquivo, com a posição de cada guia no arquivo em
+      bytes (para o índice e o acesso direto à guia) e o bloco valorTotal
+      da guia em centavos (ler_valores_guia, para a conferência dos totais)
     """
     nome_arquivo = os.path.basename(caminho_xml)
     numero_lote = None
     contas_encontradas = set()
-    itens = []
+    itens = AcumuladorItens()
+    assinaturas = {}
+    hashes = None
+    guias = []
 
     try:
-        tree = ET.parse(caminho_xml)
-        root = tree.getroot()
-
-        numero_lote = extrair_texto(root, './/ans:numeroLote')
-
-        # Processar todas as guias
-        for guia in root.findall('.//ans:guiaSP-SADT', NS):
-            numero_guia, itens_guia = processar_guia(guia, numero_lote, nome_arquivo)
+        # Uma única passada em streaming: cada guia é processada e descartada
+        leitor = LeitorTISS(caminho_xml, verificar_hash=verificar_hash)
+        conteudo_guias = {}
+        for guia in leitor:
+            numero_guia = processar_guia(guia, leitor.numero_lote, nome_arquivo, itens, conteudo_guias,
+                                         posicao=len(guias))
             if numero_guia:
                 contas_encontradas.add(numero_guia)
-                itens.extend(itens_guia)
+                inicio, fim = leitor.posicao_guia or (None, None)
+                guias.append((numero_guia, primeiro_texto(guia, TAG_NUMERO_CARTEIRA), inicio, fim,
+                              ler_valores_guia(guia)))
 
-        for guia in root.findall('.//ans:guiaConsulta', NS):
-            numero_guia, itens_guia = processar_guia(guia, numero_lote, nome_arquivo)
-            if numero_guia:
-                contas_encontradas.add(numero_guia)
-                itens.extend(itens_guia)
-
-        for guia in root.findall('.//ans:guiaResumoInternacao', NS):
-            numero_guia, itens_guia = processar_guia(guia, numero_lote, nome_arquivo)
-            if numero_guia:
-                contas_encontradas.add(numero_guia)
-                itens.extend(itens_guia)
+        numero_lote = leitor.numero_lote
+        assinaturas = assinar_guias(conteudo_guias)
+        if verificar_hash:
+            hashes = (leitor.hash_epilogo, leitor.hash_calculado)
 
     except Exception as e:
         print(f"Erro em {nome_arquivo}: {e}")
+        # Arquivo inválido é descartado por inteiro, como antes
+        numero_lote = None
+        contas_encontradas = set()
+        itens = AcumuladorItens()
+        assinaturas = {}
+        hashes = (None, None) if verificar_hash else None
+        guias = []
 
-    return numero_lote, contas_encontradas, itens, nome_arquivo
+    return numero_lote, contas_encontradas, itens, nome_arquivo, assinaturas, hashes, guias
 
 
-def extrair_dados_xmls():
-    """Extrai dados de todos os arquivos XML"""
-    print("=" * 70)
-    print("ETAPA 1: Extraindo dados dos arquivos XML")
-    print("=" * 70)
+def listar_arquivos_xml(pasta):
+    """Lista os arquivos XML da pasta (recursivo), na ordem do os.walk"""
+    caminhos = []
+    for root_dir, dirs, files in os.walk(pasta):
+        for file in files:
+            if file.endswith('.xml'):
+                caminhos.append(os.path.join(root_dir, file))
+    return caminhos
+
+
+def _processar_em_paralelo(caminhos, workers, verificar_hash=True, metricas=None):
+    """
+    Gera processar_arquivo_xml(caminho) na ordem de caminhos, usando até
+    workers processos. Com metricas, cada arquivo é medido no processo que
+    o leu e registrado em metricas.
+    """
+    if metricas is None:
+        tarefa = partial(processar_arquivo_xml, verificar_hash=verificar_hash)
+    else:
+        tarefa = partial(medir_chamada, processar_arquivo_xml, verificar_hash=verificar_hash)
+
+    if workers <= 1:
+        medidos = map(tarefa, caminhos)
+        executor = None
+    else:
+        # Lotes pequenos por tarefa: os arquivos variam muito de tamanho
+        chunksize = max(1, min(16, len(caminhos) // (workers * 8)))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        medidos = executor.map(tarefa, caminhos, chunksize=chunksize)
+
+    try:
+        if metricas is None:
+            yield from medidos
+            return
+        for caminho, (resultado, *medidas) in zip(caminhos, medidos):
+            metricas.registrar_arquivo(caminho, resultado, *medidas)
+            yield resultado
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def processar_arquivos_xml(caminhos, workers=1, pasta_cache=None, estatisticas=None, verificar_hash=True,
+                           metricas=None):
+    """
+    Gera o resultado de processar_arquivo_xml para cada caminho, na mesma
+    ordem da lista. Com workers > 1 os arquivos são distribuídos entre
+    processos, mas a ordem de entrega é preservada.
+
+    Com pasta_cache, arquivos que já têm entrada válida no cache não são
+    lidos; só os novos ou alterados vão para o parser, e o resultado deles é
+    gravado no cache pelo processo principal. Leituras com e sem
+    verificar_hash têm entradas de cache separadas; cada XML fica com uma só
+    entrada, a da última leitura.
+
+    Com metricas (instrumentacao.Metricas), o tempo, a CPU e o RSS de cada
+    arquivo, lido ou carregado do cache, ficam registrados nela.
+    """
+    if not pasta_cache:
+        yield from _processar_em_paralelo(caminhos, workers, verificar_hash, metricas)
+        return
+
+    assinatura = assinatura_extracao(verificar_hash)
+    existentes = entradas_por_arquivo(pasta_cache)
+    entradas = [caminho_entrada(pasta_cache, caminho, assinatura) for caminho in caminhos]
+    em_cache = [os.path.exists(entrada) for entrada in entradas]
+    pendentes = [caminho for caminho, ok in zip(caminhos, em_cache) if not ok]
+    novos = _processar_em_paralelo(pendentes, workers, verificar_hash, metricas)
+
+    for caminho, entrada, ok in zip(caminhos, entradas, em_cache):
+        if ok:
+            if metricas is None:
+                resultado = ler_cache(entrada)
+            else:
+                resultado, *medidas = medir_chamada(ler_cache, entrada)
+                if resultado is not None:
+                    metricas.registrar_arquivo(caminho, resultado, *medidas, origem='cache')
+            if resultado is None:
+                # Entrada ilegível: lê o XML de novo neste processo
+                resultado = processar_arquivo_xml(caminho, verificar_hash)
+                gravar_cache(entrada, resultado, entradas_antigas(existentes, entrada))
+            elif estatisticas is not None:
+                estatisticas['cache'] = estatisticas.get('cache', 0) + 1
+        else:
+            resultado = next(novos)
+            # Arquivo com erro de leitura não vai para o cache, para ser reportado de novo
+            if resultado[0] is not None:
+                gravar_cache(entrada, resultado, entradas_antigas(existentes, entrada))
+        yield resultado
+
+
+def consolidar_arquivos_xml(resultados, estatisticas=None, cod_prestador=None, contas_ignorar=None,
+                            usar_executante=False, todas_assinaturas=False):
+    """
+    Junta os resultados de processar_arquivo_xml (na ordem recebida) nas
+    estruturas usadas pela comparação e retorna:
+    (itens, protocolos, contas, arquivos_por_protocolo,
+     protocolos_duplicados, protocolo_por_conta, contas_por_arquivo,
+     assinaturas_por_protocolo, hashes_por_arquivo, posicoes_guias,
+     totais_guias)
+
+    assinaturas_por_protocolo[protocolo] é a lista de (arquivo,
+    {numero_guia: assinatura}) dos arquivos desse protocolo, só para os
+    protocolos duplicados (os únicos comparados na aba 7), ou para todos com
+    todas_assinaturas (para juntar depois com outros resultados).
+    hashes_por_arquivo é a lista de (arquivo, protocolo, hash_epilogo,
+    hash_calculado) dos arquivos lidos com verificação de hash.
+    posicoes_guias[(arquivo, numero_guia)] é a lista dos (inicio, fim), em
+    bytes, das guias com esse número no arquivo, na ordem do arquivo. totais_guias (TotaisGuias) tem as guias e os itens
+    (de todos os prestadores) de todos os arquivos, conferidos de uma vez
+    em totais_guias.conferir().
+
+    Só os itens de cod_prestador entram na análise de preços, e as contas
+    de contas_ignorar ficam de fora de tudo (padrão: CODIGO_PRESTADOR_VALIDO
+    e CONTAS_IGNORAR). Com usar_executante, itens sem código no
+    procedimento contam como do prestador executante da guia. Os mesmos
+    resultados podem ser consolidados várias vezes, com configurações
+    diferentes.
+    """
+    if cod_prestador is None:
+        cod_prestador = CODIGO_PRESTADOR_VALIDO
+    if contas_ignorar is None:
+        contas_ignorar = CONTAS_IGNORAR
 
     # Para resumo (todas as contas/protocolos, independente do código do prestador)
     protocolos_xml = set()
@@ -151,80 +372,172 @@ def extrair_dados_xmls():
     arquivos_por_protocolo = defaultdict(list)
     protocolo_por_conta = {}
     contas_por_arquivo = defaultdict(set)
+    assinaturas_por_protocolo = defaultdict(list)
+    hashes_por_arquivo = []
+    posicoes_guias = {}
 
     # Para análise de preços (apenas itens com código do prestador válido)
-    todos_itens = []
+    todos_itens = AcumuladorItens()
+    totais_guias = TotaisGuias()
 
     arquivos_processados = 0
 
-    for root_dir, dirs, files in os.walk(PASTA_XML):
-        for file in files:
-            if file.endswith('.xml'):
-                caminho = os.path.join(root_dir, file)
-                numero_lote, contas_encontradas, itens, nome_arquivo = processar_arquivo_xml(caminho)
-
-                # Registrar protocolo e contas (para resumo - TODAS)
-                if numero_lote:
-                    protocolos_xml.add(numero_lote)
-                    arquivos_por_protocolo[numero_lote].append(nome_arquivo)
-
-                for conta in contas_encontradas:
-                    contas_xml.add(conta)
-                    contas_por_arquivo[conta].add(nome_arquivo)
-                    if conta not in protocolo_por_conta:
-                        protocolo_por_conta[conta] = numero_lote
-
-                # Filtrar itens pelo código do prestador (para análise de preços)
-                for item in itens:
-                    if item.get('COD_PRESTADOR') == CODIGO_PRESTADOR_VALIDO:
-                        todos_itens.append(item)
-
-                arquivos_processados += 1
-                if arquivos_processados % 200 == 0:
-                    print(f"  Processados {arquivos_processados} arquivos...")
+    # A ordem dos resultados define o primeiro protocolo visto de cada conta
+    for numero_lote, contas_encontradas, itens, nome_arquivo, assinaturas, hashes, guias in resultados:
+        if hashes is not None:
+            hashes_por_arquivo.append((nome_arquivo, numero_lote) + tuple(hashes))
+
+        ignoradas = {conta for conta in contas_encontradas if conta_ignorada(conta, contas_ignorar)}
+
+        # Registrar protocolo e contas (para resumo - TODAS)
+        if numero_lote:
+            protocolos_xml.add(numero_lote)
+            arquivos_por_protocolo[numero_lote].append(nome_arquivo)
+            assinaturas_por_protocolo[numero_lote].append((
+                nome_arquivo,
+                {conta: assinatura for conta, assinatura in assinaturas.items() if conta not in ignoradas}
+            ))
+
+        for conta in contas_encontradas:
+            if conta in ignoradas:
+                continue
+            contas_xml.add(conta)
+            contas_por_arquivo[conta].add(nome_arquivo)
+            if conta not in protocolo_por_conta:
+                protocolo_por_conta[conta] = numero_lote
+
+        for numero_guia, _, inicio, fim, _ in guias:
+            if inicio is not None and numero_guia not in ignoradas:
+                posicoes_guias.setdefault((nome_arquivo, numero_guia), []).append((inicio, fim))
+
+        # Filtrar itens pelo código do prestador (para análise de preços)
+        todos_itens.estender(itens, cod_prestador=cod_prestador, excluir_contas=ignoradas,
+                             usar_executante=usar_executante)
+        totais_guias.adicionar(numero_lote, nome_arquivo, itens, guias, excluir_contas=ignoradas)
+
+        arquivos_processados += 1
+        if arquivos_processados % 200 == 0:
+            print(f"  Processados {arquivos_processados} arquivos...")
 
     print(f"\n  Total de arquivos XML processados: {arquivos_processados}")
+    if estatisticas is not None:
+        print(f"  Lidos do cache: {estatisticas.get('cache', 0)}")
     print(f"  Protocolos encontrados (para resumo): {len(protocolos_xml)}")
     print(f"  Contas encontradas (para resumo): {len(contas_xml)}")
-    print(f"  Itens com cod. prestador 110020 (para analise): {len(todos_itens)}")
+    print(f"  Itens com cod. prestador {cod_prestador} (para analise): {len(todos_itens)}")
 
     protocolos_duplicados = {p: arquivos for p, arquivos in arquivos_por_protocolo.items()
                             if len(set(arquivos)) > 1}
+    if not todas_assinaturas:
+        assinaturas_por_protocolo = {p: assinaturas_por_protocolo[p] for p in protocolos_duplicados}
 
     return (todos_itens, protocolos_xml, contas_xml, arquivos_por_protocolo,
-            protocolos_duplicados, protocolo_por_conta, contas_por_arquivo)
+            protocolos_duplicados, protocolo_por_conta, contas_por_arquivo,
+            assinaturas_por_protocolo, hashes_por_arquivo, posicoes_guias, totais_guias)
+
+
+def resumir_prestadores(resultados, contas_ignorar=None):
+    """
+    Contagens por código de prestador, a partir dos resultados já lidos
+    (sem reler os XMLs): itens, contas, protocolos, arquivos e valor total.
+
+    COD_PRESTADOR é o código do procedimento; ITENS_SO_NA_GUIA conta os
+    itens sem código no procedimento cujo executante da guia é esse
+    prestador (os que entram com usar_executante).
+    """
+    if contas_ignorar is None:
+        contas_ignorar = CONTAS_IGNORAR
+
+    todos_itens = AcumuladorItens()
+    for _, contas_encontradas, itens, _, _, _, _ in resultados:
+        ignoradas = {conta for conta in contas_encontradas if conta_ignorada(conta, contas_ignorar)}
+        todos_itens.estender(itens, excluir_contas=ignoradas)
+
+    df = todos_itens.para_dataframe()
+    colunas = ['COD_PRESTADOR', 'ITENS', 'ITENS_SO_NA_GUIA', 'CONTAS', 'PROTOCOLOS', 'ARQUIVOS', 'VALOR_TOTAL']
+    if len(df) == 0:
+        return pd.DataFrame(columns=colunas)
+
+    so_na_guia = df['COD_PRESTADOR'].isna()
+    df['PRESTADOR'] = df['COD_PRESTADOR'].astype(object).where(~so_na_guia, df['COD_EXECUTANTE'].astype(object))
+    df['SO_NA_GUIA'] = so_na_guia
+
+    # Itens sem código nem no procedimento nem na guia ficam numa linha sem código
+    resumo = df.groupby('PRESTADOR', dropna=False).agg(
+        ITENS=('QT_ITEM', 'size'),
+        ITENS_SO_NA_GUIA=('SO_NA_GUIA', 'sum'),
+        CONTAS=('NR_INTERNO_CONTA', 'nunique'),
+        PROTOCOLOS=('NR_SEQ_PROTOCOLO', 'nunique'),
+        ARQUIVOS=('ARQUIVO_XML', 'nunique'),
+        VALOR_TOTAL=('PRECO_TOTAL', 'sum'),
+    )
+    resumo['VALOR_TOTAL'] = resumo['VALOR_TOTAL'] / ESCALA_VALOR
+    resumo = resumo.rename_axis('COD_PRESTADOR').reset_index()
+    return resumo.sort_values(['ITENS', 'COD_PRESTADOR'], ascending=[False, True], ignore_index=True)[colunas]
+
+
+def extrair_dados_xmls(workers=1, pasta_cache=None, pasta_xml=None, verificar_hash=True, metricas=None):
+    """
+    Extrai dados de todos os arquivos XML de pasta_xml (padrão: PASTA_XML),
+    conferindo o hash TISS de cada arquivo na mesma leitura (verificar_hash).
+    Com metricas, registra as medidas de cada arquivo.
+    """
+    print("=" * 70)
+    print("ETAPA 1: Extraindo dados dos arquivos XML")
+    print("=" * 70)
+
+    estatisticas = {} if pasta_cache else None
+
+    caminhos = listar_arquivos_xml(pasta_xml or PASTA_XML)
+    if workers > 1:
+        print(f"  Usando {workers} processos")
+
+    # A consolidação é feita neste processo, sempre na ordem de caminhos,
+    # para que o resultado seja igual ao serial
+    resultados = processar_arquivos_xml(caminhos, workers, pasta_cache, estatisticas, verificar_hash, metricas)
+    return consolidar_arquivos_xml(resultados, estatisticas)
+
 
+def processar_excel(pasta_cache=None, arquivo_excel=None, contas_ignorar=None):
+    """Processa o arquivo Excel (padrão: ARQUIVO_EXCEL, sem as CONTAS_IGNORAR)"""
+    if contas_ignorar is None:
+        contas_ignorar = CONTAS_IGNORAR
 
-def processar_excel():
-    """Processa o arquivo Excel"""
     print("\n" + "=" * 70)
     print("ETAPA 2: Processando arquivo Excel")
     print("=" * 70)
 
-    df = pd.read_excel(ARQUIVO_EXCEL)
+    df, veio_do_cache = ler_excel_tasy(arquivo_excel or ARQUIVO_EXCEL, pasta_cache)
+    if veio_do_cache:
+        print("  Planilha carregada do cache colunar")
     print(f"  Linhas no Excel: {len(df)}")
 
-    df = df[~df['NR_INTERNO_CONTA'].isin(CONTAS_IGNORAR)]
+    # As contas já vêm como texto da leitura
+    df = df[~df['NR_INTERNO_CONTA'].isin({str(conta) for conta in contas_ignorar})]
     print(f"  Linhas apos filtrar contas ignoradas: {len(df)}")
 
     df['NR_SEQ_PROTOCOLO'] = df['NR_SEQ_PROTOCOLO'].astype(str)
     df['NR_INTERNO_CONTA'] = df['NR_INTERNO_CONTA'].astype(str)
     df['ITEM_CD_CONVENIO'] = df['ITEM_CD_CONVENIO'].astype(str)
-    df['QT_ITEM'] = pd.to_numeric(df['QT_ITEM'], errors='coerce').fillna(0)
-    df['PRECO_UNITARIO'] = pd.to_numeric(df['PRECO_UNITARIO'], errors='coerce').fillna(0)
-    df['PRECO_TOTAL'] = pd.to_numeric(df['PRECO_TOTAL'], errors='coerce').fillna(0)
+    # Quantidade e valores como inteiros de ponto fixo (ver precos.py)
+    df['QT_ITEM'] = para_inteiros(pd.to_numeric(df['QT_ITEM'], errors='coerce').fillna(0), ESCALA_QTD)
+    df['PRECO_UNITARIO'] = para_inteiros(pd.to_numeric(df['PRECO_UNITARIO'], errors='coerce').fillna(0),
+                                         ESCALA_VALOR)
+    df['PRECO_TOTAL'] = para_inteiros(pd.to_numeric(df['PRECO_TOTAL'], errors='coerce').fillna(0), ESCALA_VALOR)
 
-    df['PRECO_TOLERANCIA'] = df['PRECO_UNITARIO'].apply(arredondar_com_tolerancia)
+    df['PRECO_TOLERANCIA'] = arredondar_centavos_com_tolerancia(df['PRECO_UNITARIO'])
 
+    # O preço médio fica como soma e contagem, para a comparação exata
     df_agrupado = df.groupby(
         ['NR_SEQ_PROTOCOLO', 'NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'PRECO_TOLERANCIA'],
         as_index=False
-    ).agg({
-        'QT_ITEM': 'sum',
-        'PRECO_TOTAL': 'sum',
-        'PRECO_UNITARIO': 'mean',
-        'DS_ITEM': 'first'
-    })
+    ).agg(
+        QT_ITEM=('QT_ITEM', 'sum'),
+        PRECO_TOTAL=('PRECO_TOTAL', 'sum'),
+        SOMA_PRECO_UNITARIO=('PRECO_UNITARIO', 'sum'),
+        N_PRECO_UNITARIO=('PRECO_UNITARIO', 'size'),
+        DS_ITEM=('DS_ITEM', 'first'),
+    )
 
     print(f"  Linhas apos agrupamento: {len(df_agrupado)}")
 
@@ -238,19 +551,24 @@ def processar_excel():
     return df_agrupado, df, protocolos_excel, contas_excel, protocolo_por_conta_excel
 
 
-def comparar_dados(df_excel, itens_xml, protocolos_excel, protocolos_xml,
-                   contas_excel, contas_xml, arquivos_por_protocolo,
-                   protocolos_duplicados, protocolo_por_conta_xml,
-                   protocolo_por_conta_excel, contas_por_arquivo):
-    """Compara dados do Excel com XML"""
-    print("\n" + "=" * 70)
-    print("ETAPA 3: Comparando dados Excel vs XML")
-    print("=" * 70)
+def codificar_chaves(df_a, df_b, colunas):
+    """
+    Converte as colunas de chave dos dois DataFrames em um único código
+    int64 por linha, no mesmo espaço de códigos para os dois lados.
+
+    Os códigos seguem a ordem lexicográfica das chaves, então ordenar pelo
+    código dá a mesma ordem que ordenar pelas colunas.
+    """
+    chaves = pd.concat([df_a[colunas], df_b[colunas]], ignore_index=True)
+    codigos = chaves.groupby(colunas, sort=True, dropna=False).ngroup().to_numpy(dtype=np.int64)
+    return codigos[:len(df_a)], codigos[len(df_a):]
 
+
+def resumir_protocolos(protocolos_excel, protocolos_xml, arquivos_por_protocolo, protocolos_duplicados):
+    """Monta a aba 1 (resumo de protocolos)"""
     # =====================================================
     # ABA 1: Resumo de Protocolos
     # =====================================================
-    print("\n  Analisando protocolos...")
     resumo_protocolos = []
     todos_protocolos = protocolos_excel | protocolos_xml
 
@@ -272,12 +590,15 @@ def comparar_dados(df_excel, itens_xml, protocolos_excel, protocolos_xml,
                       'APENAS XML'
         })
 
-    df_resumo_protocolos = pd.DataFrame(resumo_protocolos)
+    return pd.DataFrame(resumo_protocolos)
+
 
+def resumir_contas(contas_excel, contas_xml, contas_por_arquivo,
+                   protocolo_por_conta_xml, protocolo_por_conta_excel):
+    """Monta a aba 2 (resumo de contas)"""
     # =====================================================
     # ABA 2: Resumo de Contas
     # =====================================================
-    print("  Analisando contas...")
     resumo_contas = []
     todas_contas = contas_excel | contas_xml
 
@@ -302,97 +623,489 @@ def comparar_dados(df_excel, itens_xml, protocolos_excel, protocolos_xml,
                       'APENAS XML'
         })
 
-    df_resumo_contas = pd.DataFrame(resumo_contas)
+    return pd.DataFrame(resumo_contas)
 
-    # =====================================================
-    # ABAS 3-6: Análise de preços/quantidades
-    # (usando apenas itens com código do prestador 110020)
-    # =====================================================
-    print("  Comparando itens (cod. prestador 110020)...")
 
-    df_xml = pd.DataFrame(itens_xml)
+COLUNAS_DUPLICADOS = [
+    'NR_SEQ_PROTOCOLO', 'ARQUIVOS_XML', 'CONTEUDO', 'GUIAS',
+    'GUIAS_IGUAIS', 'GUIAS_DIVERGENTES', 'GUIAS_AUSENTES', 'DETALHE'
+]
 
-    if len(df_xml) == 0:
-        print("  AVISO: Nenhum item com cod. prestador 110020 encontrado nos XMLs!")
-        df_dif_qtd = pd.DataFrame()
-        df_dif_preco = pd.DataFrame()
-        df_apenas_excel = df_excel.copy()
-        df_apenas_xml = pd.DataFrame()
-    else:
-        df_xml['NR_SEQ_PROTOCOLO'] = df_xml['NR_SEQ_PROTOCOLO'].astype(str)
-        df_xml['NR_INTERNO_CONTA'] = df_xml['NR_INTERNO_CONTA'].astype(str)
-        df_xml['ITEM_CD_CONVENIO'] = df_xml['ITEM_CD_CONVENIO'].astype(str)
-        df_xml['PRECO_TOLERANCIA'] = df_xml['PRECO_UNITARIO'].apply(arredondar_com_tolerancia)
-
-        df_xml_agrupado = df_xml.groupby(
-            ['NR_SEQ_PROTOCOLO', 'NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'PRECO_TOLERANCIA'],
-            as_index=False
-        ).agg({
-            'QT_ITEM': 'sum',
-            'PRECO_TOTAL': 'sum',
-            'PRECO_UNITARIO': 'mean',
-            'ARQUIVO_XML': lambda x: ', '.join(set(x))
+
+# Itens listados por arquivo no DETALHE de uma guia divergente (a célula do
+# Excel comporta 32767 caracteres)
+LIMITE_ITENS_DETALHE = 10
+
+
+def descrever_entrada(entrada):
+    """Texto legível de uma entrada_canonica: 'codigo qtd x unitario = total'"""
+    campos = entrada.rsplit('|', 5)
+    if len(campos) == 2:
+        return f"executante {campos[1] or '(sem codigo)'}"
+    codigo, qtd, valor_unit, valor_total, cod_prestador, reducao = campos
+    texto = (f"{codigo} {Decimal(qtd).scaleb(-4).normalize():f} x {Decimal(valor_unit).scaleb(-2)}"
+             f" = {Decimal(valor_total).scaleb(-2)}")
+    if int(reducao) != ESCALA_FATOR:
+        texto += f" (fator {Decimal(reducao).scaleb(-2)})"
+    if cod_prestador:
+        texto += f" [prestador {cod_prestador}]"
+    return texto
+
+
+def diferencas_itens(referencia, outra):
+    """
+    Itens acrescentados ('+item') e removidos ('-item') em outra em relação
+    a referencia (assinaturas de assinar_guias), até LIMITE_ITENS_DETALHE
+    """
+    antes = Counter(referencia.split('\n'))
+    depois = Counter(outra.split('\n'))
+    mudancas = ([f"+{descrever_entrada(e)}" for e in sorted((depois - antes).elements())] +
+                [f"-{descrever_entrada(e)}" for e in sorted((antes - depois).elements())])
+    if len(mudancas) > LIMITE_ITENS_DETALHE:
+        restantes = len(mudancas) - LIMITE_ITENS_DETALHE
+        mudancas = mudancas[:LIMITE_ITENS_DETALHE] + [f"... mais {restantes}"]
+    return ', '.join(mudancas)
+
+
+def comparar_conteudo_duplicados(protocolos_duplicados, assinaturas_por_protocolo):
+    """
+    ABA 7: compara, guia a guia, o conteúdo dos arquivos de cada protocolo
+    duplicado usando as assinaturas gravadas na leitura (sem reler os XMLs).
+
+    CONTEUDO é IDENTICO quando todos os arquivos têm as mesmas guias com os
+    mesmos itens (reenvio), senão DIVERGENTE; DETALHE lista as guias que
+    faltam em algum arquivo e, nas que diferem, os itens acrescentados (+)
+    e removidos (-) em cada arquivo em relação ao primeiro que tem a guia.
+    """
+    linhas = []
+    for protocolo in sorted(protocolos_duplicados):
+        arquivos = assinaturas_por_protocolo.get(protocolo, [])
+        guias = sorted(set().union(*(assinaturas for _, assinaturas in arquivos)))
+
+        iguais = divergentes = ausentes = 0
+        detalhe = []
+        for guia in guias:
+            presentes = [(nome, assinaturas[guia]) for nome, assinaturas in arquivos if guia in assinaturas]
+            if len(presentes) < len(arquivos):
+                ausentes += 1
+                detalhe.append(f"{guia}: so em {', '.join(nome for nome, _ in presentes)}")
+            elif len({assinatura for _, assinatura in presentes}) > 1:
+                divergentes += 1
+                primeiro, referencia = presentes[0]
+                for nome, assinatura in presentes[1:]:
+                    if assinatura != referencia:
+                        detalhe.append(f"{guia}: {nome} em relacao a {primeiro}: "
+                                       f"{diferencas_itens(referencia, assinatura)}")
+            else:
+                iguais += 1
+
+        linhas.append({
+            'NR_SEQ_PROTOCOLO': protocolo,
+            'ARQUIVOS_XML': ', '.join(nome for nome, _ in arquivos),
+            'CONTEUDO': 'IDENTICO' if not (divergentes or ausentes) else 'DIVERGENTE',
+            'GUIAS': len(guias),
+            'GUIAS_IGUAIS': iguais,
+            'GUIAS_DIVERGENTES': divergentes,
+            'GUIAS_AUSENTES': ausentes,
+            'DETALHE': '; '.join(detalhe),
         })
 
-        print(f"  Itens agrupados no XML: {len(df_xml_agrupado)}")
+    return pd.DataFrame(linhas, columns=COLUNAS_DUPLICADOS)
 
-        # Chaves de comparação
-        df_excel['CHAVE'] = (df_excel['NR_INTERNO_CONTA'] + '_' +
-                             df_excel['ITEM_CD_CONVENIO'] + '_' +
-                             df_excel['PRECO_TOLERANCIA'].astype(str))
 
-        df_xml_agrupado['CHAVE'] = (df_xml_agrupado['NR_INTERNO_CONTA'] + '_' +
-                                     df_xml_agrupado['ITEM_CD_CONVENIO'] + '_' +
-                                     df_xml_agrupado['PRECO_TOLERANCIA'].astype(str))
+COLUNAS_INTEGRIDADE = [
+    'ARQUIVO_XML', 'NR_SEQ_PROTOCOLO', 'STATUS', 'HASH_EPILOGO', 'HASH_CALCULADO', 'HASH_NOME_ARQUIVO'
+]
+# Conteúdo íntegro, só o nome do arquivo diverge: não é falha de integridade
+STATUS_NOME_DIVERGENTE = 'NOME DIVERGENTE'
 
-        # Merge para comparação
-        df_comparacao = pd.merge(
-            df_excel,
-            df_xml_agrupado,
-            on=['NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'PRECO_TOLERANCIA'],
-            how='outer',
-            suffixes=('_EXCEL', '_XML')
-        )
 
-        # ABA 3: Diferença de quantidade
-        df_dif_qtd = df_comparacao[
-            (df_comparacao['QT_ITEM_EXCEL'].notna()) &
-            (df_comparacao['QT_ITEM_XML'].notna()) &
-            (abs(df_comparacao['QT_ITEM_EXCEL'] - df_comparacao['QT_ITEM_XML']) > 0.001)
-        ].copy()
-
-        if len(df_dif_qtd) > 0:
-            df_dif_qtd['DIFERENCA_QTD'] = df_dif_qtd['QT_ITEM_EXCEL'] - df_dif_qtd['QT_ITEM_XML']
-            df_dif_qtd = df_dif_qtd[[
-                'NR_SEQ_PROTOCOLO_EXCEL', 'NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'DS_ITEM',
-                'QT_ITEM_EXCEL', 'QT_ITEM_XML', 'DIFERENCA_QTD',
-                'PRECO_UNITARIO_EXCEL', 'PRECO_UNITARIO_XML', 'ARQUIVO_XML'
-            ]].rename(columns={'NR_SEQ_PROTOCOLO_EXCEL': 'NR_SEQ_PROTOCOLO'})
-
-        # ABA 4: Diferença de preço (> 1 centavo)
-        df_dif_preco = df_comparacao[
-            (df_comparacao['PRECO_UNITARIO_EXCEL'].notna()) &
-            (df_comparacao['PRECO_UNITARIO_XML'].notna()) &
-            (abs(df_comparacao['PRECO_UNITARIO_EXCEL'] - df_comparacao['PRECO_UNITARIO_XML']) > TOLERANCIA_PRECO)
-        ].copy()
-
-        if len(df_dif_preco) > 0:
-            df_dif_preco['DIFERENCA_PRECO'] = df_dif_preco['PRECO_UNITARIO_EXCEL'] - df_dif_preco['PRECO_UNITARIO_XML']
-            df_dif_preco = df_dif_preco[[
-                'NR_SEQ_PROTOCOLO_EXCEL', 'NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'DS_ITEM',
-                'PRECO_UNITARIO_EXCEL', 'PRECO_UNITARIO_XML', 'DIFERENCA_PRECO',
-                'QT_ITEM_EXCEL', 'QT_ITEM_XML', 'ARQUIVO_XML'
-            ]].rename(columns={'NR_SEQ_PROTOCOLO_EXCEL': 'NR_SEQ_PROTOCOLO'})
-
-        # ABA 5: Itens apenas no Excel
-        chaves_xml = set(df_xml_agrupado['CHAVE'])
-        df_apenas_excel = df_excel[~df_excel['CHAVE'].isin(chaves_xml)].copy()
-        df_apenas_excel = df_apenas_excel.drop(columns=['CHAVE', 'PRECO_TOLERANCIA'])
-
-        # ABA 6: Itens apenas no XML
-        chaves_excel = set(df_excel['CHAVE'])
-        df_apenas_xml = df_xml_agrupado[~df_xml_agrupado['CHAVE'].isin(chaves_excel)].copy()
-        df_apenas_xml = df_apenas_xml.drop(columns=['CHAVE', 'PRECO_TOLERANCIA'])
+def hash_do_nome(nome_arquivo):
+    """Hash repetido no nome do arquivo TISS (ex.: 305763_61487cf....xml), ou None"""
+    encontrado = re.search(r'_([0-9A-Fa-f]{32})\.xml$', nome_arquivo, re.IGNORECASE)
+    return encontrado.group(1) if encontrado else None
+
+
+def verificar_integridade(hashes_por_arquivo):
+    """
+    ABA 8: arquivos cujo hash TISS não confere. STATUS é:
+    - ARQUIVO INVALIDO: o XML não pôde ser lido
+    - SEM HASH: o arquivo não tem epilogo/hash
+    - HASH DIVERGENTE: o conteúdo não bate com o hash do epílogo
+      (arquivo corrompido ou editado sem recalcular o hash)
+    - NOME DIVERGENTE: o epílogo confere, mas o nome do arquivo traz outro
+      hash (arquivo regerado depois de nomeado); o conteúdo está íntegro,
+      e esses arquivos são contados à parte (contar_integridade)
+    Arquivos sem divergência não entram na aba.
+    """
+    linhas = []
+    for nome_arquivo, protocolo, hash_epilogo, hash_calculado in hashes_por_arquivo:
+        hash_nome = hash_do_nome(nome_arquivo)
+        if hash_calculado is None:
+            status = 'ARQUIVO INVALIDO'
+        elif not hash_epilogo:
+            status = 'SEM HASH'
+        elif hash_epilogo.lower() != hash_calculado:
+            status = 'HASH DIVERGENTE'
+        elif hash_nome is not None and hash_nome.lower() != hash_calculado:
+            status = STATUS_NOME_DIVERGENTE
+        else:
+            continue
+        linhas.append({
+            'ARQUIVO_XML': nome_arquivo,
+            'NR_SEQ_PROTOCOLO': protocolo,
+            'STATUS': status,
+            'HASH_EPILOGO': hash_epilogo,
+            'HASH_CALCULADO': hash_calculado,
+            'HASH_NOME_ARQUIVO': hash_nome,
+        })
+
+    return pd.DataFrame(linhas, columns=COLUNAS_INTEGRIDADE)
+
+
+def contar_integridade(df_integridade):
+    """
+    (arquivos com falha de integridade, arquivos só com o nome divergente)
+    da aba 8: falha é HASH DIVERGENTE, SEM HASH ou ARQUIVO INVALIDO
+    """
+    nome_divergente = int((df_integridade['STATUS'] == STATUS_NOME_DIVERGENTE).sum())
+    return len(df_integridade) - nome_divergente, nome_divergente
+
+
+def anexar_trechos_xml(df, posicoes_guias):
+    """
+    Acrescenta a coluna TRECHO_XML às abas 3 e 4: para cada arquivo de
+    ARQUIVO_XML, 'arquivo@inicio-fim' de cada guia da conta nesse arquivo
+    (a conta pode ter mais de uma guia no lote). O trecho é aberto com
+    'python indice_xml.py trecho ...' (ou leitor_tiss.formatar_guia), sem
+    ler o lote inteiro.
+    """
+    if df is None or len(df) == 0:
+        return df
+
+    trechos = []
+    for arquivos, conta in zip(df['ARQUIVO_XML'].astype(str), df['NR_INTERNO_CONTA'].astype(str)):
+        partes = []
+        for arquivo in arquivos.split(', '):
+            for inicio, fim in posicoes_guias.get((arquivo, conta), ()):
+                partes.append(f"{arquivo}@{inicio}-{fim}")
+        trechos.append(', '.join(partes))
+    return df.assign(TRECHO_XML=trechos)
+
+
+def valores_em_reais(df):
+    """
+    Converte as colunas inteiras de quantidade (décimos de milésimo) e de
+    valor (centavos) para quantidade decimal e reais, para as abas. A soma
+    e a contagem dos preços unitários viram a média PRECO_UNITARIO, na
+    posição da soma. Aceita as colunas com sufixo _EXCEL/_XML do merge.
+    """
+    df = df.copy()
+    renomear = {}
+    for coluna in df.columns:
+        sufixo = next((sufixo for sufixo in ('_EXCEL', '_XML') if coluna.endswith(sufixo)), '')
+        base = coluna[:len(coluna) - len(sufixo)]
+        if base in ('QT_ITEM', 'DIFERENCA_QTD'):
+            df[coluna] = df[coluna] / ESCALA_QTD
+        elif base in ('PRECO_TOTAL', 'PRECO_TOLERANCIA'):
+            df[coluna] = df[coluna] / ESCALA_VALOR
+        elif base == 'SOMA_PRECO_UNITARIO':
+            df[coluna] = df[coluna] / df[f'N_PRECO_UNITARIO{sufixo}'] / ESCALA_VALOR
+            renomear[coluna] = f'PRECO_UNITARIO{sufixo}'
+    contagens = [coluna for coluna in df.columns if coluna.startswith('N_PRECO_UNITARIO')]
+    return df.drop(columns=contagens).rename(columns=renomear)
+
+
+# Chave dos itens agrupados: protocolo, conta, item e faixa de preço
+CHAVES_ITENS = ['NR_SEQ_PROTOCOLO', 'NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'PRECO_TOLERANCIA']
+# Texto de uma chave ausente (ex.: arquivo sem numeroLote). Como no str(None)
+# da primeira versão, esses itens ficam no grupo 'None' em vez de sumir.
+CHAVE_AUSENTE = 'None'
+
+
+def agrupar_itens_xml(df_xml, com_arquivos=True):
+    """
+    Agrupa os itens do XML como os do Excel: por protocolo, conta, item e
+    faixa de preço (PRECO_TOLERANCIA). Com com_arquivos, junta também os
+    nomes dos arquivos de cada grupo (ARQUIVO_XML), a parte cara do
+    agrupamento.
+    """
+    for nome in CHAVES_ITENS[:3]:
+        df_xml[nome] = df_xml[nome].astype(object).fillna(CHAVE_AUSENTE).astype(str)
+    df_xml['PRECO_TOLERANCIA'] = arredondar_centavos_com_tolerancia(df_xml['PRECO_UNITARIO'])
+
+    agregacoes = dict(
+        QT_ITEM=('QT_ITEM', 'sum'),
+        PRECO_TOTAL=('PRECO_TOTAL', 'sum'),
+        SOMA_PRECO_UNITARIO=('PRECO_UNITARIO', 'sum'),
+        N_PRECO_UNITARIO=('PRECO_UNITARIO', 'size'),
+    )
+    if com_arquivos:
+        agregacoes['ARQUIVO_XML'] = ('ARQUIVO_XML', lambda x: ', '.join(set(x)))
+    return df_xml.groupby(CHAVES_ITENS, as_index=False).agg(**agregacoes)
+
+
+def agrupar_acumulador(itens_xml):
+    """
+    O agrupamento de agrupar_itens_xml(df, com_arquivos=False), feito direto
+    sobre os códigos do AcumuladorItens, sem montar o DataFrame dos itens:
+    as chaves de texto são agrupadas pelos códigos int32 e só as linhas
+    agrupadas viram texto.
+
+    Retorna (df_agrupado, grupos): grupos[i] é a linha de df_agrupado do
+    item i, para juntar_arquivos. O código -1 (sem texto) é agrupado como
+    os outros e vira CHAVE_AUSENTE.
+    """
+    chaves = {nome: itens_xml.coluna(nome) for nome in CHAVES_ITENS[:3]}
+    valores = {nome: itens_xml.coluna(nome) for nome in ('QT_ITEM', 'PRECO_TOTAL', 'PRECO_UNITARIO')}
+
+    df = pd.DataFrame({**chaves, **valores})
+    df['PRECO_TOLERANCIA'] = arredondar_centavos_com_tolerancia(valores['PRECO_UNITARIO'])
+    grupos = df.groupby(CHAVES_ITENS, sort=False)
+    df_agrupado = grupos.agg(
+        QT_ITEM=('QT_ITEM', 'sum'),
+        PRECO_TOTAL=('PRECO_TOTAL', 'sum'),
+        SOMA_PRECO_UNITARIO=('PRECO_UNITARIO', 'sum'),
+        N_PRECO_UNITARIO=('PRECO_UNITARIO', 'size'),
+    ).reset_index()
+    for nome in CHAVES_ITENS[:3]:
+        textos = np.asarray(itens_xml.textos(nome) + [CHAVE_AUSENTE], dtype=object)
+        df_agrupado[nome] = pd.array(textos[df_agrupado[nome].to_numpy()], dtype=str)
+
+    # Mesma ordem do groupby ordenado de agrupar_itens_xml
+    ordem = df_agrupado.sort_values(CHAVES_ITENS, kind='mergesort').index.to_numpy()
+    linha_do_grupo = np.empty(len(ordem), dtype=np.int64)
+    linha_do_grupo[ordem] = np.arange(len(ordem))
+    grupos_itens = linha_do_grupo[grupos.ngroup().to_numpy()]
+    return df_agrupado.iloc[ordem].reset_index(drop=True), grupos_itens
+
+
+def juntar_arquivos(itens_xml, grupos, df_agrupado, selecao):
+    """
+    df_agrupado (de agrupar_acumulador) só nas linhas de selecao, com a
+    coluna ARQUIVO_XML: os nomes dos arquivos de cada grupo, juntados como
+    em agrupar_itens_xml, mas percorrendo só os itens desses grupos
+    """
+    linhas = np.flatnonzero(selecao)
+    posicao = np.full(len(df_agrupado), -1, dtype=np.int64)
+    posicao[linhas] = np.arange(len(linhas))
+    posicao_itens = posicao[grupos]
+    escolhidos = np.flatnonzero(posicao_itens >= 0)
+
+    nomes = itens_xml.textos('ARQUIVO_XML')
+    arquivos = [[] for _ in linhas]
+    for linha, codigo in dict.fromkeys(zip(posicao_itens[escolhidos].tolist(),
+                                           itens_xml.coluna('ARQUIVO_XML')[escolhidos].tolist())):
+        arquivos[linha].append(nomes[codigo])
+    return df_agrupado.iloc[linhas].reset_index(drop=True).assign(
+        ARQUIVO_XML=[', '.join(set(lista)) for lista in arquivos])
+
+
+def assinar_contas(df_agrupado, colunas_hash):
+    """
+    Assinatura compacta de cada conta de um lado já agrupado: quantidade
+    total, valor total, número de itens agrupados e a soma dos hashes das
+    linhas em colunas_hash (independente da ordem). REPETIDA marca as contas
+    com o mesmo item e faixa em mais de um protocolo.
+    """
+    linhas = df_agrupado[colunas_hash].astype({coluna: str if coluna == 'ITEM_CD_CONVENIO' else 'int64'
+                                               for coluna in colunas_hash})
+    return df_agrupado.assign(
+        HASH_ITENS=pd.util.hash_pandas_object(linhas, index=False).to_numpy(),
+        REPETIDA=df_agrupado.duplicated(CHAVES_ITENS[1:]).to_numpy(),
+    ).groupby('NR_INTERNO_CONTA', sort=False).agg(
+        QT_TOTAL=('QT_ITEM', 'sum'),
+        VALOR_TOTAL=('PRECO_TOTAL', 'sum'),
+        ITENS=('QT_ITEM', 'size'),
+        HASH_ITENS=('HASH_ITENS', 'sum'),
+        REPETIDA=('REPETIDA', 'any'),
+    )
+
+
+def contas_com_assinatura_igual(df_excel, df_xml_agrupado, tolerancia_preco=None):
+    """
+    Primeira camada da comparação em camadas: Index das contas dos dois
+    lados com a mesma assinatura (assinar_contas sobre item, faixa e
+    quantidade), que não geram linha nas abas 3 a 6 e dispensam a
+    comparação item a item.
+
+    Dentro de uma faixa os preços médios diferem no máximo 1 centavo; com
+    tolerância menor que isso, a soma e o número de preços unitários também
+    entram no hash. Contas REPETIDA em qualquer lado nunca são dispensadas.
+    """
+    if tolerancia_preco is None:
+        tolerancia_preco = TOLERANCIA_PRECO
+    colunas_hash = ['ITEM_CD_CONVENIO', 'PRECO_TOLERANCIA', 'QT_ITEM']
+    if round(tolerancia_preco * ESCALA_VALOR * 100) < 100:
+        colunas_hash += ['SOMA_PRECO_UNITARIO', 'N_PRECO_UNITARIO']
+
+    assinaturas_excel = assinar_contas(df_excel, colunas_hash)
+    assinaturas_xml = assinar_contas(df_xml_agrupado, colunas_hash)
+    comuns = assinaturas_excel.index.intersection(assinaturas_xml.index)
+    excel = assinaturas_excel.loc[comuns]
+    xml = assinaturas_xml.loc[comuns]
+
+    iguais = (excel == xml).all(axis=1) & ~excel['REPETIDA'] & ~xml['REPETIDA']
+    return comuns[iguais.to_numpy()]
+
+
+def comparar_itens(df_excel, df_xml, tolerancia_preco=None, xml_agrupado=False):
+    """
+    Compara os itens do Excel (já agrupados) com os itens dos XMLs e
+    retorna as abas 3 a 6:
+    (df_dif_qtd, df_dif_preco, df_apenas_excel, df_apenas_xml)
+
+    Com xml_agrupado, df_xml já vem agrupado como em agrupar_itens_xml (com
+    ARQUIVO_XML), por exemplo de juntar_arquivos.
+
+    A comparação é feita conta a conta (a conta faz parte da chave), então
+    pode ser aplicada a um subconjunto de contas.
+
+    Quantidades e valores chegam como inteiros (ver precos.py) e as
+    comparações são exatas: a diferença de preço compara as médias por
+    multiplicação cruzada (soma_excel * n_xml contra soma_xml * n_excel),
+    sem dividir. Só as abas saem em reais.
+    """
+    if tolerancia_preco is None:
+        tolerancia_preco = TOLERANCIA_PRECO
+    # Tolerância em centésimos de centavo, para aceitar frações de centavo
+    limite_preco = round(tolerancia_preco * ESCALA_VALOR * 100)
+
+    df_xml_agrupado = df_xml if xml_agrupado else agrupar_itens_xml(df_xml)
+
+    print(f"  Itens agrupados no XML: {len(df_xml_agrupado)}")
+
+    # Chaves de comparação: códigos inteiros compartilhados pelos dois lados
+    colunas_chave = CHAVES_ITENS[1:]
+    chave_excel, chave_xml = codificar_chaves(df_excel, df_xml_agrupado, colunas_chave)
+
+    # Só as chaves dos dois lados entram nas abas 3 e 4; o inner merge
+    # mantém as colunas inteiras (sem NaN) e, com sort, a ordem das chaves.
+    # As colunas da chave ficam as do lado Excel.
+    df_comparacao = pd.merge(
+        df_excel.assign(CHAVE=chave_excel),
+        df_xml_agrupado.drop(columns=colunas_chave).assign(CHAVE=chave_xml),
+        on='CHAVE',
+        how='inner',
+        sort=True,
+        suffixes=('_EXCEL', '_XML')
+    )
+
+    # ABA 3: Diferença de quantidade
+    df_dif_qtd = df_comparacao[df_comparacao['QT_ITEM_EXCEL'] != df_comparacao['QT_ITEM_XML']].copy()
+    df_dif_qtd['DIFERENCA_QTD'] = df_dif_qtd['QT_ITEM_EXCEL'] - df_dif_qtd['QT_ITEM_XML']
+    df_dif_qtd = valores_em_reais(df_dif_qtd)[[
+        'NR_SEQ_PROTOCOLO_EXCEL', 'NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'DS_ITEM',
+        'QT_ITEM_EXCEL', 'QT_ITEM_XML', 'DIFERENCA_QTD',
+        'PRECO_UNITARIO_EXCEL', 'PRECO_UNITARIO_XML', 'ARQUIVO_XML'
+    ]].rename(columns={'NR_SEQ_PROTOCOLO_EXCEL': 'NR_SEQ_PROTOCOLO'})
+
+    # ABA 4: Diferença de preço médio maior que a tolerância
+    n_excel = df_comparacao['N_PRECO_UNITARIO_EXCEL']
+    n_xml = df_comparacao['N_PRECO_UNITARIO_XML']
+    diferenca = (df_comparacao['SOMA_PRECO_UNITARIO_EXCEL'] * n_xml
+                 - df_comparacao['SOMA_PRECO_UNITARIO_XML'] * n_excel)
+    df_dif_preco = df_comparacao[diferenca.abs() * 100 > limite_preco * n_excel * n_xml].copy()
+    df_dif_preco['DIFERENCA_PRECO'] = diferenca[df_dif_preco.index] / (
+        df_dif_preco['N_PRECO_UNITARIO_EXCEL'] * df_dif_preco['N_PRECO_UNITARIO_XML'] * ESCALA_VALOR)
+    df_dif_preco = valores_em_reais(df_dif_preco)[[
+        'NR_SEQ_PROTOCOLO_EXCEL', 'NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'DS_ITEM',
+        'PRECO_UNITARIO_EXCEL', 'PRECO_UNITARIO_XML', 'DIFERENCA_PRECO',
+        'QT_ITEM_EXCEL', 'QT_ITEM_XML', 'ARQUIVO_XML'
+    ]].rename(columns={'NR_SEQ_PROTOCOLO_EXCEL': 'NR_SEQ_PROTOCOLO'})
+
+    # ABA 5: Itens apenas no Excel
+    df_apenas_excel = valores_em_reais(df_excel[~np.isin(chave_excel, chave_xml)].drop(columns=['PRECO_TOLERANCIA']))
+
+    # ABA 6: Itens apenas no XML
+    df_apenas_xml = valores_em_reais(df_xml_agrupado[~np.isin(chave_xml, chave_excel)].drop(columns=['PRECO_TOLERANCIA']))
+
+    return df_dif_qtd, df_dif_preco, df_apenas_excel, df_apenas_xml
+
+
+def comparar_dados(df_excel, itens_xml, protocolos_excel, protocolos_xml,
+                   contas_excel, contas_xml, arquivos_por_protocolo,
+                   protocolos_duplicados, protocolo_por_conta_xml,
+                   protocolo_por_conta_excel, contas_por_arquivo, tolerancia_preco=None,
+                   cod_prestador=None, assinaturas_por_protocolo=None, hashes_por_arquivo=None,
+                   posicoes_guias=None, totais_guias=None, em_camadas=False):
+    """
+    Compara dados do Excel com XML. A aba 7 (conteúdo dos protocolos
+    duplicados) só é preenchida com assinaturas_por_protocolo, a aba 8
+    (integridade do hash TISS) só com hashes_por_arquivo e as abas 9 e 10
+    (totais das guias e dos itens) só com totais_guias. Com posicoes_guias,
+    as abas 3 e 4 ganham a coluna TRECHO_XML; as abas 9 e 10 sempre a têm,
+    com a guia conferida.
+
+    Com em_camadas, as contas são primeiro comparadas pela assinatura
+    (contas_com_assinatura_igual) e só as que diferem passam pela
+    comparação item a item; as abas 3 a 6 saem iguais. O lado XML é
+    agrupado uma única vez, direto do acumulador (agrupar_acumulador), e
+    os arquivos só são juntados nos grupos das contas detalhadas.
+    """
+    cod_prestador = cod_prestador or CODIGO_PRESTADOR_VALIDO
+
+    print("\n" + "=" * 70)
+    print("ETAPA 3: Comparando dados Excel vs XML")
+    print("=" * 70)
+
+    print("\n  Analisando protocolos...")
+    df_resumo_protocolos = resumir_protocolos(
+        protocolos_excel, protocolos_xml, arquivos_por_protocolo, protocolos_duplicados
+    )
+
+    print("  Analisando contas...")
+    df_resumo_contas = resumir_contas(
+        contas_excel, contas_xml, contas_por_arquivo,
+        protocolo_por_conta_xml, protocolo_por_conta_excel
+    )
+
+    df_duplicados = None
+    if assinaturas_por_protocolo is not None:
+        print("  Comparando conteudo dos protocolos duplicados...")
+        df_duplicados = comparar_conteudo_duplicados(protocolos_duplicados, assinaturas_por_protocolo)
+
+    df_integridade = None
+    if hashes_por_arquivo is not None:
+        print("  Conferindo hash TISS dos arquivos...")
+        df_integridade = verificar_integridade(hashes_por_arquivo)
+
+    df_totais_guias = df_totais_itens = None
+    if totais_guias is not None:
+        print("  Conferindo os totais das guias e dos itens...")
+        df_totais_guias, df_totais_itens = totais_guias.conferir()
+
+    # =====================================================
+    # ABAS 3-6: Análise de preços/quantidades
+    # (usando apenas itens com o código do prestador da análise)
+    # =====================================================
+    print(f"  Comparando itens (cod. prestador {cod_prestador})...")
+
+    if len(itens_xml) == 0:
+        print(f"  AVISO: Nenhum item com cod. prestador {cod_prestador} encontrado nos XMLs!")
+        df_dif_qtd = pd.DataFrame()
+        df_dif_preco = pd.DataFrame()
+        df_apenas_excel = valores_em_reais(df_excel)
+        df_apenas_xml = pd.DataFrame()
+    else:
+        if em_camadas:
+            df_xml_agrupado, grupos = agrupar_acumulador(itens_xml)
+            conferidas = contas_com_assinatura_igual(df_excel, df_xml_agrupado, tolerancia_preco)
+            # get_indexer em vez de isin, que é lento nas colunas de texto (pyarrow)
+            detalhar_excel = conferidas.get_indexer(df_excel['NR_INTERNO_CONTA']) < 0
+            detalhar_xml = conferidas.get_indexer(df_xml_agrupado['NR_INTERNO_CONTA']) < 0
+            contas = len(set(df_excel['NR_INTERNO_CONTA']) | set(df_xml_agrupado['NR_INTERNO_CONTA']))
+            print(f"  Contas com assinatura igual nos dois lados: {len(conferidas)} de {contas} "
+                  f"({contas - len(conferidas)} comparadas item a item)")
+            (df_dif_qtd, df_dif_preco, df_apenas_excel, df_apenas_xml) = comparar_itens(
+                df_excel[detalhar_excel], juntar_arquivos(itens_xml, grupos, df_xml_agrupado, detalhar_xml),
+                tolerancia_preco, xml_agrupado=True)
+        else:
+            (df_dif_qtd, df_dif_preco,
+             df_apenas_excel, df_apenas_xml) = comparar_itens(df_excel, itens_xml.para_dataframe(), tolerancia_preco)
+        if posicoes_guias is not None:
+            df_dif_qtd = anexar_trechos_xml(df_dif_qtd, posicoes_guias)
+            df_dif_preco = anexar_trechos_xml(df_dif_preco, posicoes_guias)
 
     # Estatísticas
     print(f"\n  RESUMO:")
@@ -402,82 +1115,177 @@ def comparar_dados(df_excel, itens_xml, protocolos_excel, protocolos_xml,
     print(f"  - Contas apenas no Excel: {len(df_resumo_contas[df_resumo_contas['STATUS'] == 'APENAS EXCEL'])}")
     print(f"  - Contas apenas no XML: {len(df_resumo_contas[df_resumo_contas['STATUS'] == 'APENAS XML'])}")
     print(f"  - Itens com diferenca de quantidade: {len(df_dif_qtd)}")
-    print(f"  - Itens com diferenca de preco (>1 centavo): {len(df_dif_preco)}")
+    print(f"  - Itens com diferenca de preco (> tolerancia): {len(df_dif_preco)}")
     print(f"  - Itens apenas no Excel: {len(df_apenas_excel)}")
     print(f"  - Itens apenas no XML: {len(df_apenas_xml)}")
-
-    return df_resumo_protocolos, df_resumo_contas, df_dif_qtd, df_dif_preco, df_apenas_excel, df_apenas_xml
+    if df_duplicados is not None:
+        print(f"  - Protocolos duplicados com conteudo identico: {len(df_duplicados[df_duplicados['CONTEUDO'] == 'IDENTICO'])}")
+        print(f"  - Protocolos duplicados com conteudo divergente: {len(df_duplicados[df_duplicados['CONTEUDO'] == 'DIVERGENTE'])}")
+    if df_integridade is not None:
+        falhas, nome_divergente = contar_integridade(df_integridade)
+        print(f"  - Arquivos com falha de integridade (hash divergente, sem hash ou invalido): "
+              f"{falhas} de {len(hashes_por_arquivo)}")
+        print(f"  - Arquivos com nome divergente do hash (conteudo integro): {nome_divergente}")
+    if df_totais_guias is not None:
+        print(f"  - Guias com total divergente dos itens: "
+              f"{df_totais_guias[['ARQUIVO_XML', 'NR_INTERNO_CONTA']].drop_duplicates().shape[0]} "
+              f"de {len(totais_guias)}")
+        print(f"  - Itens com valor total divergente de qtd x unitario (com ou sem reducao): {len(df_totais_itens)}")
+
+    return (df_resumo_protocolos, df_resumo_contas, df_dif_qtd, df_dif_preco,
+            df_apenas_excel, df_apenas_xml, df_duplicados, df_integridade,
+            df_totais_guias, df_totais_itens)
 
 
 def gerar_relatorio(df_resumo_protocolos, df_resumo_contas, df_dif_qtd,
-                    df_dif_preco, df_apenas_excel, df_apenas_xml):
-    """Gera o relatório Excel final"""
+                    df_dif_preco, df_apenas_excel, df_apenas_xml, df_duplicados=None,
+                    df_integridade=None, df_totais_guias=None, df_totais_itens=None,
+                    formatos_colunares=None, arquivo_saida=None):
+    """
+    Gera o relatório Excel final. Com formatos_colunares (ex.: ('parquet',
+    'csv')), grava também cada aba nesses formatos em <relatorio>_dados.
+    O relatório vai para arquivo_saida (padrão: ARQUIVO_SAIDA); as abas 7
+    a 10 só são gravadas quando df_duplicados, df_integridade,
+    df_totais_guias e df_totais_itens são informados.
+    """
+    arquivo_saida = arquivo_saida or ARQUIVO_SAIDA
+
     print("\n" + "=" * 70)
     print("ETAPA 4: Gerando relatorio Excel")
     print("=" * 70)
 
-    with pd.ExcelWriter(ARQUIVO_SAIDA, engine='openpyxl') as writer:
-        df_resumo_protocolos.to_excel(writer, sheet_name='1-Resumo Protocolos', index=False)
-        print(f"  Aba 1: Resumo Protocolos ({len(df_resumo_protocolos)} linhas)")
-
-        df_resumo_contas.to_excel(writer, sheet_name='2-Resumo Contas', index=False)
-        print(f"  Aba 2: Resumo Contas ({len(df_resumo_contas)} linhas)")
-
-        if df_dif_qtd is not None and len(df_dif_qtd) > 0:
-            df_dif_qtd.to_excel(writer, sheet_name='3-Diferenca Quantidade', index=False)
-        else:
-            pd.DataFrame({'Mensagem': ['Nenhuma diferenca encontrada']}).to_excel(
-                writer, sheet_name='3-Diferenca Quantidade', index=False)
-        print(f"  Aba 3: Diferenca Quantidade ({len(df_dif_qtd) if df_dif_qtd is not None else 0} linhas)")
+    # Abas sem linhas saem com uma mensagem no lugar da tabela
+    abas = [
+        ('1-Resumo Protocolos', df_resumo_protocolos, None),
+        ('2-Resumo Contas', df_resumo_contas, None),
+        ('3-Diferenca Quantidade', df_dif_qtd, 'Nenhuma diferenca encontrada'),
+        ('4-Diferenca Preco', df_dif_preco, 'Nenhuma diferenca encontrada'),
+        ('5-Apenas Excel', df_apenas_excel, 'Nenhum item exclusivo'),
+        ('6-Apenas XML', df_apenas_xml, 'Nenhum item exclusivo'),
+    ]
+    if df_duplicados is not None:
+        abas.append(('7-Duplicados Conteudo', df_duplicados, 'Nenhum protocolo duplicado'))
+    if df_integridade is not None:
+        abas.append(('8-Integridade Hash', df_integridade, 'Todos os hashes conferem'))
+    if df_totais_guias is not None:
+        abas.append(('9-Totais Guias', df_totais_guias, 'Todos os totais das guias conferem'))
+    if df_totais_itens is not None:
+        abas.append(('10-Totais Itens', df_totais_itens, 'Todos os totais dos itens conferem'))
+
+    abas_gravadas = []
+    for nome_aba, df, mensagem in abas:
+        linhas = len(df) if df is not None else 0
+        if mensagem is not None and linhas == 0:
+            df = pd.DataFrame({'Mensagem': [mensagem]})
+        abas_gravadas.append((nome_aba, df))
+        numero, titulo = nome_aba.split('-', 1)
+        print(f"  Aba {numero}: {titulo} ({linhas} linhas)")
+
+    gravar_abas(arquivo_saida, abas_gravadas)
+
+    print(f"\n  Relatorio salvo em: {arquivo_saida}")
+
+    if formatos_colunares:
+        # Os dados como saíram da comparação, sem as mensagens de aba vazia
+        manifesto = gravar_abas_colunares(
+            pasta_padrao(arquivo_saida),
+            [(nome_aba, df) for nome_aba, df, _ in abas],
+            formatos=formatos_colunares,
+            relatorio_xlsx=arquivo_saida
+        )
+        print(f"  Dados em formato colunar: {os.path.dirname(manifesto)}")
 
-        if df_dif_preco is not None and len(df_dif_preco) > 0:
-            df_dif_preco.to_excel(writer, sheet_name='4-Diferenca Preco', index=False)
-        else:
-            pd.DataFrame({'Mensagem': ['Nenhuma diferenca encontrada']}).to_excel(
-                writer, sheet_name='4-Diferenca Preco', index=False)
-        print(f"  Aba 4: Diferenca Preco ({len(df_dif_preco) if df_dif_preco is not None else 0} linhas)")
 
-        if df_apenas_excel is not None and len(df_apenas_excel) > 0:
-            df_apenas_excel.to_excel(writer, sheet_name='5-Apenas Excel', index=False)
-        else:
-            pd.DataFrame({'Mensagem': ['Nenhum item exclusivo']}).to_excel(
-                writer, sheet_name='5-Apenas Excel', index=False)
-        print(f"  Aba 5: Apenas Excel ({len(df_apenas_excel) if df_apenas_excel is not None else 0} linhas)")
+def gerar_relatorio_executivo(df_resumo_protocolos, df_resumo_contas, caminho_saida=None,
+                              df_duplicados=None):
+    """Gera o relatório Word direto das abas de resumo em memória (sem reler o xlsx)"""
+    from gerar_relatorio_word import ARQUIVO_SAIDA_WORD, gerar_relatorio_word
 
-        if df_apenas_xml is not None and len(df_apenas_xml) > 0:
-            df_apenas_xml.to_excel(writer, sheet_name='6-Apenas XML', index=False)
-        else:
-            pd.DataFrame({'Mensagem': ['Nenhum item exclusivo']}).to_excel(
-                writer, sheet_name='6-Apenas XML', index=False)
-        print(f"  Aba 6: Apenas XML ({len(df_apenas_xml) if df_apenas_xml is not None else 0} linhas)")
+    print("\n" + "=" * 70)
+    print("ETAPA 5: Gerando relatorio Word")
+    print("=" * 70)
 
-    print(f"\n  Relatorio salvo em: {ARQUIVO_SAIDA}")
+    gerar_relatorio_word(df_resumo_protocolos, df_resumo_contas, caminho_saida or ARQUIVO_SAIDA_WORD,
+                         df_duplicados=df_duplicados)
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Compara contas medicas: Excel (TASY) vs XML (TISS)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processos para leitura dos XMLs (padrao: 1, sem paralelismo)')
+    parser.add_argument('--pasta-cache', default=PASTA_CACHE,
+                        help=f'pasta do cache de leitura (padrao: {PASTA_CACHE})')
+    parser.add_argument('--sem-cache', action='store_true',
+                        help='ignora os caches de leitura (XMLs e Excel) e le tudo de novo')
+    parser.add_argument('--colunar', nargs='?', const=','.join(FORMATOS_PADRAO), metavar='FORMATOS',
+                        help='grava tambem cada aba em formato colunar ao lado do xlsx '
+                             '(parquet, feather, csv; padrao: parquet,csv)')
+    parser.add_argument('--word', nargs='?', const='', metavar='ARQUIVO_DOCX',
+                        help='gera tambem o relatorio executivo Word na mesma execucao')
+    parser.add_argument('--sem-verificar-hash', action='store_true',
+                        help='nao confere o hash TISS (epilogo) dos XMLs nem gera a aba 8')
+    parser.add_argument('--metricas', nargs='?', const='', metavar='ARQUIVO_JSON',
+                        help='mede cada etapa e cada XML (tempo, CPU, RSS, vazao) e grava o resumo em JSON '
+                             'e os arquivos em CSV (padrao: <relatorio>_metricas.json)')
+    parser.add_argument('--em-camadas', action='store_true',
+                        help='compara primeiro a assinatura de cada conta e so detalha item a item '
+                             'as contas que diferem')
+    args = parser.parse_args()
+
+    metricas = Metricas() if args.metricas is not None else None
+    pasta_cache = None if args.sem_cache else args.pasta_cache
+
     print("\n" + "=" * 70)
     print("COMPARACAO DE CONTAS MEDICAS - EXCEL vs XML")
     print("Versao 3: Corrigido deteccao de contas + tolerancia de 1 centavo")
     print("=" * 70)
 
-    resultado_xml = extrair_dados_xmls()
+    with medir_etapa(metricas, 'extracao'):
+        resultado_xml = extrair_dados_xmls(
+            workers=args.workers,
+            pasta_cache=pasta_cache,
+            verificar_hash=not args.sem_verificar_hash,
+            metricas=metricas
+        )
     (itens_xml, protocolos_xml, contas_xml, arquivos_por_protocolo,
-     protocolos_duplicados, protocolo_por_conta_xml, contas_por_arquivo) = resultado_xml
+     protocolos_duplicados, protocolo_por_conta_xml, contas_por_arquivo,
+     assinaturas_por_protocolo, hashes_por_arquivo, posicoes_guias, totais_guias) = resultado_xml
 
-    resultado_excel = processar_excel()
+    with medir_etapa(metricas, 'excel') as etapa:
+        resultado_excel = processar_excel(pasta_cache=pasta_cache)
+        etapa.contar(linhas=len(resultado_excel[1]))
     (df_excel_agrupado, df_excel_original, protocolos_excel,
      contas_excel, protocolo_por_conta_excel) = resultado_excel
 
-    resultados = comparar_dados(
-        df_excel_agrupado, itens_xml,
-        protocolos_excel, protocolos_xml,
-        contas_excel, contas_xml,
-        arquivos_por_protocolo, protocolos_duplicados,
-        protocolo_por_conta_xml, protocolo_por_conta_excel,
-        contas_por_arquivo
-    )
+    with medir_etapa(metricas, 'comparacao') as etapa:
+        resultados = comparar_dados(
+            df_excel_agrupado, itens_xml,
+            protocolos_excel, protocolos_xml,
+            contas_excel, contas_xml,
+            arquivos_por_protocolo, protocolos_duplicados,
+            protocolo_por_conta_xml, protocolo_por_conta_excel,
+            contas_por_arquivo,
+            assinaturas_por_protocolo=assinaturas_por_protocolo,
+            hashes_por_arquivo=None if args.sem_verificar_hash else hashes_por_arquivo,
+            posicoes_guias=posicoes_guias,
+            totais_guias=totais_guias,
+            em_camadas=args.em_camadas
+        )
+        etapa.contar(itens=len(itens_xml), linhas_excel=len(df_excel_agrupado))
+
+    with medir_etapa(metricas, 'relatorio') as etapa:
+        gerar_relatorio(*resultados, formatos_colunares=args.colunar.split(',') if args.colunar else None)
+        etapa.contar(linhas=sum(len(df) for df in resultados if df is not None))
+
+    if args.word is not None:
+        with medir_etapa(metricas, 'word'):
+            gerar_relatorio_executivo(resultados[0], resultados[1], args.word, df_duplicados=resultados[6])
 
-    gerar_relatorio(*resultados)
+    if metricas is not None:
+        metricas.imprimir_resumo()
+        arquivo_metricas = args.metricas or f"{os.path.splitext(ARQUIVO_SAIDA)[0]}_metricas.json"
+        arquivo_csv = metricas.gravar(arquivo_metricas)
+        print(f"\n  Metricas salvas em: {arquivo_metricas} e {arquivo_csv}")
 
     print("\n" + "=" * 70)
     print("PROCESSAMENTO CONCLUIDO!")
@@ -0,0 +1,587 @@
+# -*- coding: utf-8 -*-
+"""
+Gerador de um corpus sintético de lotes TISS 4.01 e da exportação TASY
+correspondente, para medir a comparação em volumes maiores que o real
+
+A escala 1 reproduz o volume da pasta xml/ real (VOLUME_REAL: ~1027
+arquivos, ~17 mil guias, ~285 mil itens), com as mesmas distribuições de
+cauda longa (lotes de 1 a 100 guias, internações com centenas de itens);
+a escala 10 gera dez vezes isso, e assim por diante. Escalas fracionárias
+(ex.: 0.1) servem para testes rápidos.
+
+Os arquivos seguem o formato dos reais:
+- guiaSP-SADT com procedimentoExecutado e equipeSadt, guiaResumoInternacao
+  com procedimentoExecutado/identEquipe e outrasDespesas/servicosExecutados,
+  e algumas guiaConsulta (sem itens para a análise, como no leitor)
+- valorTotal da guia com a soma dos itens por tipo de despesa
+- ISO-8859-1, pastas REF MM.AAAA por ano e nome <sequencial>_<hash>.xml
+- epilogo/hash calculado pela mesma regra que o LeitorTISS confere
+- alguns lotes reenviados (mesmo numeroLote), com conteúdo idêntico ou
+  divergente
+
+A planilha tasy.xlsx tem os itens do CODIGO_PRESTADOR_VALIDO com as
+divergências que a comparação procura: linhas ausentes, quantidade e preço
+alterados, contas só no Excel e as CONTAS_IGNORAR. O xlsx tem no máximo
+LIMITE_LINHAS_XLSX linhas; acima disso as contas seguintes ficam só no XML
+e o manifesto registra excel_truncado.
+
+Tudo é determinístico pela semente. O manifesto (corpus.json) é gravado
+por último: um corpus interrompido no meio é gerado de novo.
+
+Uso:
+
+    python corpus_sintetico.py --escala 10 --pasta .corpus_sintetico/escala_10
+"""
+
+import os
+import json
+import math
+import random
+import shutil
+import hashlib
+import argparse
+from xml.sax.saxutils import escape
+
+import pandas as pd
+
+from comparar_contas_v3 import CODIGO_PRESTADOR_VALIDO, CONTAS_IGNORAR
+from escritor_xlsx import gravar_abas
+from leitor_excel import COLUNAS_EXCEL
+from leitor_tiss import NS_TISS, CODIFICACAO_HASH
+
+# Incrementar quando o conteúdo gerado mudar (o corpus em disco é refeito)
+VERSAO_CORPUS = 1
+
+# Volume da pasta xml/ real, que define a escala 1
+VOLUME_REAL = {'arquivos': 1027, 'guias': 17244, 'itens': 285195}
+
+ARQUIVO_MANIFESTO = 'corpus.json'
+PASTA_XML_CORPUS = 'xml'
+ARQUIVO_EXCEL_CORPUS = 'tasy.xlsx'
+LIMITE_LINHAS_XLSX = 1048575
+
+REGISTRO_ANS = '335100'
+CNES = '6496172'
+MESES = [(2024, 12)] + [(2025, mes) for mes in range(1, 12)]
+
+# (mediana, dispersão, máximo) de uma lognormal, calibradas no corpus real
+GUIAS_POR_ARQUIVO = (7, 1.5, 100)
+PROCEDIMENTOS_SADT = (2, 0.4, 28)
+PROCEDIMENTOS_INTERNACAO = (4, 1.9, 765)
+SERVICOS_INTERNACAO = (8, 1.9, 1208)
+
+PROPORCAO_INTERNACAO = 0.25
+PROPORCAO_CONSULTA = 0.03
+PROPORCAO_EQUIPE_PRESTADOR = 0.43
+PROPORCAO_ACRESCIMO = 0.007
+PROPORCAO_REENVIO = 0.02
+
+# Divergências da planilha em relação ao XML
+PROPORCAO_LINHA_AUSENTE = 0.05
+PROPORCAO_QTD_ALTERADA = 0.03
+PROPORCAO_PRECO_ALTERADO = 0.03
+PROPORCAO_CONTAS_APENAS_EXCEL = 0.01
+ALTERACOES_PRECO = (0.01, 0.02, 0.5, 3.0)
+
+# Tipos de despesa de outrasDespesas: (codigoDespesa, codigoTabela,
+# primeiro código, preço mediano, peso, campo de valorTotal)
+DESPESAS = (
+    ('02', '20', 90100000, 5.0, 82, 'valorMedicamentos'),
+    ('03', '19', 70100000, 3.0, 78, 'valorMateriais'),
+    ('07', '18', 60020000, 150.0, 11, 'valorTaxasAlugueis'),
+    ('05', '18', 60000000, 400.0, 6, 'valorDiarias'),
+    ('08', '19', 79000000, 1500.0, 4, 'valorOPME'),
+    ('01', '18', 60030000, 20.0, 1, 'valorGasesMedicinais'),
+)
+CAMPOS_VALOR_INTERNACAO = ('valorProcedimentos', 'valorDiarias', 'valorTaxasAlugueis', 'valorMateriais',
+                           'valorMedicamentos', 'valorOPME', 'valorGasesMedicinais')
+CODIGOS_POR_DESPESA = 400
+PROCEDIMENTOS_CATALOGO = 600
+QUANTIDADES_SERVICO = ((1, 52), (2, 17), (3, 9), (4, 5), (5, 3), (6, 2), (10, 1), (30, 1))
+
+_NOMES_PROCEDIMENTO = (
+    'Consulta em pronto socorro', 'Hemograma com contagem de plaquetas', 'Ultrassonografia de abdome total',
+    'Tomografia computadorizada de crânio', 'Eletrocardiograma', 'Postectomia', 'Endoscopia digestiva alta',
+    'Ressonância magnética de coluna', 'Sessão de fisioterapia motora', 'Colecistectomia videolaparoscópica',
+)
+_NOMES_DESPESA = {
+    '02': ('Dipirona sódica solução injetável', 'Água para injetáveis ampola 10 ml', 'Cefazolina pó 1 g'),
+    '03': ('Seringa descartável 10 ml', 'Luva de procedimento', 'Cateter intravenoso 20G'),
+    '07': ('Taxa de sala cirúrgica', 'Recuperação pós anestésica', 'Aluguel de bomba de infusão'),
+    '05': ('Diária de apartamento', 'Diária de UTI adulto', 'Diária de enfermaria'),
+    '08': ('Parafuso cortical', 'Placa de reconstrução', 'Stent coronário'),
+    '01': ('Oxigênio por hora', 'Ar comprimido por hora', 'Óxido nitroso por hora'),
+}
+_NOMES_PROFISSIONAL = ('Alexandre Petreca', 'Adriano Marcondes Froes', 'Beatriz Conceição Lima',
+                       'Célia Araújo', 'João Gonçalves')
+
+
+class _Escritor:
+    """
+    Monta o texto XML de um trecho e, na mesma ordem, o texto dos campos
+    (folhas) que entra no hash TISS
+    """
+
+    def __init__(self):
+        self.partes = []
+        self.textos = []
+
+    def abrir(self, tag):
+        self.partes.append(f'<ans:{tag}>\n')
+
+    def fechar(self, tag):
+        self.partes.append(f'</ans:{tag}>\n')
+
+    def campo(self, tag, valor):
+        self.partes.append(f'<ans:{tag}>{escape(valor)}</ans:{tag}>\n')
+        self.textos.append(valor)
+
+    def grupo(self, tag, campos):
+        self.abrir(tag)
+        for nome, valor in campos:
+            self.campo(nome, valor)
+        self.fechar(tag)
+
+    def trecho(self):
+        return ''.join(self.partes), ''.join(self.textos)
+
+
+def _reais(centavos):
+    return f'{centavos // 100}.{centavos % 100:02d}'
+
+
+def _quantidade(rng, mediana, dispersao, maximo):
+    """Inteiro de 1 a maximo com distribuição lognormal"""
+    return max(1, min(maximo, round(rng.lognormvariate(math.log(mediana), dispersao))))
+
+
+def _preco(rng, mediana):
+    return max(1, round(rng.lognormvariate(math.log(mediana * 100), 0.8)))
+
+
+def _catalogo(rng):
+    """Códigos dos procedimentos e das despesas, com descrição e preço em centavos"""
+    procedimentos = []
+    for i in range(PROCEDIMENTOS_CATALOGO):
+        nome = _NOMES_PROCEDIMENTO[i % len(_NOMES_PROCEDIMENTO)]
+        procedimentos.append((str(10101012 + i * 1013), f'{nome} {i // len(_NOMES_PROCEDIMENTO) + 1}',
+                              _preco(rng, 80.0)))
+    despesas = {}
+    for codigo_despesa, tabela, primeiro, mediana, _, _ in DESPESAS:
+        nomes = _NOMES_DESPESA[codigo_despesa]
+        despesas[codigo_despesa] = [
+            (str(primeiro + i * 7), f'{nomes[i % len(nomes)]} {i // len(nomes) + 1}', _preco(rng, mediana))
+            for i in range(CODIGOS_POR_DESPESA)
+        ]
+    return procedimentos, despesas
+
+
+class GeradorCorpus:
+    """
+    Gera os arquivos de um corpus sintético em pasta_xml e acumula as
+    linhas da planilha TASY. Guarda só o último lote, para os reenvios.
+    """
+
+    def __init__(self, escala=1, semente=1):
+        self.escala = escala
+        self.rng = random.Random(semente)
+        self.procedimentos, self.despesas = _catalogo(self.rng)
+        self.pesos_despesa = [peso for *_, peso, _ in DESPESAS]
+        self.proxima_conta = 30000
+        self.proximo_lote = 100
+        self.carteiras = [f'{self.rng.randrange(10 ** 16, 10 ** 17):017d}'
+                          for _ in range(max(1, round(VOLUME_REAL['guias'] * escala / 3)))]
+        self.linhas_excel = []
+        self.excel_truncado = False
+        self.contagem = {
+            'arquivos': 0, 'arquivos_reenvio': 0, 'bytes_xml': 0,
+            'guias': {'guiaSP-SADT': 0, 'guiaResumoInternacao': 0, 'guiaConsulta': 0},
+            'itens': {'procedimentoExecutado': 0, 'servicosExecutados': 0},
+        }
+
+    # --- Itens ---------------------------------------------------------
+
+    def _equipe(self, escritor, tag_equipe, tag_membro):
+        """Escreve a equipe do procedimento e retorna o código do primeiro membro"""
+        rng = self.rng
+        codigos = []
+        escritor.abrir(tag_equipe)
+        for posicao in range(rng.choice((1, 1, 1, 2))):
+            prestador = (CODIGO_PRESTADOR_VALIDO if posicao == 0 and rng.random() < PROPORCAO_EQUIPE_PRESTADOR
+                         else f'{rng.randrange(90000, 140000):06d}')
+            codigos.append(prestador)
+            if tag_membro:
+                escritor.abrir(tag_membro)
+            escritor.campo('grauPart', '00' if posicao == 0 else '06')
+            escritor.grupo('codProfissional', [('codigoPrestadorNaOperadora', prestador)])
+            escritor.campo('nomeProf', rng.choice(_NOMES_PROFISSIONAL))
+            escritor.campo('conselho', '06')
+            escritor.campo('numeroConselhoProfissional', str(int(prestador)))
+            escritor.campo('UF', '35')
+            escritor.campo('CBOS', '225124')
+            if tag_membro:
+                escritor.fechar(tag_membro)
+        escritor.fechar(tag_equipe)
+        return codigos[0]
+
+    def _procedimento(self, escritor, sequencial, data, tag_equipe, tag_membro):
+        """Escreve um procedimentoExecutado e retorna o item (prestador, código, ...)"""
+        rng = self.rng
+        codigo, descricao, preco = rng.choice(self.procedimentos)
+        quantidade = 1 if rng.random() < 0.97 else rng.randint(2, 5)
+        reducao = 130 if rng.random() < PROPORCAO_ACRESCIMO else 100
+        total = (quantidade * preco * reducao + 50) // 100
+
+        escritor.abrir('procedimentoExecutado')
+        escritor.campo('sequencialItem', str(sequencial))
+        escritor.campo('dataExecucao', data)
+        escritor.campo('horaInicial', '08:43:00')
+        escritor.campo('horaFinal', '09:55:22')
+        escritor.grupo('procedimento', [('codigoTabela', '22'), ('codigoProcedimento', codigo),
+                                        ('descricaoProcedimento', descricao)])
+        escritor.campo('quantidadeExecutada', str(quantidade))
+        escritor.campo('viaAcesso', '1')
+        escritor.campo('reducaoAcrescimo', _reais(reducao))
+        escritor.campo('valorUnitario', _reais(preco))
+        escritor.campo('valorTotal', _reais(total))
+        # O leitor toma o primeiro codigoPrestadorNaOperadora do item (o da equipe)
+        prestador = self._equipe(escritor, tag_equipe, tag_membro)
+        escritor.fechar('procedimentoExecutado')
+
+        self.contagem['itens']['procedimentoExecutado'] += 1
+        return prestador, codigo, descricao, quantidade, preco, total
+
+    def _despesa(self, escritor, sequencial, data):
+        """Escreve uma despesa de outrasDespesas e retorna (campo de valorTotal, total)"""
+        rng = self.rng
+        codigo_despesa, tabela, _, _, _, campo_valor = rng.choices(DESPESAS, self.pesos_despesa)[0]
+        codigo, descricao, preco = rng.choice(self.despesas[codigo_despesa])
+        quantidade = rng.choices([q for q, _ in QUANTIDADES_SERVICO], [p for _, p in QUANTIDADES_SERVICO])[0]
+        total = quantidade * preco
+
+        escritor.abrir('despesa')
+        escritor.campo('sequencialItem', str(sequencial))
+        escritor.campo('codigoDespesa', codigo_despesa)
+        escritor.abrir('servicosExecutados')
+        escritor.campo('dataExecucao', data)
+        escritor.campo('horaInicial', '09:55:22')
+        escritor.campo('horaFinal', '09:55:22')
+        escritor.campo('codigoTabela', tabela)
+        escritor.campo('codigoProcedimento', codigo)
+        escritor.campo('quantidadeExecutada', f'{quantidade}.0000')
+        escritor.campo('unidadeMedida', '001')
+        escritor.campo('reducaoAcrescimo', '1.00')
+        escritor.campo('valorUnitario', _reais(preco))
+        escritor.campo('valorTotal', _reais(total))
+        escritor.campo('descricaoProcedimento', descricao)
+        escritor.fechar('servicosExecutados')
+        escritor.fechar('despesa')
+
+        self.contagem['itens']['servicosExecutados'] += 1
+        return campo_valor, total
+
+    # --- Guias ---------------------------------------------------------
+
+    def _cabecalho_guia(self, escritor, numero_guia, carteira, data):
+        escritor.grupo('cabecalhoGuia', [('registroANS', REGISTRO_ANS), ('numeroGuiaPrestador', numero_guia)])
+        autorizacao = str(self.rng.randrange(10 ** 9, 10 ** 10))
+        escritor.grupo('dadosAutorizacao', [('numeroGuiaOperadora', autorizacao), ('dataAutorizacao', data),
+                                            ('senha', autorizacao)])
+        escritor.grupo('dadosBeneficiario', [('numeroCarteira', carteira), ('atendimentoRN', 'N')])
+
+    def _executante(self, escritor):
+        escritor.abrir('dadosExecutante')
+        escritor.grupo('contratadoExecutante', [('codigoPrestadorNaOperadora', CODIGO_PRESTADOR_VALIDO)])
+        escritor.campo('CNES', CNES)
+        escritor.fechar('dadosExecutante')
+
+    def _guia_sadt(self, escritor, numero_guia, carteira, data):
+        self._cabecalho_guia(escritor, numero_guia, carteira, data)
+        self._executante(escritor)
+        escritor.grupo('dadosAtendimento', [('tipoAtendimento', '05'), ('indicacaoAcidente', '9'),
+                                            ('regimeAtendimento', '01')])
+        itens = []
+        escritor.abrir('procedimentosExecutados')
+        for sequencial in range(1, _quantidade(self.rng, *PROCEDIMENTOS_SADT) + 1):
+            itens.append(self._procedimento(escritor, sequencial, data, 'equipeSadt', None))
+        escritor.fechar('procedimentosExecutados')
+        total = sum(item[5] for item in itens)
+        escritor.grupo('valorTotal', [('valorProcedimentos', _reais(total)), ('valorTotalGeral', _reais(total))])
+        return itens
+
+    def _guia_internacao(self, escritor, numero_guia, carteira, data):
+        rng = self.rng
+        self._cabecalho_guia(escritor, numero_guia, carteira, data)
+        self._executante(escritor)
+        escritor.grupo('dadosInternacao', [('caraterAtendimento', '2'), ('tipoFaturamento', '4'),
+                                           ('dataInicioFaturamento', data), ('dataFinalFaturamento', data),
+                                           ('tipoInternacao', '1'), ('regimeInternacao', '1')])
+        escritor.grupo('dadosSaidaInternacao', [('diagnostico', 'I64'), ('indicadorAcidente', '2'),
+                                                ('motivoEncerramento', '12')])
+        valores = dict.fromkeys(CAMPOS_VALOR_INTERNACAO, 0)
+
+        itens = []
+        quantidade = _quantidade(rng, *PROCEDIMENTOS_INTERNACAO)
+        escritor.abrir('procedimentosExecutados')
+        for sequencial in range(1, quantidade + 1):
+            itens.append(self._procedimento(escritor, sequencial, data, 'identEquipe', 'identificacaoEquipe'))
+        escritor.fechar('procedimentosExecutados')
+        valores['valorProcedimentos'] = sum(item[5] for item in itens)
+
+        escritor.abrir('outrasDespesas')
+        for sequencial in range(quantidade + 1, quantidade + _quantidade(rng, *SERVICOS_INTERNACAO) + 1):
+            campo_valor, total = self._despesa(escritor, sequencial, data)
+            valores[campo_valor] += total
+        escritor.fechar('outrasDespesas')
+
+        escritor.grupo('valorTotal', [(campo, _reais(valor)) for campo, valor in valores.items()]
+                       + [('valorTotalGeral', _reais(sum(valores.values())))])
+        return itens
+
+    def _guia_consulta(self, escritor, numero_guia, carteira, data):
+        codigo, _, preco = self.procedimentos[0]
+        escritor.grupo('cabecalhoConsulta', [('registroANS', REGISTRO_ANS), ('numeroGuiaPrestador', numero_guia)])
+        escritor.campo('numeroGuiaOperadora', str(self.rng.randrange(10 ** 9, 10 ** 10)))
+        escritor.grupo('dadosBeneficiario', [('numeroCarteira', carteira), ('atendimentoRN', 'N')])
+        escritor.grupo('contratadoExecutante', [('codigoPrestadorNaOperadora', CODIGO_PRESTADOR_VALIDO),
+                                                ('CNES', CNES)])
+        escritor.grupo('profissionalExecutante', [('nomeProfissional', self.rng.choice(_NOMES_PROFISSIONAL)),
+                                                  ('conselhoProfissional', '06'),
+                                                  ('numeroConselhoProfissional', '97014'),
+                                                  ('UF', '35'), ('CBOS', '225125')])
+        escritor.campo('indicacaoAcidente', '9')
+        escritor.abrir('dadosAtendimento')
+        escritor.campo('regimeAtendimento', '01')
+        escritor.campo('dataAtendimento', data)
+        escritor.campo('tipoConsulta', '1')
+        escritor.grupo('procedimento', [('codigoTabela', '22'), ('codigoProcedimento', codigo),
+                                        ('valorProcedimento', _reais(preco))])
+        escritor.fechar('dadosAtendimento')
+        return []
+
+    def _guia(self, numero_guia, data):
+        """(tipo, numero_guia, xml, textos do hash, itens) de uma guia nova"""
+        sorteio = self.rng.random()
+        if sorteio < PROPORCAO_CONSULTA:
+            tipo, gerar = 'guiaConsulta', self._guia_consulta
+        elif sorteio < PROPORCAO_CONSULTA + PROPORCAO_INTERNACAO:
+            tipo, gerar = 'guiaResumoInternacao', self._guia_internacao
+        else:
+            tipo, gerar = 'guiaSP-SADT', self._guia_sadt
+
+        escritor = _Escritor()
+        escritor.abrir(tipo)
+        itens = gerar(escritor, numero_guia, self.rng.choice(self.carteiras), data)
+        escritor.fechar(tipo)
+        xml, textos = escritor.trecho()
+        return tipo, numero_guia, xml, textos, itens
+
+    # --- Lotes ---------------------------------------------------------
+
+    def _mensagem(self, sequencial, data, numero_lote, guias):
+        """Texto completo do arquivo e o hash TISS do conteúdo"""
+        escritor = _Escritor()
+        escritor.abrir('cabecalho')
+        escritor.grupo('identificacaoTransacao', [('tipoTransacao', 'ENVIO_LOTE_GUIAS'),
+                                                  ('sequencialTransacao', str(sequencial)),
+                                                  ('dataRegistroTransacao', data),
+                                                  ('horaRegistroTransacao', '10:50:37')])
+        escritor.abrir('origem')
+        escritor.grupo('identificacaoPrestador', [('codigoPrestadorNaOperadora', CODIGO_PRESTADOR_VALIDO)])
+        escritor.fechar('origem')
+        escritor.grupo('destino', [('registroANS', REGISTRO_ANS)])
+        escritor.campo('Padrao', '4.01.00')
+        escritor.fechar('cabecalho')
+        escritor.abrir('prestadorParaOperadora')
+        escritor.abrir('loteGuias')
+        escritor.campo('numeroLote', numero_lote)
+        escritor.abrir('guiasTISS')
+        inicio, textos = escritor.trecho()
+
+        md5 = hashlib.md5(textos.encode(CODIFICACAO_HASH))
+        for _, _, _, textos_guia, _ in guias:
+            md5.update(textos_guia.encode(CODIFICACAO_HASH))
+        hash_tiss = md5.hexdigest()
+
+        partes = [
+            '<?xml version="1.0" encoding="ISO-8859-1" ?> \n',
+            f'<ans:mensagemTISS xmlns:ans="{NS_TISS}" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n',
+            inicio,
+        ]
+        partes.extend(xml for _, _, xml, _, _ in guias)
+        partes.append('</ans:guiasTISS>\n</ans:loteGuias>\n</ans:prestadorParaOperadora>\n'
+                      f'<ans:epilogo>\n<ans:hash>{hash_tiss}</ans:hash>\n</ans:epilogo>\n'
+                      '</ans:mensagemTISS>\n')
+        return ''.join(partes), hash_tiss
+
+    def _registrar_excel(self, numero_lote, numero_guia, itens):
+        """Linhas TASY dos itens do prestador; acima do limite do xlsx a conta fica só no XML"""
+        linhas = [(int(numero_lote), int(numero_guia), int(codigo), descricao, quantidade, preco / 100, total / 100)
+                  for prestador, codigo, descricao, quantidade, preco, total in itens
+                  if prestador == CODIGO_PRESTADOR_VALIDO]
+        if len(self.linhas_excel) + len(linhas) > LIMITE_LINHAS_XLSX:
+            self.excel_truncado = True
+            return
+        self.linhas_excel.extend(linhas)
+
+    def gerar_xml(self, pasta_xml):
+        """Grava os lotes em pasta_xml/<ano>/REF MM.AAAA/"""
+        rng = self.rng
+        total_arquivos = max(1, round(VOLUME_REAL['arquivos'] * self.escala))
+        anterior = None
+
+        for indice in range(total_arquivos):
+            ano, mes = MESES[indice * len(MESES) // total_arquivos]
+            data = f'{ano}-{mes:02d}-{rng.randint(1, 28):02d}'
+            sequencial = 30000 + indice * 7 + rng.randrange(7)
+
+            if anterior and rng.random() < PROPORCAO_REENVIO:
+                # Reenvio do lote anterior: metade idêntico, metade com uma guia refeita
+                numero_lote, guias = anterior
+                if rng.random() < 0.5:
+                    guias = list(guias)
+                    posicao = rng.randrange(len(guias))
+                    guias[posicao] = self._guia(guias[posicao][1], data)
+                self.contagem['arquivos_reenvio'] += 1
+            else:
+                numero_lote = str(self.proximo_lote)
+                self.proximo_lote += 1
+                guias = []
+                for _ in range(_quantidade(rng, *GUIAS_POR_ARQUIVO)):
+                    numero_guia = str(self.proxima_conta)
+                    self.proxima_conta += 1
+                    guia = self._guia(numero_guia, data)
+                    guias.append(guia)
+                    self._registrar_excel(numero_lote, numero_guia, guia[4])
+            anterior = (numero_lote, guias)
+
+            for tipo, *_ in guias:
+                self.contagem['guias'][tipo] += 1
+            texto, hash_tiss = self._mensagem(sequencial, data, numero_lote, guias)
+            dados = texto.encode('iso-8859-1')
+
+            pasta_mes = os.path.join(pasta_xml, str(ano), f'REF {mes:02d}.{ano}')
+            os.makedirs(pasta_mes, exist_ok=True)
+            with open(os.path.join(pasta_mes, f'{sequencial}_{hash_tiss}.xml'), 'wb') as f:
+                f.write(dados)
+            self.contagem['arquivos'] += 1
+            self.contagem['bytes_xml'] += len(dados)
+
+            if (indice + 1) % 1000 == 0:
+                print(f"  Gerados {indice + 1} de {total_arquivos} arquivos...")
+
+    def gerar_excel(self, caminho_excel):
+        """Grava a exportação TASY com as divergências e retorna o número de linhas"""
+        rng = self.rng
+        linhas = []
+        for protocolo, conta, codigo, descricao, quantidade, preco, total in self.linhas_excel:
+            sorteio = rng.random()
+            if sorteio < PROPORCAO_LINHA_AUSENTE:
+                continue
+            sorteio -= PROPORCAO_LINHA_AUSENTE
+            if sorteio < PROPORCAO_QTD_ALTERADA:
+                quantidade += 1
+                total = round(quantidade * preco, 2)
+            elif sorteio < PROPORCAO_QTD_ALTERADA + PROPORCAO_PRECO_ALTERADO:
+                preco = round(preco + rng.choice(ALTERACOES_PRECO), 2)
+                total = round(quantidade * preco, 2)
+            linhas.append((protocolo, conta, codigo, descricao, quantidade, preco, total))
+
+        # Contas que só existem no Excel, em protocolos próprios, e as contas ignoradas
+        contas_apenas_excel = round(len({linha[1] for linha in self.linhas_excel}) * PROPORCAO_CONTAS_APENAS_EXCEL)
+        for i in range(contas_apenas_excel):
+            codigo, descricao, preco = rng.choice(self.procedimentos)
+            linhas.append((900000 + i // 20, 9000000 + i, int(codigo), descricao, 1, preco / 100, preco / 100))
+        for conta in sorted(CONTAS_IGNORAR):
+            linhas.append((1, conta, 10101012, 'Conta ignorada', 1, 1.0, 1.0))
+
+        linhas = linhas[:LIMITE_LINHAS_XLSX]
+        gravar_abas(caminho_excel, [('Contas', pd.DataFrame(linhas, columns=COLUNAS_EXCEL))])
+        return len(linhas)
+
+
+def ler_escala(texto):
+    """Escala da linha de comando: '10' vira 10 e '0.5' vira 0.5 (o manifesto guarda o número)"""
+    escala = float(texto)
+    if escala <= 0:
+        raise argparse.ArgumentTypeError(f"escala invalida: {texto}")
+    return int(escala) if escala.is_integer() else escala
+
+
+def ler_manifesto(pasta):
+    """Manifesto do corpus em pasta, ou None se não houver um corpus completo"""
+    try:
+        with open(os.path.join(pasta, ARQUIVO_MANIFESTO), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def gerar_corpus(pasta, escala=1, semente=1):
+    """
+    Gera o corpus em pasta (XMLs em pasta/xml e a planilha em
+    pasta/tasy.xlsx) e retorna o manifesto. Um corpus anterior na mesma
+    pasta é apagado; uma pasta com outro conteúdo não é tocada.
+    """
+    pasta_xml = os.path.join(pasta, PASTA_XML_CORPUS)
+    caminho_manifesto = os.path.join(pasta, ARQUIVO_MANIFESTO)
+    if os.path.isdir(pasta) and os.listdir(pasta):
+        conteudo = set(os.listdir(pasta))
+        if not conteudo <= {PASTA_XML_CORPUS, ARQUIVO_EXCEL_CORPUS, ARQUIVO_MANIFESTO}:
+            raise ValueError(f"{pasta} nao e uma pasta de corpus sintetico; escolha uma pasta vazia")
+        if os.path.exists(caminho_manifesto):
+            os.remove(caminho_manifesto)
+        shutil.rmtree(pasta_xml, ignore_errors=True)
+
+    print("=" * 70)
+    print(f"GERANDO CORPUS SINTETICO (escala {escala}, semente {semente})")
+    print("=" * 70)
+
+    gerador = GeradorCorpus(escala, semente)
+    gerador.gerar_xml(pasta_xml)
+    linhas_excel = gerador.gerar_excel(os.path.join(pasta, ARQUIVO_EXCEL_CORPUS))
+
+    manifesto = dict(
+        versao=VERSAO_CORPUS,
+        escala=escala,
+        semente=semente,
+        pasta_xml=PASTA_XML_CORPUS,
+        arquivo_excel=ARQUIVO_EXCEL_CORPUS,
+        linhas_excel=linhas_excel,
+        excel_truncado=gerador.excel_truncado,
+        **gerador.contagem,
+    )
+    temporario = f"{caminho_manifesto}.{os.getpid()}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, indent=2)
+    os.replace(temporario, caminho_manifesto)
+
+    print(f"  Arquivos: {manifesto['arquivos']} ({manifesto['bytes_xml'] / 2 ** 20:.0f} MB)")
+    print(f"  Guias: {sum(manifesto['guias'].values())}  Itens: {sum(manifesto['itens'].values())}")
+    print(f"  Linhas no Excel: {linhas_excel}" + (" (truncado no limite do xlsx)" if gerador.excel_truncado else ""))
+    return manifesto
+
+
+def preparar_corpus(pasta, escala=1, semente=1):
+    """Reaproveita o corpus de pasta se for da mesma versão, escala e semente; senão gera"""
+    manifesto = ler_manifesto(pasta)
+    if manifesto and (manifesto.get('versao'), manifesto.get('escala'), manifesto.get('semente')) == \
+            (VERSAO_CORPUS, escala, semente):
+        return manifesto
+    return gerar_corpus(pasta, escala, semente)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera um corpus sintetico de XMLs TISS e a planilha TASY')
+    parser.add_argument('--pasta', required=True, help='pasta do corpus (vazia ou de um corpus anterior)')
+    parser.add_argument('--escala', type=ler_escala, default=1,
+                        help='multiplo do volume real da pasta xml/ (padrao: 1)')
+    parser.add_argument('--semente', type=int, default=1, help='semente do gerador (padrao: 1)')
+    args = parser.parse_args()
+
+    gerar_corpus(args.pasta, args.escala, args.semente)
+
+
+if __name__ == "__main__":
+    main()
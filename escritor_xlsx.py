@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Gravação de relatórios xlsx em modo streaming
+
+O pd.ExcelWriter com openpyxl monta um objeto por célula de todas as abas
+e só grava no final. Aqui cada aba é escrita linha a linha, em blocos de
+LINHAS_POR_BLOCO, e as linhas já escritas vão para o disco: a memória não
+cresce com o tamanho do relatório.
+
+Usa o xlsxwriter com constant_memory quando estiver instalado; senão, o
+openpyxl em modo write_only. As abas saem com os mesmos nomes, a mesma
+ordem de colunas e o cabeçalho em negrito do to_excel(index=False).
+"""
+
+import importlib.util
+
+import pandas as pd
+
+# Linhas convertidas para objetos Python de cada vez
+LINHAS_POR_BLOCO = 10000
+
+
+def _backend_xlsx():
+    if importlib.util.find_spec('xlsxwriter') is not None:
+        return 'xlsxwriter'
+    return 'openpyxl'
+
+
+def _blocos_de_linhas(df):
+    """Gera as linhas do df como tuplas de valores Python, com NaN como None"""
+    for inicio in range(0, len(df), LINHAS_POR_BLOCO):
+        bloco = df.iloc[inicio:inicio + LINHAS_POR_BLOCO]
+        colunas = []
+        for nome in bloco.columns:
+            serie = bloco[nome]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                serie = serie.astype(object)
+            valores = serie.tolist()
+            if serie.hasnans:
+                valores = [None if ausente else valor
+                           for valor, ausente in zip(valores, serie.isna().tolist())]
+            colunas.append(valores)
+        yield from zip(*colunas)
+
+
+def _gravar_xlsxwriter(caminho, abas):
+    import xlsxwriter
+
+    livro = xlsxwriter.Workbook(caminho, {
+        'constant_memory': True,
+        # Códigos e nomes de arquivo são gravados como texto, sem conversão
+        'strings_to_numbers': False,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    formato_cabecalho = livro.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    try:
+        for nome_aba, df in abas:
+            planilha = livro.add_worksheet(nome_aba)
+            planilha.write_row(0, 0, [str(coluna) for coluna in df.columns], formato_cabecalho)
+            for numero, linha in enumerate(_blocos_de_linhas(df), start=1):
+                planilha.write_row(numero, 0, linha)
+    finally:
+        livro.close()
+
+
+def _gravar_openpyxl(caminho, abas):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Border, Font, Side
+
+    livro = Workbook(write_only=True)
+    borda = Side(style='thin')
+    for nome_aba, df in abas:
+        planilha = livro.create_sheet(nome_aba)
+        cabecalho = []
+        for coluna in df.columns:
+            celula = WriteOnlyCell(planilha, value=str(coluna))
+            celula.font = Font(bold=True)
+            celula.border = Border(left=borda, right=borda, top=borda, bottom=borda)
+            celula.alignment = Alignment(horizontal='center', vertical='top')
+            cabecalho.append(celula)
+        planilha.append(cabecalho)
+        for linha in _blocos_de_linhas(df):
+            planilha.append(linha)
+    livro.save(caminho)
+
+
+def gravar_abas(caminho, abas):
+    """
+    Grava um xlsx com as abas na ordem recebida.
+
+    abas: lista de (nome_da_aba, DataFrame), gravados sem o índice.
+    """
+    if _backend_xlsx() == 'xlsxwriter':
+        _gravar_xlsxwriter(caminho, abas)
+    else:
+        _gravar_openpyxl(caminho, abas)
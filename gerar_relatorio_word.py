@@ -1,26 +1,43 @@
 # -*- coding: utf-8 -*-
+"""
+Relatório executivo (Word) da comparação de protocolos e contas
+
+gerar_relatorio_word recebe os DataFrames das abas 1 e 2 (resumo de
+protocolos e de contas) já em memória. Executado como script, carrega essas
+abas do relatório da comparação: da cópia colunar (--colunar) quando ela
+estiver atualizada, senão do xlsx, com uma única leitura.
+"""
+
+import os
+import copy
+from datetime import datetime
+
 from docx import Document
 from docx.shared import Pt, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
 import pandas as pd
-from datetime import datetime
 
-# Carregar dados
-df_prot = pd.read_excel(r'C:\Users\AMH\Desktop\meu-site\Relatorio_Comparacao_v3.xlsx', sheet_name='1-Resumo Protocolos')
-df_contas = pd.read_excel(r'C:\Users\AMH\Desktop\meu-site\Relatorio_Comparacao_v3.xlsx', sheet_name='2-Resumo Contas')
+from saida_colunar import MANIFESTO, ler_abas_colunares, pasta_padrao
+
+ARQUIVO_RELATORIO = r"C:\Users\AMH\Desktop\meu-site\Relatorio_Comparacao_v3.xlsx"
+ARQUIVO_SAIDA_WORD = r"C:\Users\AMH\Desktop\meu-site\Analise_Executiva_Protocolos_Contas.docx"
 
-# Criar documento
-doc = Document()
+ABA_PROTOCOLOS = '1-Resumo Protocolos'
+ABA_CONTAS = '2-Resumo Contas'
+
+STATUS = ('OK', 'APENAS EXCEL', 'APENAS XML', 'DUPLICADO')
 
-# Configurar margens
-for section in doc.sections:
-    section.top_margin = Cm(2)
-    section.bottom_margin = Cm(2)
-    section.left_margin = Cm(2.5)
-    section.right_margin = Cm(2.5)
 
-# Funcao para adicionar tabela
 def add_table(doc, headers, rows):
+    """
+    Adiciona uma tabela com cabeçalho em negrito e células centralizadas.
+
+    Só o cabeçalho e a primeira linha passam pela API do python-docx; as
+    demais linhas são cópias do XML (w:tr) da primeira com o texto trocado,
+    anexadas direto à tabela. O table.add_row() percorre todas as células
+    da tabela a cada linha, o que deixava tabelas grandes quadráticas.
+    """
     table = doc.add_table(rows=1, cols=len(headers))
     table.style = 'Table Grid'
     hdr_cells = table.rows[0].cells
@@ -28,242 +45,328 @@ def add_table(doc, headers, rows):
         hdr_cells[i].text = header
         hdr_cells[i].paragraphs[0].runs[0].bold = True
         hdr_cells[i].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-    for row_data in rows:
-        row_cells = table.add_row().cells
-        for i, cell_data in enumerate(row_data):
-            row_cells[i].text = str(cell_data)
-            row_cells[i].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    rows = iter(rows)
+    primeira = next(rows, None)
+    if primeira is None:
+        return table
+
+    # Linha modelo: um parágrafo centralizado com um run por célula
+    row_cells = table.add_row().cells
+    for i in range(len(headers)):
+        row_cells[i].text = 'x'
+        row_cells[i].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+    modelo = table.rows[1]._tr
+    tbl = table._tbl
+    tbl.remove(modelo)
+
+    tag_t = qn('w:t')
+    espaco = '{http://www.w3.org/XML/1998/namespace}space'
+    for row_data in (primeira, *rows):
+        tr = copy.deepcopy(modelo)
+        for t, cell_data in zip(tr.iter(tag_t), row_data):
+            texto = str(cell_data)
+            t.text = texto
+            if texto != texto.strip():
+                t.set(espaco, 'preserve')
+        tbl.append(tr)
     return table
 
-# Calcular metricas
-total_prot = len(df_prot)
-prot_ok = len(df_prot[df_prot['STATUS'] == 'OK'])
-prot_apenas_excel = len(df_prot[df_prot['STATUS'] == 'APENAS EXCEL'])
-prot_apenas_xml = len(df_prot[df_prot['STATUS'] == 'APENAS XML'])
-prot_duplicados = len(df_prot[df_prot['STATUS'] == 'DUPLICADO'])
-
-total_contas = len(df_contas)
-contas_ok = len(df_contas[df_contas['STATUS'] == 'OK'])
-contas_apenas_excel = len(df_contas[df_contas['STATUS'] == 'APENAS EXCEL'])
-contas_apenas_xml = len(df_contas[df_contas['STATUS'] == 'APENAS XML'])
-contas_duplicadas = len(df_contas[df_contas['STATUS'] == 'DUPLICADO'])
-
-pct_prot_ok = (prot_ok / total_prot * 100)
-pct_contas_ok = (contas_ok / total_contas * 100)
-
-# Contas orfas (protocolo tem XML mas conta nao)
-contas_sem_xml = df_contas[df_contas['STATUS'] == 'APENAS EXCEL']
-protocolos_com_xml = set(df_prot[df_prot['NO_XML'] == 'Sim']['NR_SEQ_PROTOCOLO'].astype(str))
-contas_orfas = contas_sem_xml[contas_sem_xml['NR_SEQ_PROTOCOLO'].astype(str).isin(protocolos_com_xml)]
-contas_esperadas = contas_sem_xml[~contas_sem_xml['NR_SEQ_PROTOCOLO'].astype(str).isin(protocolos_com_xml)]
-
-# ==================== CAPA ====================
-title = doc.add_heading('Analise de Consistencia', 0)
-title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-subtitle = doc.add_paragraph('Contas Medicas: Excel (TASY) vs XML (TISS)')
-subtitle.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-doc.add_paragraph()
-date_para = doc.add_paragraph(f'Data: {datetime.now().strftime("%d/%m/%Y")}')
-date_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-doc.add_page_break()
-
-# ==================== SUMARIO EXECUTIVO ====================
-doc.add_heading('1. Sumario Executivo', level=1)
-
-p = doc.add_paragraph()
-p.add_run('Objetivo: ').bold = True
-p.add_run('Verificar a consistencia entre os dados de contas medicas registrados no sistema TASY (Excel) e os arquivos XML enviados aos planos de saude.')
-
-doc.add_paragraph()
-
-p = doc.add_paragraph()
-p.add_run('Resultado Geral: ').bold = True
-p.add_run(f'{pct_prot_ok:.1f}% dos protocolos e {pct_contas_ok:.1f}% das contas estao consistentes entre Excel e XML.')
-
-doc.add_paragraph()
-
-doc.add_heading('Visao Geral', level=2)
-add_table(doc,
-    ['Metrica', 'Protocolos', 'Contas'],
-    [
-        ['Total Analisado', str(total_prot), str(total_contas)],
-        ['Consistentes (OK)', f'{prot_ok} ({pct_prot_ok:.1f}%)', f'{contas_ok} ({pct_contas_ok:.1f}%)'],
-        ['Apenas no Excel', str(prot_apenas_excel), str(contas_apenas_excel)],
-        ['Apenas no XML', str(prot_apenas_xml), str(contas_apenas_xml)],
-        ['Duplicados', str(prot_duplicados), str(contas_duplicadas)],
+
+def contar_status(df):
+    """Quantidade de linhas de cada STATUS, com todos os status conhecidos (0 se ausente)"""
+    contagem = df['STATUS'].value_counts()
+    return {status: int(contagem.get(status, 0)) for status in STATUS}
+
+
+def _chave_protocolo(protocolo):
+    # Protocolos numéricos em ordem numérica, como quando vinham do xlsx como int
+    texto = str(protocolo)
+    return (0, int(texto), texto) if texto.isdigit() else (1, 0, texto)
+
+
+def gerar_relatorio_word(df_prot, df_contas, caminho_saida=ARQUIVO_SAIDA_WORD, df_duplicados=None):
+    """
+    Gera o relatório Word a partir das abas de resumo de protocolos e de
+    contas. Com df_duplicados (aba 7-Duplicados Conteudo), os protocolos
+    duplicados saem já separados em reenvio idêntico e conteúdo divergente.
+    """
+    # Criar documento
+    doc = Document()
+
+    # Configurar margens
+    for section in doc.sections:
+        section.top_margin = Cm(2)
+        section.bottom_margin = Cm(2)
+        section.left_margin = Cm(2.5)
+        section.right_margin = Cm(2.5)
+
+    # Calcular metricas (uma contagem por tabela)
+    total_prot = len(df_prot)
+    status_prot = contar_status(df_prot)
+    prot_ok = status_prot['OK']
+    prot_apenas_excel = status_prot['APENAS EXCEL']
+    prot_apenas_xml = status_prot['APENAS XML']
+    prot_duplicados = status_prot['DUPLICADO']
+
+    total_contas = len(df_contas)
+    status_contas = contar_status(df_contas)
+    contas_ok = status_contas['OK']
+    contas_apenas_excel = status_contas['APENAS EXCEL']
+    contas_apenas_xml = status_contas['APENAS XML']
+    contas_duplicadas = status_contas['DUPLICADO']
+
+    dup_identicos = dup_divergentes = None
+    if df_duplicados is not None and len(df_duplicados) > 0:
+        conteudo = df_duplicados['CONTEUDO'].value_counts()
+        dup_identicos = int(conteudo.get('IDENTICO', 0))
+        dup_divergentes = int(conteudo.get('DIVERGENTE', 0))
+
+    pct_prot_ok = (prot_ok / total_prot * 100)
+    pct_contas_ok = (contas_ok / total_contas * 100)
+
+    # Contas orfas (protocolo tem XML mas conta nao)
+    contas_sem_xml = df_contas[df_contas['STATUS'] == 'APENAS EXCEL']
+    protocolos_com_xml = set(df_prot[df_prot['NO_XML'] == 'Sim']['NR_SEQ_PROTOCOLO'].astype(str))
+    contas_orfas = contas_sem_xml[contas_sem_xml['NR_SEQ_PROTOCOLO'].astype(str).isin(protocolos_com_xml)]
+    contas_esperadas = contas_sem_xml[~contas_sem_xml['NR_SEQ_PROTOCOLO'].astype(str).isin(protocolos_com_xml)]
+
+    # ==================== CAPA ====================
+    title = doc.add_heading('Analise de Consistencia', 0)
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    subtitle = doc.add_paragraph('Contas Medicas: Excel (TASY) vs XML (TISS)')
+    subtitle.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    doc.add_paragraph()
+    date_para = doc.add_paragraph(f'Data: {datetime.now().strftime("%d/%m/%Y")}')
+    date_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    doc.add_page_break()
+
+    # ==================== SUMARIO EXECUTIVO ====================
+    doc.add_heading('1. Sumario Executivo', level=1)
+
+    p = doc.add_paragraph()
+    p.add_run('Objetivo: ').bold = True
+    p.add_run('Verificar a consistencia entre os dados de contas medicas registrados no sistema TASY (Excel) e os arquivos XML enviados aos planos de saude.')
+
+    doc.add_paragraph()
+
+    p = doc.add_paragraph()
+    p.add_run('Resultado Geral: ').bold = True
+    p.add_run(f'{pct_prot_ok:.1f}% dos protocolos e {pct_contas_ok:.1f}% das contas estao consistentes entre Excel e XML.')
+
+    doc.add_paragraph()
+
+    doc.add_heading('Visao Geral', level=2)
+    add_table(doc,
+        ['Metrica', 'Protocolos', 'Contas'],
+        [
+            ['Total Analisado', str(total_prot), str(total_contas)],
+            ['Consistentes (OK)', f'{prot_ok} ({pct_prot_ok:.1f}%)', f'{contas_ok} ({pct_contas_ok:.1f}%)'],
+            ['Apenas no Excel', str(prot_apenas_excel), str(contas_apenas_excel)],
+            ['Apenas no XML', str(prot_apenas_xml), str(contas_apenas_xml)],
+            ['Duplicados', str(prot_duplicados), str(contas_duplicadas)],
+        ]
+    )
+
+    doc.add_page_break()
+
+    # ==================== ANALISE DE PROTOCOLOS ====================
+    doc.add_heading('2. Analise de Protocolos', level=1)
+
+    doc.add_heading('2.1 Distribuicao por Status', level=2)
+    add_table(doc,
+        ['Status', 'Quantidade', 'Percentual', 'Interpretacao'],
+        [
+            ['OK', str(prot_ok), f'{prot_ok/total_prot*100:.1f}%', 'Protocolo existe no Excel e no XML'],
+            ['APENAS EXCEL', str(prot_apenas_excel), f'{prot_apenas_excel/total_prot*100:.1f}%', 'XML nao gerado ou ausente na pasta'],
+            ['DUPLICADO', str(prot_duplicados), f'{prot_duplicados/total_prot*100:.1f}%', 'Mais de um arquivo XML'],
+            ['APENAS XML', str(prot_apenas_xml), f'{prot_apenas_xml/total_prot*100:.1f}%', 'Protocolo removido do Excel'],
+        ]
+    )
+
+    doc.add_heading('2.2 Pontos de Atencao', level=2)
+
+    if prot_apenas_excel > 0:
+        p = doc.add_paragraph(style='List Bullet')
+        p.add_run(f'{prot_apenas_excel} protocolos sem XML: ').bold = True
+        p.add_run('Verificar se sao protocolos recentes ainda nao fechados ou se houve falha no envio.')
+
+    if prot_duplicados > 0:
+        p = doc.add_paragraph(style='List Bullet')
+        p.add_run(f'{prot_duplicados} protocolos com XML duplicado: ').bold = True
+        if dup_identicos is None:
+            p.add_run('Verificar se os arquivos duplicados sao identicos ou se ha divergencia de conteudo.')
+        else:
+            p.add_run(f'{dup_identicos} com conteudo identico (reenvio) e {dup_divergentes} com conteudo '
+                      'divergente (ver aba 7-Duplicados Conteudo do relatorio).')
+
+    if prot_apenas_xml > 0:
+        p = doc.add_paragraph(style='List Bullet')
+        p.add_run(f'{prot_apenas_xml} protocolo(s) apenas no XML: ').bold = True
+        p.add_run('Verificar se foram cancelados/estornados no sistema apos o envio.')
+
+    doc.add_heading('2.3 Protocolos sem XML', level=2)
+    lista_prot = df_prot[df_prot['STATUS'] == 'APENAS EXCEL']['NR_SEQ_PROTOCOLO'].tolist()
+    p = doc.add_paragraph()
+    p.add_run(f'Total: {len(lista_prot)} protocolos').bold = True
+    doc.add_paragraph()
+    p = doc.add_paragraph()
+    p.add_run('Lista: ').bold = True
+    p.add_run(', '.join([str(x) for x in sorted(lista_prot, key=_chave_protocolo)]))
+
+    doc.add_heading('2.4 Protocolos com XML Duplicado', level=2)
+    df_dup = df_prot[df_prot['STATUS'] == 'DUPLICADO']
+    if len(df_dup) > 0:
+        rows = []
+        for protocolo, arquivos in zip(df_dup['NR_SEQ_PROTOCOLO'], df_dup['ARQUIVOS_XML']):
+            arq = str(arquivos)
+            if len(arq) > 60:
+                arq = arq[:60] + '...'
+            rows.append([str(protocolo), arq])
+        add_table(doc, ['Protocolo', 'Arquivos XML'], rows)
+    else:
+        doc.add_paragraph('Nenhum protocolo duplicado encontrado.')
+
+    doc.add_page_break()
+
+    # ==================== ANALISE DE CONTAS ====================
+    doc.add_heading('3. Analise de Contas', level=1)
+
+    doc.add_heading('3.1 Distribuicao por Status', level=2)
+    add_table(doc,
+        ['Status', 'Quantidade', 'Percentual', 'Interpretacao'],
+        [
+            ['OK', str(contas_ok), f'{contas_ok/total_contas*100:.1f}%', 'Conta existe no Excel e no XML'],
+            ['APENAS EXCEL', str(contas_apenas_excel), f'{contas_apenas_excel/total_contas*100:.1f}%', 'Conta nao consta em nenhum XML'],
+            ['DUPLICADO', str(contas_duplicadas), f'{contas_duplicadas/total_contas*100:.1f}%', 'Conta em mais de um XML'],
+            ['APENAS XML', str(contas_apenas_xml), f'{contas_apenas_xml/total_contas*100:.1f}%', 'Conta removida do Excel'],
+        ]
+    )
+
+    doc.add_heading('3.2 Analise das Contas sem XML', level=2)
+    add_table(doc,
+        ['Situacao', 'Quantidade', 'Observacao'],
+        [
+            ['Protocolo NAO tem XML', str(len(contas_esperadas)), 'Esperado - protocolo inteiro sem XML'],
+            ['Protocolo TEM XML', str(len(contas_orfas)), 'INVESTIGAR - conta deveria estar no XML'],
+        ]
+    )
+
+    doc.add_paragraph()
+    p = doc.add_paragraph()
+    p.add_run('ATENCAO: ').bold = True
+    p.add_run(f'Existem {len(contas_orfas)} contas que pertencem a protocolos que possuem XML, porem essas contas nao estao incluidas nos arquivos XML. Isso pode indicar remocao manual ou erro na geracao.')
+
+    doc.add_heading('3.3 Pontos de Atencao', level=2)
+
+    if len(contas_orfas) > 0:
+        p = doc.add_paragraph(style='List Bullet')
+        p.add_run(f'{len(contas_orfas)} contas orfas: ').bold = True
+        p.add_run('Contas que deveriam estar no XML mas nao estao. Prioridade alta para investigacao.')
+
+    if contas_duplicadas > 0:
+        p = doc.add_paragraph(style='List Bullet')
+        p.add_run(f'{contas_duplicadas} contas duplicadas: ').bold = True
+        p.add_run('Verificar se ha cobranca em duplicidade.')
+
+    if contas_apenas_xml > 0:
+        p = doc.add_paragraph(style='List Bullet')
+        p.add_run(f'{contas_apenas_xml} contas apenas no XML: ').bold = True
+        p.add_run('Contas enviadas ao plano que nao constam mais no sistema.')
+
+    doc.add_page_break()
+
+    # ==================== QUESTIONAMENTOS ====================
+    doc.add_heading('4. Questionamentos para Investigacao', level=1)
+
+    doc.add_heading('4.1 Sobre Protocolos', level=2)
+    questions = [
+        f'Os {prot_apenas_excel} protocolos sem XML sao recentes e ainda estao em processo de fechamento?',
+        'Qual o prazo esperado entre o fechamento do protocolo e a geracao do XML?',
+        f'Os {prot_duplicados} protocolos com XML duplicado foram reenviados intencionalmente? Os arquivos sao identicos?',
+    ]
+    if dup_divergentes is not None:
+        questions[2] = (f'Os {prot_duplicados} protocolos com XML duplicado foram reenviados intencionalmente? '
+                        f'Qual arquivo vale nos {dup_divergentes} com conteudo divergente?')
+    for q in questions:
+        doc.add_paragraph(q, style='List Number')
+
+    doc.add_heading('4.2 Sobre Contas', level=2)
+    questions = [
+        f'As {len(contas_orfas)} contas orfas (protocolo tem XML mas conta nao esta nele) foram removidas intencionalmente?',
+        'Existe processo de auditoria para validar se todas as contas do protocolo foram incluidas no XML antes do envio?',
+        f'As {contas_apenas_xml} contas que estao no XML mas nao no Excel foram estornadas? Se sim, foi enviada retificacao ao plano?',
+    ]
+    for q in questions:
+        doc.add_paragraph(q, style='List Number')
+
+    doc.add_heading('4.3 Sobre Processo', level=2)
+    questions = [
+        'Existe controle de versao dos arquivos XML enviados?',
+        'Ha log de alteracoes manuais nos arquivos XML antes do envio?',
+        'Qual o procedimento quando uma conta precisa ser removida de um protocolo ja enviado?',
     ]
-)
+    for q in questions:
+        doc.add_paragraph(q, style='List Number')
 
-doc.add_page_break()
+    doc.add_page_break()
 
-# ==================== ANALISE DE PROTOCOLOS ====================
-doc.add_heading('2. Analise de Protocolos', level=1)
+    # ==================== RECOMENDACOES ====================
+    doc.add_heading('5. Recomendacoes', level=1)
 
-doc.add_heading('2.1 Distribuicao por Status', level=2)
-add_table(doc,
-    ['Status', 'Quantidade', 'Percentual', 'Interpretacao'],
-    [
-        ['OK', str(prot_ok), f'{prot_ok/total_prot*100:.1f}%', 'Protocolo existe no Excel e no XML'],
-        ['APENAS EXCEL', str(prot_apenas_excel), f'{prot_apenas_excel/total_prot*100:.1f}%', 'XML nao gerado ou ausente na pasta'],
-        ['DUPLICADO', str(prot_duplicados), f'{prot_duplicados/total_prot*100:.1f}%', 'Mais de um arquivo XML'],
-        ['APENAS XML', str(prot_apenas_xml), f'{prot_apenas_xml/total_prot*100:.1f}%', 'Protocolo removido do Excel'],
+    doc.add_heading('5.1 Curto Prazo', level=2)
+    items = [
+        f'Investigar as {len(contas_orfas)} contas orfas para identificar causa raiz',
+        f'Validar se os {prot_duplicados} XMLs duplicados tem conteudo identico',
+        'Verificar status dos protocolos sem XML junto a area responsavel',
     ]
-)
-
-doc.add_heading('2.2 Pontos de Atencao', level=2)
-
-if prot_apenas_excel > 0:
-    p = doc.add_paragraph(style='List Bullet')
-    p.add_run(f'{prot_apenas_excel} protocolos sem XML: ').bold = True
-    p.add_run('Verificar se sao protocolos recentes ainda nao fechados ou se houve falha no envio.')
-
-if prot_duplicados > 0:
-    p = doc.add_paragraph(style='List Bullet')
-    p.add_run(f'{prot_duplicados} protocolos com XML duplicado: ').bold = True
-    p.add_run('Verificar se os arquivos duplicados sao identicos ou se ha divergencia de conteudo.')
-
-if prot_apenas_xml > 0:
-    p = doc.add_paragraph(style='List Bullet')
-    p.add_run(f'{prot_apenas_xml} protocolo(s) apenas no XML: ').bold = True
-    p.add_run('Verificar se foram cancelados/estornados no sistema apos o envio.')
-
-doc.add_heading('2.3 Protocolos sem XML', level=2)
-lista_prot = df_prot[df_prot['STATUS'] == 'APENAS EXCEL']['NR_SEQ_PROTOCOLO'].tolist()
-p = doc.add_paragraph()
-p.add_run(f'Total: {len(lista_prot)} protocolos').bold = True
-doc.add_paragraph()
-p = doc.add_paragraph()
-p.add_run('Lista: ').bold = True
-p.add_run(', '.join([str(x) for x in sorted(lista_prot)]))
-
-doc.add_heading('2.4 Protocolos com XML Duplicado', level=2)
-df_dup = df_prot[df_prot['STATUS'] == 'DUPLICADO'][['NR_SEQ_PROTOCOLO', 'ARQUIVOS_XML']]
-if len(df_dup) > 0:
-    rows = []
-    for _, row in df_dup.iterrows():
-        arq = str(row['ARQUIVOS_XML'])
-        if len(arq) > 60:
-            arq = arq[:60] + '...'
-        rows.append([str(row['NR_SEQ_PROTOCOLO']), arq])
-    add_table(doc, ['Protocolo', 'Arquivos XML'], rows)
-else:
-    doc.add_paragraph('Nenhum protocolo duplicado encontrado.')
-
-doc.add_page_break()
-
-# ==================== ANALISE DE CONTAS ====================
-doc.add_heading('3. Analise de Contas', level=1)
-
-doc.add_heading('3.1 Distribuicao por Status', level=2)
-add_table(doc,
-    ['Status', 'Quantidade', 'Percentual', 'Interpretacao'],
-    [
-        ['OK', str(contas_ok), f'{contas_ok/total_contas*100:.1f}%', 'Conta existe no Excel e no XML'],
-        ['APENAS EXCEL', str(contas_apenas_excel), f'{contas_apenas_excel/total_contas*100:.1f}%', 'Conta nao consta em nenhum XML'],
-        ['DUPLICADO', str(contas_duplicadas), f'{contas_duplicadas/total_contas*100:.1f}%', 'Conta em mais de um XML'],
-        ['APENAS XML', str(contas_apenas_xml), f'{contas_apenas_xml/total_contas*100:.1f}%', 'Conta removida do Excel'],
+    if dup_divergentes is not None:
+        items[1] = f'Conferir os {dup_divergentes} protocolos com XMLs duplicados de conteudo divergente'
+    for item in items:
+        doc.add_paragraph(item, style='List Bullet')
+
+    doc.add_heading('5.2 Medio Prazo', level=2)
+    items = [
+        'Implementar validacao automatica antes do envio do XML',
+        'Criar relatorio periodico de consistencia Excel vs XML',
+        'Documentar processo de retificacao de XMLs enviados',
     ]
-)
-
-doc.add_heading('3.2 Analise das Contas sem XML', level=2)
-add_table(doc,
-    ['Situacao', 'Quantidade', 'Observacao'],
-    [
-        ['Protocolo NAO tem XML', str(len(contas_esperadas)), 'Esperado - protocolo inteiro sem XML'],
-        ['Protocolo TEM XML', str(len(contas_orfas)), 'INVESTIGAR - conta deveria estar no XML'],
+    for item in items:
+        doc.add_paragraph(item, style='List Bullet')
+
+    doc.add_heading('5.3 Longo Prazo', level=2)
+    items = [
+        'Automatizar geracao de XMLs diretamente do sistema',
+        'Implementar trilha de auditoria para alteracoes',
+        'Integrar validacao de consistencia no fluxo de fechamento',
     ]
-)
-
-doc.add_paragraph()
-p = doc.add_paragraph()
-p.add_run('ATENCAO: ').bold = True
-p.add_run(f'Existem {len(contas_orfas)} contas que pertencem a protocolos que possuem XML, porem essas contas nao estao incluidas nos arquivos XML. Isso pode indicar remocao manual ou erro na geracao.')
-
-doc.add_heading('3.3 Pontos de Atencao', level=2)
-
-if len(contas_orfas) > 0:
-    p = doc.add_paragraph(style='List Bullet')
-    p.add_run(f'{len(contas_orfas)} contas orfas: ').bold = True
-    p.add_run('Contas que deveriam estar no XML mas nao estao. Prioridade alta para investigacao.')
-
-if contas_duplicadas > 0:
-    p = doc.add_paragraph(style='List Bullet')
-    p.add_run(f'{contas_duplicadas} contas duplicadas: ').bold = True
-    p.add_run('Verificar se ha cobranca em duplicidade.')
-
-if contas_apenas_xml > 0:
-    p = doc.add_paragraph(style='List Bullet')
-    p.add_run(f'{contas_apenas_xml} contas apenas no XML: ').bold = True
-    p.add_run('Contas enviadas ao plano que nao constam mais no sistema.')
-
-doc.add_page_break()
-
-# ==================== QUESTIONAMENTOS ====================
-doc.add_heading('4. Questionamentos para Investigacao', level=1)
-
-doc.add_heading('4.1 Sobre Protocolos', level=2)
-questions = [
-    f'Os {prot_apenas_excel} protocolos sem XML sao recentes e ainda estao em processo de fechamento?',
-    'Qual o prazo esperado entre o fechamento do protocolo e a geracao do XML?',
-    f'Os {prot_duplicados} protocolos com XML duplicado foram reenviados intencionalmente? Os arquivos sao identicos?',
-]
-for q in questions:
-    doc.add_paragraph(q, style='List Number')
-
-doc.add_heading('4.2 Sobre Contas', level=2)
-questions = [
-    f'As {len(contas_orfas)} contas orfas (protocolo tem XML mas conta nao esta nele) foram removidas intencionalmente?',
-    'Existe processo de auditoria para validar se todas as contas do protocolo foram incluidas no XML antes do envio?',
-    f'As {contas_apenas_xml} contas que estao no XML mas nao no Excel foram estornadas? Se sim, foi enviada retificacao ao plano?',
-]
-for q in questions:
-    doc.add_paragraph(q, style='List Number')
-
-doc.add_heading('4.3 Sobre Processo', level=2)
-questions = [
-    'Existe controle de versao dos arquivos XML enviados?',
-    'Ha log de alteracoes manuais nos arquivos XML antes do envio?',
-    'Qual o procedimento quando uma conta precisa ser removida de um protocolo ja enviado?',
-]
-for q in questions:
-    doc.add_paragraph(q, style='List Number')
-
-doc.add_page_break()
-
-# ==================== RECOMENDACOES ====================
-doc.add_heading('5. Recomendacoes', level=1)
-
-doc.add_heading('5.1 Curto Prazo', level=2)
-items = [
-    f'Investigar as {len(contas_orfas)} contas orfas para identificar causa raiz',
-    f'Validar se os {prot_duplicados} XMLs duplicados tem conteudo identico',
-    'Verificar status dos protocolos sem XML junto a area responsavel',
-]
-for item in items:
-    doc.add_paragraph(item, style='List Bullet')
-
-doc.add_heading('5.2 Medio Prazo', level=2)
-items = [
-    'Implementar validacao automatica antes do envio do XML',
-    'Criar relatorio periodico de consistencia Excel vs XML',
-    'Documentar processo de retificacao de XMLs enviados',
-]
-for item in items:
-    doc.add_paragraph(item, style='List Bullet')
-
-doc.add_heading('5.3 Longo Prazo', level=2)
-items = [
-    'Automatizar geracao de XMLs diretamente do sistema',
-    'Implementar trilha de auditoria para alteracoes',
-    'Integrar validacao de consistencia no fluxo de fechamento',
-]
-for item in items:
-    doc.add_paragraph(item, style='List Bullet')
-
-# Salvar
-doc.save(r'C:\Users\AMH\Desktop\meu-site\Analise_Executiva_Protocolos_Contas.docx')
-print('Documento salvo com sucesso!')
-print(r'Arquivo: C:\Users\AMH\Desktop\meu-site\Analise_Executiva_Protocolos_Contas.docx')
+    for item in items:
+        doc.add_paragraph(item, style='List Bullet')
+
+    # Salvar
+    doc.save(caminho_saida)
+    print('Documento salvo com sucesso!')
+    print(f'Arquivo: {caminho_saida}')
+
+
+def carregar_resumos(caminho_relatorio=ARQUIVO_RELATORIO):
+    """
+    Retorna (df_prot, df_contas) do relatório da comparação. Usa a cópia
+    colunar se ela existir e não for mais antiga que o xlsx; senão lê as
+    duas abas do xlsx de uma vez.
+    """
+    pasta = pasta_padrao(caminho_relatorio)
+    manifesto = os.path.join(pasta, MANIFESTO)
+    if os.path.exists(manifesto) and os.path.getmtime(manifesto) >= os.path.getmtime(caminho_relatorio):
+        abas = ler_abas_colunares(pasta, abas=(ABA_PROTOCOLOS, ABA_CONTAS))
+    else:
+        abas = pd.read_excel(caminho_relatorio, sheet_name=[ABA_PROTOCOLOS, ABA_CONTAS])
+    return abas[ABA_PROTOCOLOS], abas[ABA_CONTAS]
+
+
+if __name__ == "__main__":
+    df_prot, df_contas = carregar_resumos()
+    gerar_relatorio_word(df_prot, df_contas)
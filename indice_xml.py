@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Índice persistente (SQLite) das contas e protocolos do arquivo de XMLs
+
+Responde "em qual arquivo está a conta X?" sem rodar a comparação nem
+varrer os XMLs. Cada guia fica registrada com o arquivo, a pasta de mês
+(REF MM.AAAA) e a posição da guia no arquivo em bytes, e pode ser buscada
+por:
+- conta (numeroGuiaPrestador)
+- lote (numeroLote)
+- carteira (numeroCarteira do beneficiário)
+- procedimento (codigoProcedimento de algum item da guia)
+
+A atualização é incremental: só os arquivos novos ou alterados (tamanho ou
+data de modificação) são lidos, e os que sumiram da pasta saem do índice.
+A leitura usa o mesmo cache dos scripts de comparação, então depois de uma
+comparação a atualização do índice não precisa reler nenhum XML.
+
+Uso:
+
+    python indice_xml.py atualizar --pasta-xml xml
+    python indice_xml.py conta 231681
+    python indice_xml.py procedimento 10101012
+    python indice_xml.py conta 231681 --xml
+    python indice_xml.py trecho "92369_4305....xml@994-23127"
+
+Com --xml, cada guia encontrada é impressa (só o trecho da guia é lido do
+arquivo). trecho imprime as guias da coluna TRECHO_XML do relatório.
+"""
+
+import os
+import time
+import sqlite3
+import argparse
+
+import comparar_contas_v3 as v3
+from leitor_tiss import formatar_guia
+
+# Relativo à pasta de execução; outro arquivo com --banco (ou arquivo_indice
+# na configuração do reconciliar.py)
+ARQUIVO_INDICE = 'indice_xml.sqlite'
+
+# Incrementar quando o esquema ou o conteúdo do índice mudar
+VERSAO_INDICE = 2
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT);
+CREATE TABLE IF NOT EXISTS arquivos (
+    id INTEGER PRIMARY KEY,
+    caminho TEXT UNIQUE NOT NULL,
+    nome TEXT NOT NULL,
+    mes TEXT,
+    tamanho INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    numero_lote TEXT
+);
+CREATE TABLE IF NOT EXISTS guias (
+    id INTEGER PRIMARY KEY,
+    arquivo_id INTEGER NOT NULL,
+    numero_guia TEXT NOT NULL,
+    numero_carteira TEXT,
+    inicio INTEGER,
+    fim INTEGER
+);
+CREATE TABLE IF NOT EXISTS procedimentos (
+    guia_id INTEGER NOT NULL,
+    codigo TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_arquivos_lote ON arquivos (numero_lote);
+CREATE INDEX IF NOT EXISTS ix_arquivos_nome ON arquivos (nome);
+CREATE INDEX IF NOT EXISTS ix_guias_arquivo ON guias (arquivo_id);
+CREATE INDEX IF NOT EXISTS ix_guias_numero ON guias (numero_guia);
+CREATE INDEX IF NOT EXISTS ix_guias_carteira ON guias (numero_carteira);
+CREATE INDEX IF NOT EXISTS ix_procedimentos_codigo ON procedimentos (codigo);
+CREATE INDEX IF NOT EXISTS ix_procedimentos_guia ON procedimentos (guia_id);
+"""
+
+_CONSULTA_GUIAS = """
+SELECT a.mes, a.nome, a.numero_lote, g.numero_guia, g.numero_carteira, g.inicio, g.fim, a.caminho
+FROM guias g JOIN arquivos a ON a.id = g.arquivo_id
+"""
+
+# Tipo de busca -> condição sobre guias (g) e arquivos (a)
+CONSULTAS = {
+    'conta': "WHERE g.numero_guia = ?",
+    'lote': "WHERE a.numero_lote = ?",
+    'carteira': "WHERE g.numero_carteira = ?",
+    'procedimento': "WHERE g.id IN (SELECT guia_id FROM procedimentos WHERE codigo = ?)",
+}
+
+COLUNAS_CONSULTA = ('MES', 'ARQUIVO_XML', 'NR_SEQ_PROTOCOLO', 'NR_INTERNO_CONTA',
+                    'NR_CARTEIRA', 'INICIO', 'FIM', 'CAMINHO')
+
+
+def abrir_indice(caminho_banco=None):
+    """Abre (ou cria) o índice; um índice de outra versão é recriado vazio"""
+    caminho_banco = caminho_banco or ARQUIVO_INDICE
+    pasta = os.path.dirname(caminho_banco)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+
+    conexao = sqlite3.connect(caminho_banco)
+    conexao.executescript(ESQUEMA)
+    versao = conexao.execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()
+    if versao is None or versao[0] != str(VERSAO_INDICE):
+        with conexao:
+            for tabela in ('procedimentos', 'guias', 'arquivos'):
+                conexao.execute(f"DELETE FROM {tabela}")
+            conexao.execute("INSERT OR REPLACE INTO meta VALUES ('versao', ?)", (str(VERSAO_INDICE),))
+    return conexao
+
+
+def _remover_arquivos(conexao, ids):
+    for arquivo_id in ids:
+        conexao.execute("DELETE FROM procedimentos WHERE guia_id IN "
+                        "(SELECT id FROM guias WHERE arquivo_id = ?)", (arquivo_id,))
+        conexao.execute("DELETE FROM guias WHERE arquivo_id = ?", (arquivo_id,))
+        conexao.execute("DELETE FROM arquivos WHERE id = ?", (arquivo_id,))
+
+
+def _inserir_arquivo(conexao, caminho, st, resultado):
+    numero_lote, _, itens, nome_arquivo, _, _, guias = resultado
+    cursor = conexao.execute(
+        "INSERT INTO arquivos (caminho, nome, mes, tamanho, mtime_ns, numero_lote) VALUES (?, ?, ?, ?, ?, ?)",
+        (caminho, nome_arquivo, os.path.basename(os.path.dirname(caminho)),
+         st.st_size, st.st_mtime_ns, numero_lote)
+    )
+    arquivo_id = cursor.lastrowid
+
+    ids_guias = []
+    for numero_guia, numero_carteira, inicio, fim, _ in guias:
+        cursor = conexao.execute(
+            "INSERT INTO guias (arquivo_id, numero_guia, numero_carteira, inicio, fim) VALUES (?, ?, ?, ?, ?)",
+            (arquivo_id, numero_guia, numero_carteira, inicio, fim)
+        )
+        ids_guias.append(cursor.lastrowid)
+
+    # Pela posição da guia no arquivo, não pelo número: o mesmo
+    # numeroGuiaPrestador pode aparecer em mais de uma guia do lote
+    conexao.executemany(
+        "INSERT INTO procedimentos (guia_id, codigo) VALUES (?, ?)",
+        [(ids_guias[guia], codigo) for guia, codigo in itens.pares_guia_item() if guia < len(ids_guias)]
+    )
+    return len(guias)
+
+
+def atualizar_indice(caminho_banco=None, pasta_xml=None, workers=1, pasta_cache=None):
+    """
+    Acrescenta ao índice os XMLs novos ou alterados de pasta_xml (padrão:
+    PASTA_XML) e remove os que não existem mais. Retorna (arquivos lidos,
+    arquivos removidos, arquivos sem alteração).
+    """
+    pasta_xml = os.path.abspath(pasta_xml or v3.PASTA_XML)
+
+    print("=" * 70)
+    print(f"Atualizando indice: {pasta_xml}")
+    print("=" * 70)
+
+    conexao = abrir_indice(caminho_banco)
+    try:
+        registrados = {caminho: (arquivo_id, tamanho, mtime_ns) for arquivo_id, caminho, tamanho, mtime_ns
+                       in conexao.execute("SELECT id, caminho, tamanho, mtime_ns FROM arquivos")}
+
+        caminhos = [os.path.abspath(caminho) for caminho in v3.listar_arquivos_xml(pasta_xml)]
+        estados = {caminho: os.stat(caminho) for caminho in caminhos}
+        pendentes = []
+        alterados = []
+        for caminho in caminhos:
+            st = estados[caminho]
+            registro = registrados.get(caminho)
+            if registro is not None and registro[1:] == (st.st_size, st.st_mtime_ns):
+                continue
+            pendentes.append(caminho)
+            if registro is not None:
+                alterados.append(registro[0])
+
+        # Só os arquivos desta pasta saem do índice; outras pastas indexadas ficam
+        prefixo = os.path.join(pasta_xml, '')
+        existentes = set(caminhos)
+        removidos = [arquivo_id for caminho, (arquivo_id, _, _) in registrados.items()
+                     if caminho.startswith(prefixo) and caminho not in existentes]
+
+        guias = 0
+        with conexao:
+            _remover_arquivos(conexao, removidos + alterados)
+            resultados = v3.processar_arquivos_xml(pendentes, workers, pasta_cache)
+            for caminho, resultado in zip(pendentes, resultados):
+                guias += _inserir_arquivo(conexao, caminho, estados[caminho], resultado)
+    finally:
+        conexao.close()
+
+    sem_alteracao = len(caminhos) - len(pendentes)
+    print(f"  Arquivos lidos: {len(pendentes)} ({guias} guias)")
+    print(f"  Arquivos removidos do indice: {len(removidos)}")
+    print(f"  Arquivos sem alteracao: {sem_alteracao}")
+    return len(pendentes), len(removidos), sem_alteracao
+
+
+def consultar(tipo, valor, caminho_banco=None):
+    """Guias encontradas para a busca (tipo em CONSULTAS), como dicts com COLUNAS_CONSULTA"""
+    conexao = abrir_indice(caminho_banco)
+    try:
+        linhas = conexao.execute(
+            _CONSULTA_GUIAS + CONSULTAS[tipo] + " ORDER BY a.mes, a.nome, g.inicio", (str(valor).strip(),)
+        ).fetchall()
+    finally:
+        conexao.close()
+    return [dict(zip(COLUNAS_CONSULTA, linha)) for linha in linhas]
+
+
+def localizar_trecho(referencia, caminho_banco=None):
+    """
+    (caminho, inicio, fim) de uma referência 'arquivo@inicio-fim' da coluna
+    TRECHO_XML. Um nome de arquivo sem pasta é procurado no índice.
+    """
+    arquivo, posicao = referencia.strip().rsplit('@', 1)
+    inicio, fim = (int(numero) for numero in posicao.split('-'))
+    if os.path.exists(arquivo):
+        return arquivo, inicio, fim
+
+    conexao = abrir_indice(caminho_banco)
+    try:
+        linha = conexao.execute("SELECT caminho FROM arquivos WHERE nome = ?", (arquivo,)).fetchone()
+    finally:
+        conexao.close()
+    if linha is None:
+        raise ValueError(f"Arquivo nao encontrado no indice: {arquivo}")
+    return linha[0], inicio, fim
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Indice das contas e protocolos dos XMLs (TISS)')
+    parser.add_argument('--banco', default=ARQUIVO_INDICE,
+                        help='arquivo SQLite do indice (padrao: indice_xml.sqlite na pasta atual)')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    atualizar = subparsers.add_parser('atualizar', help='le os XMLs novos ou alterados e atualiza o indice')
+    atualizar.add_argument('--pasta-xml', default=v3.PASTA_XML, help='pasta com os XMLs (padrao: PASTA_XML)')
+    atualizar.add_argument('--workers', type=int, default=1,
+                           help='processos para leitura dos XMLs (padrao: 1, sem paralelismo)')
+    atualizar.add_argument('--pasta-cache', default=v3.PASTA_CACHE,
+                           help='cache de leitura dos XMLs (padrao: o mesmo da comparacao)')
+    atualizar.add_argument('--sem-cache', action='store_true', help='le os XMLs sem usar o cache')
+
+    for tipo in CONSULTAS:
+        busca = subparsers.add_parser(tipo, help=f'busca as guias por {tipo}')
+        busca.add_argument('valor')
+        busca.add_argument('--xml', action='store_true', help='imprime tambem o XML de cada guia')
+
+    trecho = subparsers.add_parser('trecho', help='imprime as guias de um valor da coluna TRECHO_XML')
+    trecho.add_argument('referencias', help="'arquivo@inicio-fim', separados por virgula")
+
+    args = parser.parse_args()
+
+    if args.comando == 'atualizar':
+        atualizar_indice(args.banco, args.pasta_xml, args.workers,
+                         None if args.sem_cache else args.pasta_cache)
+        return
+
+    if args.comando == 'trecho':
+        for referencia in args.referencias.split(','):
+            caminho, inicio, fim = localizar_trecho(referencia, args.banco)
+            print(f"{caminho} (bytes {inicio}-{fim})")
+            print(formatar_guia(caminho, inicio, fim))
+        return
+
+    inicio = time.perf_counter()
+    linhas = consultar(args.comando, args.valor, args.banco)
+    duracao_ms = (time.perf_counter() - inicio) * 1000
+
+    for linha in linhas:
+        print(f"{linha['MES'] or '-'}  {linha['ARQUIVO_XML']}  lote {linha['NR_SEQ_PROTOCOLO']}  "
+              f"conta {linha['NR_INTERNO_CONTA']}  carteira {linha['NR_CARTEIRA'] or '-'}  "
+              f"bytes {linha['INICIO']}-{linha['FIM']}")
+        if args.xml and linha['INICIO'] is not None:
+            print(formatar_guia(linha['CAMINHO'], linha['INICIO'], linha['FIM']))
+    print(f"{len(linhas)} guia(s) encontrada(s) em {duracao_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas de execução por etapa e por arquivo XML
+
+Uma instância de Metricas acompanha uma execução:
+- etapa(nome), num bloco with, mede a etapa: tempo de relógio, tempo de
+  CPU (do processo e dos processos filhos já encerrados), pico de RSS
+  (amostrado por uma thread) e as vazões arquivos/s, guias/s e itens/s
+- registrar_arquivo guarda as mesmas medidas de cada XML lido (ou
+  carregado do cache), com a pasta de mês e o lote
+
+No fim, gravar escreve um resumo JSON (etapas, arquivos mais lentos,
+totais por mês) e um CSV com uma linha por arquivo. Os arquivos lentos
+para o seu tamanho (MB/s abaixo de 1/FATOR_LENTIDAO da mediana) saem
+marcados no CSV.
+
+Desligada, a instrumentação não custa nada além de um teste "is not None"
+por arquivo: as funções recebem metricas=None, e medir_etapa(None, nome)
+devolve um medidor que não faz nada.
+"""
+
+import os
+import csv
+import json
+import time
+import threading
+import tracemalloc
+import importlib.util
+import statistics
+from datetime import datetime
+
+# Intervalo entre as leituras de RSS durante uma etapa, em segundos
+INTERVALO_AMOSTRA_RSS = 0.05
+# Arquivos listados em mais_lentos
+LIMITE_MAIS_LENTOS = 20
+# Arquivo lento: MB/s abaixo da mediana dividida por este fator
+FATOR_LENTIDAO = 3
+
+MB = 2 ** 20
+
+COLUNAS_ARQUIVOS = ['arquivo', 'mes', 'lote', 'origem', 'bytes', 'guias', 'itens', 'tempo_s', 'cpu_s',
+                    'rss_mb', 'mb_por_s', 'guias_por_s', 'itens_por_s', 'lento']
+
+
+def funcao_rss():
+    """
+    Função que lê o RSS atual do processo, em bytes: psutil quando estiver
+    instalado, /proc/self/statm no Linux, ou None se não houver como medir
+    """
+    if importlib.util.find_spec('psutil') is not None:
+        import psutil
+        processo = psutil.Process()
+        return lambda: processo.memory_info().rss
+    if os.path.exists('/proc/self/statm'):
+        pagina = os.sysconf('SC_PAGE_SIZE')
+
+        def rss():
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * pagina
+        return rss
+    return None
+
+
+# Leitor de RSS do processo atual (inclusive dos workers), criado no primeiro uso
+_ler_rss = None
+
+
+def medir_chamada(funcao, *args, **kwargs):
+    """
+    Executa funcao(*args, **kwargs) e retorna (resultado, tempo_s, cpu_s,
+    rss_mb), medidos no processo que executou a chamada (serve para os
+    workers de um ProcessPoolExecutor)
+    """
+    global _ler_rss
+    if _ler_rss is None:
+        _ler_rss = funcao_rss() or (lambda: 0)
+
+    cpu = time.process_time()
+    inicio = time.perf_counter()
+    resultado = funcao(*args, **kwargs)
+    tempo = time.perf_counter() - inicio
+    return resultado, tempo, time.process_time() - cpu, _ler_rss() / MB
+
+
+def _por_segundo(quantidade, tempo):
+    return round(quantidade / tempo, 1) if tempo > 0 else None
+
+
+class MedidorEtapa:
+    """
+    Mede uma etapa num bloco with. Com contar(), a etapa registra também
+    quantidades e vazões; sem isso, usa os arquivos registrados durante a
+    etapa (arquivos, bytes, guias e itens).
+    """
+
+    def __init__(self, metricas, nome):
+        self.metricas = metricas
+        self.nome = nome
+        self.contagens = {}
+        self.resultado = {}
+
+    def contar(self, **contagens):
+        self.contagens.update(contagens)
+
+    def _amostrar(self):
+        while not self._parar.wait(INTERVALO_AMOSTRA_RSS):
+            self._pico = max(self._pico, self._ler_rss())
+
+    def __enter__(self):
+        self._ler_rss = self.metricas.ler_rss
+        self._primeiro_arquivo = len(self.metricas.arquivos)
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        if self._ler_rss:
+            self._pico = self._ler_rss()
+            self._parar = threading.Event()
+            self._thread = threading.Thread(target=self._amostrar, daemon=True)
+            self._thread.start()
+        self._cpu = time.process_time()
+        self._filhos = os.times()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excecao):
+        tempo = time.perf_counter() - self._inicio
+        filhos = os.times()
+        cpu = (time.process_time() - self._cpu
+               + (filhos.children_user - self._filhos.children_user)
+               + (filhos.children_system - self._filhos.children_system))
+        resultado = {'tempo_s': round(tempo, 3), 'cpu_s': round(cpu, 3)}
+        if self._ler_rss:
+            self._parar.set()
+            self._thread.join()
+            rss = self._ler_rss()
+            resultado['pico_rss_mb'] = round(max(self._pico, rss) / MB, 1)
+            resultado['rss_final_mb'] = round(rss / MB, 1)
+        if tracemalloc.is_tracing():
+            resultado['pico_python_mb'] = round(tracemalloc.get_traced_memory()[1] / MB, 1)
+
+        contagens = dict(self.contagens)
+        arquivos = self.metricas.arquivos[self._primeiro_arquivo:]
+        if arquivos and not contagens:
+            contagens = {
+                'arquivos': len(arquivos),
+                'bytes': sum(arquivo['bytes'] for arquivo in arquivos),
+                'guias': sum(arquivo['guias'] for arquivo in arquivos),
+                'itens': sum(arquivo['itens'] for arquivo in arquivos),
+            }
+        resultado.update(contagens)
+        for nome, quantidade in contagens.items():
+            resultado[f'{nome}_por_s'] = _por_segundo(quantidade, tempo)
+
+        self.resultado = resultado
+        self.metricas.etapas[self.nome] = resultado
+        return False
+
+
+class _MedidorNulo:
+    """Medidor de etapa da instrumentação desligada"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        return False
+
+    def contar(self, **contagens):
+        pass
+
+
+_MEDIDOR_NULO = _MedidorNulo()
+
+
+def medir_etapa(metricas, nome):
+    """metricas.etapa(nome), ou um medidor que não faz nada se metricas for None"""
+    return metricas.etapa(nome) if metricas is not None else _MEDIDOR_NULO
+
+
+class Metricas:
+    """Métricas de uma execução: etapas, na ordem em que rodaram, e arquivos"""
+
+    def __init__(self):
+        self.ler_rss = funcao_rss()
+        self.inicio = datetime.now()
+        self.etapas = {}
+        self.arquivos = []
+
+    def etapa(self, nome):
+        return MedidorEtapa(self, nome)
+
+    def registrar_arquivo(self, caminho, resultado, tempo_s, cpu_s, rss_mb, origem='xml'):
+        """
+        Registra um arquivo a partir do resultado de processar_arquivo_xml
+        (numero_lote, contas, itens, nome, assinaturas, hashes, guias) e das
+        medidas de medir_chamada
+        """
+        numero_lote, _, itens, nome_arquivo, _, _, guias = resultado
+        tamanho = os.path.getsize(caminho)
+        self.arquivos.append({
+            'arquivo': nome_arquivo,
+            'mes': os.path.basename(os.path.dirname(caminho)),
+            'lote': numero_lote,
+            'origem': origem,
+            'bytes': tamanho,
+            'guias': len(guias),
+            'itens': len(itens),
+            'tempo_s': round(tempo_s, 4),
+            'cpu_s': round(cpu_s, 4),
+            'rss_mb': round(rss_mb, 1),
+            'mb_por_s': _por_segundo(tamanho / MB, tempo_s),
+            'guias_por_s': _por_segundo(len(guias), tempo_s),
+            'itens_por_s': _por_segundo(len(itens), tempo_s),
+        })
+
+    def marcar_lentos(self):
+        """Marca os arquivos lidos com MB/s abaixo de 1/FATOR_LENTIDAO da mediana"""
+        vazoes = [arquivo['mb_por_s'] for arquivo in self.arquivos if arquivo['origem'] == 'xml' and arquivo['mb_por_s']]
+        limite = statistics.median(vazoes) / FATOR_LENTIDAO if vazoes else 0
+        for arquivo in self.arquivos:
+            arquivo['lento'] = (arquivo['origem'] == 'xml' and arquivo['mb_por_s'] is not None
+                                and arquivo['mb_por_s'] < limite)
+        return limite
+
+    def mais_lentos(self, limite=LIMITE_MAIS_LENTOS):
+        """Os arquivos lidos (fora do cache) que mais demoraram"""
+        lidos = [arquivo for arquivo in self.arquivos if arquivo['origem'] == 'xml']
+        return sorted(lidos, key=lambda arquivo: arquivo['tempo_s'], reverse=True)[:limite]
+
+    def por_mes(self):
+        """Totais dos arquivos por pasta de mês, dos meses mais lentos para os mais rápidos"""
+        meses = {}
+        for arquivo in self.arquivos:
+            total = meses.setdefault(arquivo['mes'], {'mes': arquivo['mes'], 'arquivos': 0, 'bytes': 0,
+                                                      'guias': 0, 'itens': 0, 'tempo_s': 0.0})
+            for campo in ('bytes', 'guias', 'itens', 'tempo_s'):
+                total[campo] += arquivo[campo]
+            total['arquivos'] += 1
+        for total in meses.values():
+            total['tempo_s'] = round(total['tempo_s'], 3)
+            total['itens_por_s'] = _por_segundo(total['itens'], total['tempo_s'])
+        return sorted(meses.values(), key=lambda total: total['tempo_s'], reverse=True)
+
+    def relatorio(self):
+        """Resumo da execução (o que vai para o JSON)"""
+        limite = self.marcar_lentos()
+        origens = [arquivo['origem'] for arquivo in self.arquivos]
+        return {
+            'inicio': self.inicio.isoformat(timespec='seconds'),
+            'etapas': self.etapas,
+            'arquivos': {
+                'total': len(self.arquivos),
+                'lidos': origens.count('xml'),
+                'cache': origens.count('cache'),
+                'lentos': sum(arquivo['lento'] for arquivo in self.arquivos),
+                'limite_lento_mb_por_s': round(limite, 3),
+            },
+            'mais_lentos': self.mais_lentos(),
+            'por_mes': self.por_mes(),
+        }
+
+    def gravar(self, caminho_json):
+        """
+        Grava o resumo em caminho_json e os arquivos em <caminho>_arquivos.csv
+        (gravações atômicas). Retorna o caminho do CSV.
+        """
+        relatorio = self.relatorio()
+        caminho_csv = f"{os.path.splitext(caminho_json)[0]}_arquivos.csv"
+        pasta = os.path.dirname(caminho_json)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        temporario = f"{caminho_json}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+        os.replace(temporario, caminho_json)
+
+        temporario = f"{caminho_csv}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8', newline='') as f:
+            escritor = csv.DictWriter(f, fieldnames=COLUNAS_ARQUIVOS)
+            escritor.writeheader()
+            escritor.writerows(self.arquivos)
+        os.replace(temporario, caminho_csv)
+        return caminho_csv
+
+    def imprimir_resumo(self, limite=10):
+        print("\n" + "=" * 70)
+        print("METRICAS DA EXECUCAO")
+        print("=" * 70)
+        for nome, etapa in self.etapas.items():
+            memoria = f"  pico RSS {etapa['pico_rss_mb']:8.1f} MB" if 'pico_rss_mb' in etapa else ''
+            vazao = f"  {etapa['itens_por_s']:10.0f} itens/s" if etapa.get('itens_por_s') else ''
+            print(f"  {nome:<11} {etapa['tempo_s']:8.2f} s  CPU {etapa['cpu_s']:8.2f} s{memoria}{vazao}")
+
+        lentos = self.mais_lentos(limite)
+        if lentos:
+            print("\n  Arquivos mais lentos:")
+            for arquivo in lentos:
+                print(f"    {arquivo['tempo_s']:7.3f} s  {arquivo['bytes'] / MB:7.1f} MB  "
+                      f"{arquivo['itens']:7d} itens  {arquivo['mes']}/{arquivo['arquivo']}")
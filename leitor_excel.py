@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Leitura da exportação de contas do TASY (xlsx)
+
+Só as colunas usadas na comparação são lidas, com os identificadores já
+como texto. O engine calamine (pacote python-calamine) é usado quando
+estiver instalado; senão, o openpyxl padrão do pandas.
+
+Com uma pasta de cache, a planilha lida é gravada em formato colunar
+(Parquet, ou pickle se o pyarrow não estiver instalado), identificada pelo
+nome, tamanho e data de modificação do xlsx e por uma assinatura da versão
+do cache e das colunas lidas. Enquanto nada disso mudar, as execuções
+seguintes carregam esse arquivo em vez de abrir a planilha.
+"""
+
+import os
+import hashlib
+import importlib.util
+
+import pandas as pd
+
+# Colunas lidas do xlsx. Identificadores e descrição como texto; quantidade e
+# preços são convertidos depois com pd.to_numeric (a exportação pode trazer
+# células vazias ou com texto)
+COLUNAS_TEXTO = ['NR_SEQ_PROTOCOLO', 'NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'DS_ITEM']
+COLUNAS_NUMERICAS = ['QT_ITEM', 'PRECO_UNITARIO', 'PRECO_TOTAL']
+COLUNAS_EXCEL = COLUNAS_TEXTO + COLUNAS_NUMERICAS
+
+# Incrementar quando a forma de ler a planilha mudar (tipos, conversões)
+VERSAO_CACHE_EXCEL = 1
+
+
+def _engine_excel():
+    if importlib.util.find_spec('python_calamine') is not None:
+        return 'calamine'
+    return 'openpyxl'
+
+
+def _formato_cache():
+    if importlib.util.find_spec('pyarrow') is not None:
+        return 'parquet'
+    return 'pkl'
+
+
+def _assinatura_leitura():
+    """Resumo curto da versão do cache e das colunas lidas"""
+    texto = repr((VERSAO_CACHE_EXCEL, COLUNAS_TEXTO, COLUNAS_NUMERICAS))
+    return hashlib.md5(texto.encode('utf-8')).hexdigest()[:12]
+
+
+def caminho_cache_excel(pasta_cache, caminho_excel):
+    """Caminho do cache colunar correspondente ao estado atual do xlsx"""
+    st = os.stat(caminho_excel)
+    nome = os.path.splitext(os.path.basename(caminho_excel))[0]
+    return os.path.join(
+        pasta_cache, f"{nome}_{st.st_size}_{st.st_mtime_ns}_{_assinatura_leitura()}.{_formato_cache()}")
+
+
+def ler_excel_tasy(caminho_excel, pasta_cache=None):
+    """
+    Lê a exportação do TASY e retorna (df, veio_do_cache).
+
+    O df tem as colunas de COLUNAS_EXCEL; a planilha não é filtrada nem
+    agrupada aqui.
+    """
+    entrada = caminho_cache_excel(pasta_cache, caminho_excel) if pasta_cache else None
+
+    if entrada and os.path.exists(entrada):
+        try:
+            if entrada.endswith('.parquet'):
+                return pd.read_parquet(entrada), True
+            return pd.read_pickle(entrada), True
+        except Exception as e:
+            print(f"  Cache do Excel ilegivel, relendo a planilha: {e}")
+
+    df = pd.read_excel(
+        caminho_excel,
+        engine=_engine_excel(),
+        usecols=COLUNAS_EXCEL,
+        dtype={coluna: str for coluna in COLUNAS_TEXTO},
+    )
+
+    if entrada:
+        os.makedirs(pasta_cache, exist_ok=True)
+        temporario = f"{entrada}.{os.getpid()}.tmp"
+        if entrada.endswith('.parquet'):
+            df.to_parquet(temporario, index=False)
+        else:
+            df.to_pickle(temporario)
+        os.replace(temporario, entrada)
+
+    return df, False
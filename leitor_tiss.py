@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Leitura em streaming dos arquivos XML TISS (lotes de guias)
+
+Em vez de montar a árvore inteira com ET.parse, cada guia é localizada no
+texto do arquivo (um mmap, sem cópia) e montada sozinha pelo parser em C, a
+partir só do seu trecho; a árvore da guia é descartada antes da próxima,
+então o uso de memória não cresce com o tamanho do lote. O resto do
+arquivo (cabeçalho, numeroLote, epílogo), o "esqueleto", passa por um
+XMLPullParser à parte, que confere a boa formação do documento sem as
+guias. Assim o parser não gera um evento Python por elemento, como no
+iterparse, e a leitura fica no ritmo do ET.parse.
+
+A posição (em bytes) de cada guia no arquivo fica disponível durante a
+iteração, para índices e acesso direto à guia.
+
+A busca das guias no texto não enxerga comentários, CDATA, DOCTYPE nem
+instruções de processamento: um texto com cara de tag de guia dentro deles
+seria tomado por uma guia. Arquivos com algum desses ('<!', ou '<?' depois
+da declaração; nenhum no xml/) são lidos por um XMLPullParser sobre o
+documento inteiro, mais lento e sem a posição das guias.
+
+Com essa posição, ler_guia e formatar_guia trazem uma única guia do
+arquivo (seek + read), sem passar pelo resto do lote.
+
+Na mesma passada o leitor pode calcular o hash do padrão TISS (MD5 do
+conteúdo de todos os campos da mensagem, sem as tags e sem o epílogo, em
+ISO-8859-1) para conferir com o valor de epilogo/hash.
+"""
+
+import re
+import mmap
+import hashlib
+import xml.etree.ElementTree as ET
+
+NS_TISS = 'http://www.ans.gov.br/padroes/tiss/schemas'
+NS = {'ans': NS_TISS}
+ET.register_namespace('ans', NS_TISS)
+
+TAG_NUMERO_LOTE = f'{{{NS_TISS}}}numeroLote'
+TAG_HASH_EPILOGO = f'{{{NS_TISS}}}hash'
+TAG_CODIGO_DESPESA = f'{{{NS_TISS}}}codigoDespesa'
+TAG_SERVICOS_EXECUTADOS = f'{{{NS_TISS}}}servicosExecutados'
+# Tags completas lidas em cada guia: com elas, find e iter vão direto ao
+# parser em C, sem interpretar um caminho './/ans:' a cada chamada
+TAG_NUMERO_GUIA = f'{{{NS_TISS}}}numeroGuiaPrestador'
+TAG_NUMERO_CARTEIRA = f'{{{NS_TISS}}}numeroCarteira'
+TAG_CONTRATADO_EXECUTANTE = f'{{{NS_TISS}}}contratadoExecutante'
+TAG_CODIGO_PRESTADOR = f'{{{NS_TISS}}}codigoPrestadorNaOperadora'
+TAG_PROCEDIMENTO_EXECUTADO = f'{{{NS_TISS}}}procedimentoExecutado'
+TAG_DESPESA = f'{{{NS_TISS}}}despesa'
+CODIFICACAO_HASH = 'iso-8859-1'
+NOMES_GUIA = ('guiaSP-SADT', 'guiaConsulta', 'guiaResumoInternacao')
+TAGS_GUIA = {f'{{{NS_TISS}}}{nome}' for nome in NOMES_GUIA}
+
+# Tag de abertura das guias no texto do arquivo (com qualquer prefixo de
+# namespace). As guias não se aninham, então o fechamento é o primeiro
+# '</' + nome depois da abertura (procurado com find, bem mais rápido que
+# uma regex sobre a guia).
+_NOMES_GUIA_RE = b'|'.join(re.escape(nome.encode('ascii')) for nome in NOMES_GUIA)
+_INICIO_GUIA = re.compile(rb'<((?:[\w.-]+:)?(?:' + _NOMES_GUIA_RE + rb'))[\s>]')
+_CODIFICACAO_XML = re.compile(rb'<\?xml[^>]*encoding=["\']([\w.-]+)["\']')
+# Bloco do arquivo entregue por vez ao parser da leitura completa
+_TAMANHO_BLOCO = 1 << 20
+
+
+def _atualizar_hash(md5, elementos):
+    """Acrescenta ao MD5 o texto dos elementos folha (sem o hash do epílogo)"""
+    # O texto entra como está no arquivo, sem strip. O MD5 de textos
+    # concatenados é o mesmo de atualizações separadas: juntar a guia toda
+    # numa só codificação e num só update custa metade do laço por elemento.
+    md5.update(''.join([
+        texto for elemento in elementos
+        if (texto := elemento.text) is not None and not len(elemento) and elemento.tag != TAG_HASH_EPILOGO
+    ]).encode(CODIFICACAO_HASH, 'replace'))
+
+
+class LeitorTISS:
+    """
+    Leitor de um lote TISS em uma única passada.
+
+    Iterar sobre o leitor gera as guias na ordem do documento. Os dados do
+    lote (numero_lote) ficam disponíveis como atributos assim que lidos, e
+    permanecem válidos mesmo quando o arquivo não tem nenhuma guia.
+
+    Cada guia é uma árvore à parte, que só é guardada até a próxima ser
+    pedida. Enquanto isso, posicao_guia tem o (inicio, fim) da guia no
+    arquivo, em bytes, do '<' da abertura até depois do '>' do fechamento.
+
+    Com verificar_hash, ao fim da iteração hash_calculado tem o hash TISS
+    do conteúdo (hexadecimal minúsculo) e hash_epilogo o valor declarado no
+    arquivo (None se não houver epílogo).
+    """
+
+    def __init__(self, caminho_xml, verificar_hash=False):
+        self.caminho_xml = caminho_xml
+        self.verificar_hash = verificar_hash
+        self.numero_lote = None
+        self.hash_epilogo = None
+        self.hash_calculado = None
+        self.posicao_guia = None
+        self._lote_lido = False
+
+    def __iter__(self):
+        with open(self.caminho_xml, 'rb') as arquivo, \
+                mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as dados:
+            yield from self._iterar(dados)
+
+    def _iterar(self, dados):
+        md5 = hashlib.md5() if self.verificar_hash else None
+        declaracao = _CODIFICACAO_XML.search(dados, 0, 200)
+        codificacao = declaracao.group(1).decode('ascii') if declaracao else 'utf-8'
+        if dados.find(b'<!') >= 0 or dados.find(b'<?', declaracao.end() if declaracao else 0) >= 0:
+            yield from self._iterar_completo(dados, md5)
+        else:
+            yield from self._iterar_guias(dados, codificacao, md5)
+        if md5 is not None:
+            self.hash_calculado = md5.hexdigest()
+
+    def _iterar_guias(self, dados, codificacao, md5):
+        """Guias localizadas no texto e montadas uma a uma (ver o cabeçalho do módulo)"""
+        # Esqueleto: o documento sem as guias, com os prefixos de namespace
+        # declarados nele (as guias são montadas dentro dessas declarações).
+        # Os elementos abertos ficam numa pilha: o que contém guias não é
+        # folha, mesmo vazio no esqueleto.
+        esqueleto = ET.XMLPullParser(events=('start-ns', 'start', 'end'))
+        self._abertos = []
+        self._com_guias = set()
+        prefixos = {}
+        abertura = None
+
+        posicao = 0
+        while True:
+            inicio = _INICIO_GUIA.search(dados, posicao)
+            esqueleto.feed(dados[posicao:inicio.start() if inicio else len(dados)])
+            if self._ler_esqueleto(esqueleto, prefixos, md5):
+                abertura = None
+            if inicio is None:
+                break
+            if self._abertos:
+                self._com_guias.add(self._abertos[-1])
+
+            fechamento = dados.find(b'</' + inicio.group(1), inicio.end())
+            fim = dados.find(b'>', fechamento) + 1 if fechamento >= 0 else 0
+            if not fim:
+                raise ET.ParseError(f"guia sem fechamento (byte {inicio.start()})")
+            if abertura is None:
+                declaracoes = ' '.join(f'xmlns:{prefixo}="{uri}"' if prefixo else f'xmlns="{uri}"'
+                                       for prefixo, uri in prefixos.items())
+                abertura = f'<?xml version="1.0" encoding="{codificacao}"?><guias {declaracoes}>'.encode(codificacao)
+
+            parser = ET.XMLParser()
+            parser.feed(abertura)
+            parser.feed(dados[inicio.start():fim])
+            parser.feed(b'</guias>')
+            guia = parser.close()[0]
+            if md5 is not None:
+                _atualizar_hash(md5, guia.iter())
+            posicao = fim
+            if guia.tag in TAGS_GUIA:
+                self.posicao_guia = (inicio.start(), fim)
+                yield guia
+
+        esqueleto.close()
+        self._ler_esqueleto(esqueleto, prefixos, md5)
+
+    def _iterar_completo(self, dados, md5):
+        """
+        Guias de um XMLPullParser sobre o documento inteiro, para os arquivos
+        com comentário, CDATA, DOCTYPE ou instrução de processamento.
+        posicao_guia fica None.
+        """
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        abertos = []
+        for bloco in range(0, len(dados), _TAMANHO_BLOCO):
+            parser.feed(dados[bloco:bloco + _TAMANHO_BLOCO])
+            yield from self._ler_completo(parser, abertos, md5)
+        parser.close()
+        yield from self._ler_completo(parser, abertos, md5)
+
+    def _ler_completo(self, parser, abertos, md5):
+        """Consome os eventos da leitura completa e gera as guias fechadas"""
+        for evento, elemento in parser.read_events():
+            if evento == 'start':
+                abertos.append(elemento)
+                continue
+            abertos.pop()
+            if md5 is not None:
+                _atualizar_hash(md5, (elemento,))
+            tag = elemento.tag
+            if tag in TAGS_GUIA:
+                self.posicao_guia = None
+                yield elemento
+                # Descartada depois de usada; o nó vazio fica no pai, que
+                # assim não passa por folha no hash
+                elemento.clear()
+            elif tag == TAG_HASH_EPILOGO:
+                self.hash_epilogo = elemento.text.strip() if elemento.text else None
+            elif (tag == TAG_NUMERO_LOTE and not self._lote_lido
+                  and not any(aberto.tag in TAGS_GUIA for aberto in abertos)):
+                self.numero_lote = elemento.text.strip() if elemento.text else None
+                self._lote_lido = True
+
+    def _ler_esqueleto(self, esqueleto, prefixos, md5):
+        """
+        Consome os eventos do esqueleto: numeroLote, hash do epílogo, os
+        campos do hash e os prefixos declarados. Retorna se algum prefixo
+        novo foi declarado.
+        """
+        novos = False
+        for evento, dado in esqueleto.read_events():
+            if evento == 'start-ns':
+                prefixos[dado[0]] = dado[1]
+                novos = True
+                continue
+            if evento == 'start':
+                self._abertos.append(dado)
+                continue
+            self._abertos.pop()
+            tag = dado.tag
+            if tag == TAG_HASH_EPILOGO:
+                self.hash_epilogo = dado.text.strip() if dado.text else None
+            elif tag == TAG_NUMERO_LOTE and not self._lote_lido:
+                self.numero_lote = dado.text.strip() if dado.text else None
+                self._lote_lido = True
+            if md5 is not None and dado not in self._com_guias:
+                _atualizar_hash(md5, (dado,))
+        return novos
+
+
+def ler_guia(caminho_xml, inicio, fim):
+    """Bytes de uma guia do arquivo, pela posição de LeitorTISS.posicao_guia"""
+    with open(caminho_xml, 'rb') as arquivo:
+        arquivo.seek(inicio)
+        return arquivo.read(fim - inicio)
+
+
+def formatar_guia(caminho_xml, inicio, fim):
+    """
+    Texto XML indentado de uma guia do arquivo, lendo só o trecho da guia.
+    O trecho é decodificado com o encoding declarado no arquivo (o TISS usa
+    ISO-8859-1) e o prefixo do namespace é declarado de novo ao redor dele.
+    """
+    with open(caminho_xml, 'rb') as arquivo:
+        declaracao = _CODIFICACAO_XML.search(arquivo.read(200))
+    codificacao = declaracao.group(1).decode('ascii') if declaracao else 'utf-8'
+
+    trecho = ler_guia(caminho_xml, inicio, fim).decode(codificacao)
+    prefixo = re.match(r'<(?:([\w.-]+):)?', trecho).group(1)
+    atributo = f'xmlns:{prefixo}' if prefixo else 'xmlns'
+    guia = ET.fromstring(f'<trecho {atributo}="{NS_TISS}">{trecho}</trecho>')[0]
+    ET.indent(guia)
+    return ET.tostring(guia, encoding='unicode')
+
+
+def _tag(nome):
+    return f'{{{NS_TISS}}}{nome}'
+
+
+# Campos lidos de cada procedimentoExecutado/servicosExecutados, na ordem
+# devolvida por ler_campos_item. No TISS 4.01 o código do prestador vem da
+# equipe (equipeSadt/codProfissional ou identEquipe/identificacaoEquipe/
+# codProfissional) e o código do item fica em procedimento/ no SP-SADT e na
+# internação, ou direto no nó em servicosExecutados.
+CAMPOS_ITEM = (
+    'codigoPrestadorNaOperadora',
+    'codigoProcedimento',
+    'quantidadeExecutada',
+    'valorUnitario',
+    'valorTotal',
+    'reducaoAcrescimo',
+)
+_POSICAO_CAMPO_ITEM = {_tag(campo): i for i, campo in enumerate(CAMPOS_ITEM)}
+
+
+def ler_campos_item(no):
+    """
+    Lê um procedimentoExecutado ou servicosExecutados em uma única passada
+    pela subárvore e retorna os textos de CAMPOS_ITEM:
+    (cod_prestador, codigo, quantidade, valor_unitario, valor_total,
+    reducao_acrescimo).
+
+    Cada campo recebe a primeira ocorrência na ordem do documento, o mesmo
+    resultado de uma busca './/ans:campo' por campo, sem varrer o nó várias vezes.
+    """
+    valores = [None] * len(CAMPOS_ITEM)
+    lidos = [False] * len(CAMPOS_ITEM)
+    posicao_campo = _POSICAO_CAMPO_ITEM
+
+    for elemento in no.iter():
+        i = posicao_campo.get(elemento.tag)
+        if i is not None and not lidos[i]:
+            lidos[i] = True
+            texto = elemento.text
+            valores[i] = texto.strip() if texto else None
+
+    return tuple(valores)
+
+
+# Campos do bloco valorTotal da guia (SP-SADT e resumo de internação), na
+# ordem devolvida por ler_valor_total. Cada guia traz só parte deles: o
+# SP-SADT sem despesas costuma ter só valorProcedimentos e valorTotalGeral.
+CAMPOS_VALOR_TOTAL = (
+    'valorProcedimentos',
+    'valorDiarias',
+    'valorTaxasAlugueis',
+    'valorMateriais',
+    'valorMedicamentos',
+    'valorOPME',
+    'valorGasesMedicinais',
+    'valorTotalGeral',
+)
+_POSICAO_CAMPO_VALOR_TOTAL = {_tag(campo): i for i, campo in enumerate(CAMPOS_VALOR_TOTAL)}
+_TAG_VALOR_TOTAL = _tag('valorTotal')
+
+
+def ler_valor_total(guia):
+    """
+    Textos do bloco valorTotal da guia, na ordem de CAMPOS_VALOR_TOTAL (None
+    nos campos ausentes), ou None se a guia não tiver o bloco (ex.: guia
+    de consulta). Só o filho direto da guia: o valorTotal dos itens é outro
+    campo, com o mesmo nome.
+    """
+    bloco = guia.find(_TAG_VALOR_TOTAL)
+    if bloco is None or len(bloco) == 0:
+        return None
+
+    valores = [None] * len(CAMPOS_VALOR_TOTAL)
+    for elemento in bloco:
+        i = _POSICAO_CAMPO_VALOR_TOTAL.get(elemento.tag)
+        if i is not None:
+            valores[i] = elemento.text.strip() if elemento.text else None
+    return tuple(valores)
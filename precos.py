@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Funções vetorizadas sobre colunas de preço
+
+Operam sobre a coluna inteira de uma vez (numpy/pandas), em vez de chamar
+uma função Python por linha com .apply.
+
+Valores e quantidades circulam como inteiros de ponto fixo (int64), da
+leitura até o agrupamento e o merge: valores em centavos e quantidades em
+décimos de milésimo (o TISS usa até 2 casas nos valores e até 4 na
+quantidadeExecutada). Somas, faixas de tolerância e comparações são
+exatas; a conversão para reais só acontece na montagem das abas.
+"""
+
+import re
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+ESCALA_VALOR = 100
+ESCALA_QTD = 10000
+# reducaoAcrescimo: fator com 2 casas (1.30 = 130)
+ESCALA_FATOR = 100
+
+_NUMERO_DECIMAL = re.compile(r'\s*([-+]?)(\d*)(?:\.(\d*))?\s*$')
+
+
+# Os mesmos textos se repetem muito entre os itens (no xml/, 1,2 milhão de
+# conversões para 18 mil textos distintos): o resultado fica memorizado
+@lru_cache(maxsize=1 << 16)
+def texto_para_inteiro(texto, escala):
+    """
+    Número decimal em texto como inteiro na escala (ex.: '155.7' com
+    ESCALA_VALOR vira 15570), sem passar por float. Casas além da escala
+    são arredondadas (meio para longe do zero). ValueError se o texto não
+    for um número.
+    """
+    casas = len(str(escala)) - 1
+    # Caso comum (positivo, sem espaços): sem regex
+    inteiro, _, fracao = texto.partition('.')
+    if inteiro.isdigit() and len(fracao) <= casas and (not fracao or fracao.isdigit()):
+        return int(inteiro) * escala + int(fracao.ljust(casas, '0') or '0')
+
+    numero = _NUMERO_DECIMAL.match(texto)
+    if numero and (numero.group(2) or numero.group(3)):
+        sinal, inteiro, fracao = numero.groups()
+        fracao = fracao or ''
+        if len(fracao) <= casas:
+            valor = int(inteiro or '0') * escala + int(fracao.ljust(casas, '0') or '0')
+            return -valor if sinal == '-' else valor
+    try:
+        return int(Decimal(texto.strip()).scaleb(casas).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"numero invalido: {texto!r}") from None
+
+
+def para_inteiros(valores, escala):
+    """
+    Coluna numérica (float, ex.: lida do xlsx) como int64 na escala. Os
+    valores têm no máximo as casas da escala, então arredondar valor * escala
+    devolve o inteiro exato, sem o ruído do float.
+    """
+    return np.round(np.asarray(valores, dtype=np.float64) * escala).astype(np.int64)
+
+
+def total_do_item(quantidade, valor_unitario, fator=ESCALA_FATOR):
+    """
+    valorTotal em centavos de quantidade (ESCALA_QTD) x valor unitário
+    (centavos) x fator de redução/acréscimo (ESCALA_FATOR), meio para cima
+    """
+    escala = ESCALA_QTD * ESCALA_FATOR
+    produto = quantidade * valor_unitario * fator
+    return (produto + escala // 2) // escala if produto >= 0 else -((-produto + escala // 2) // escala)
+
+
+def produtos_dos_itens(quantidades, valores_unitarios, fatores):
+    """
+    quantidade x valor unitário x fator de cada item, exato, em centavos
+    vezes ESCALA_QTD * ESCALA_FATOR (int64; cabe com folga para valores de
+    itens de conta)
+    """
+    return (np.asarray(quantidades, dtype=np.int64) * np.asarray(valores_unitarios, dtype=np.int64)
+            * np.asarray(fatores, dtype=np.int64))
+
+
+def _totais_conferem_com_fator(quantidades, valores_unitarios, fatores, valores_totais):
+    """Máscara de totais_conferem para um único fator (array ou escalar)"""
+    escala = ESCALA_QTD * ESCALA_FATOR
+    produtos = produtos_dos_itens(quantidades, valores_unitarios, fatores)
+    diferencas = np.abs(np.asarray(valores_totais, dtype=np.int64) * escala - produtos)
+    folga = np.abs(np.asarray(quantidades, dtype=np.int64) * np.asarray(fatores, dtype=np.int64)) + escala
+    return 2 * diferencas <= folga
+
+
+def totais_conferem(quantidades, valores_unitarios, fatores, valores_totais):
+    """
+    Máscara dos itens cujo valor total (centavos) confere com quantidade x
+    valor unitário, com ou sem o fator. A TISS manda aplicar o
+    reducaoAcrescimo ao total, mas nos lotes reais o valorUnitario já vem
+    com o acréscimo (no xml/, os 2007 itens com 1.30 fecham sem o fator);
+    as duas leituras são aceitas. A diferença aceita é só a dos
+    arredondamentos para centavos: meio centavo no total e meio centavo no
+    valor unitário, multiplicado pela quantidade e pelo fator (ex.:
+    728.3318 x 0.00 com total 0.69, de um unitário de fato menor que meio
+    centavo).
+    """
+    return (_totais_conferem_com_fator(quantidades, valores_unitarios, fatores, valores_totais)
+            | _totais_conferem_com_fator(quantidades, valores_unitarios, ESCALA_FATOR, valores_totais))
+
+
+def arredondar_centavos_com_tolerancia(centavos):
+    """
+    Arredonda os preços (em centavos) para cima, para o próximo múltiplo
+    de 2 centavos, para agrupar valores com diferença de 1 centavo (25 e
+    26 viram 26). Mesmo critério do antigo ceil(preco / 0.02) * 0.02, em
+    aritmética inteira.
+
+    Aceita Series ou array de inteiros; retorna o mesmo tipo (Series com o
+    mesmo índice).
+    """
+    valores = np.asarray(centavos, dtype=np.int64)
+    resultado = -(-valores // 2) * 2
+
+    if isinstance(centavos, pd.Series):
+        return pd.Series(resultado, index=centavos.index, name=centavos.name)
+    return resultado
+
+
+def numerar_grupos_com_tolerancia(df, colunas_chave, tolerancia, coluna_preco='PRECO_UNITARIO'):
+    """
+    Numera os grupos de preço com um único contador corrido (1, 2, 3, ...)
+    para o df inteiro, como o laço original: o número não recomeça a cada
+    chave, então identifica o grupo sozinho, sem precisar da chave junto.
+
+    O df precisa estar ordenado por colunas_chave e depois pelo preço. Um
+    grupo novo começa quando a chave muda ou quando o preço se afasta mais
+    que a tolerância do primeiro preço do grupo (a âncora).
+
+    Uma diferença maior que a tolerância entre dois preços vizinhos sempre
+    abre grupo, o que é resolvido de forma vetorizada. Só os trechos sem
+    esse tipo de salto cuja amplitude total passa da tolerância precisam
+    percorrer a âncora, e esses são raros.
+
+    Retorna um array int64 alinhado às linhas do df.
+    """
+    n = len(df)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    chave = df.groupby(list(colunas_chave), sort=False, dropna=False).ngroup().to_numpy()
+    precos = df[coluna_preco].to_numpy(dtype=np.float64)
+
+    inicio_grupo = np.ones(n, dtype=bool)
+    inicio_grupo[1:] = (chave[1:] != chave[:-1]) | ((precos[1:] - precos[:-1]) > tolerancia)
+
+    # Trechos entre saltos: se a amplitude cabe na tolerância, é um grupo só
+    inicios = np.flatnonzero(inicio_grupo)
+    fins = np.append(inicios[1:], n)
+    largos = (precos[fins - 1] - precos[inicios]) > tolerancia
+
+    for inicio, fim in zip(inicios[largos], fins[largos]):
+        ancora = precos[inicio]
+        for i in range(inicio + 1, fim):
+            if abs(precos[i] - ancora) > tolerancia:
+                inicio_grupo[i] = True
+                ancora = precos[i]
+
+    return np.cumsum(inicio_grupo, dtype=np.int64)
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+Executa várias comparações Excel (TASY) vs XML (TISS) num só processo
+
+Cada trabalho tem sua pasta de XMLs, exportação do TASY, relatório de
+saída, código de prestador, contas ignoradas e tolerância de preço. Os
+trabalhos que usam a mesma pasta de XMLs compartilham uma única leitura (e
+o mesmo cache): a leitura dos XMLs não depende do prestador nem das contas
+ignoradas, que são aplicados na consolidação. N prestadores sobre o mesmo
+conjunto de XMLs custam uma leitura e N filtros. Com
+--resumo-prestadores, as contagens de cada prestador presente nos XMLs
+saem da mesma leitura. Com arquivo_indice (ou --indice), o índice das
+contas (indice_xml.py) de cada pasta de XMLs é atualizado no fim, a partir
+do mesmo cache.
+
+Cada trabalho pode ainda comparar em_camadas, desligar a conferência do
+hash TISS (verificar_hash), gravar as métricas da execução (metricas: true
+para <arquivo_saida>_metricas.json, ou o caminho do JSON) e rodar no modo
+incremental (pasta_estado: pasta do estado de comparar_contas_incremental,
+um por trabalho). A leitura compartilhada é medida no trabalho que a faz.
+
+Uso com arquivo de configuração (JSON):
+
+    python reconciliar.py --config trabalhos.json
+
+    {
+      "pasta_cache": ".cache_xml",
+      "workers": 4,
+      "arquivo_indice": "indice_xml.sqlite",
+      "padrao": {"pasta_xml": "xml", "contas_ignorar": [74078, 75059, 60282]},
+      "trabalhos": [
+        {"nome": "unimed", "arquivo_excel": "unimed.xlsx",
+         "arquivo_saida": "saida/unimed.xlsx", "codigo_prestador": "110020",
+         "colunar": ["parquet", "csv"], "word": "saida/unimed.docx", "metricas": true},
+        {"nome": "mensal", "arquivo_excel": "unimed.xlsx", "arquivo_saida": "saida/mensal.xlsx",
+         "pasta_estado": ".estado_mensal"}
+      ]
+    }
+
+Caminhos relativos são resolvidos a partir da pasta do arquivo de
+configuração. Sem --config, um trabalho por --prestador é montado a partir
+das opções de linha de comando.
+"""
+
+import os
+import sys
+import json
+import argparse
+
+import comparar_contas_v3 as v3
+import comparar_contas_incremental as incremental
+import indice_xml
+from instrumentacao import Metricas, medir_etapa
+from saida_colunar import FORMATOS_PADRAO, FORMATOS_SUPORTADOS
+
+# Campos de um trabalho e seus valores padrão
+CAMPOS_TRABALHO = {
+    'nome': '',
+    'pasta_xml': None,
+    'arquivo_excel': None,
+    'arquivo_saida': None,
+    'codigo_prestador': v3.CODIGO_PRESTADOR_VALIDO,
+    'contas_ignorar': sorted(v3.CONTAS_IGNORAR),
+    'tolerancia_preco': v3.TOLERANCIA_PRECO,
+    'usar_executante': False,
+    'colunar': None,
+    'word': None,
+    'em_camadas': False,
+    'verificar_hash': True,
+    'metricas': None,
+    'pasta_estado': None,
+}
+CAMPOS_OBRIGATORIOS = ('pasta_xml', 'arquivo_excel', 'arquivo_saida')
+CAMPOS_CAMINHO = ('pasta_xml', 'arquivo_excel', 'arquivo_saida', 'word', 'pasta_estado')
+CAMPOS_CONFIGURACAO = ('pasta_cache', 'workers', 'arquivo_indice', 'padrao', 'trabalhos')
+
+
+def montar_trabalho(dados, padrao=None, pasta_base=None):
+    """Valida um trabalho, completa os valores padrão e resolve os caminhos"""
+    desconhecidos = set(dados) - set(CAMPOS_TRABALHO)
+    if desconhecidos:
+        raise ValueError(f"Campo(s) desconhecido(s) no trabalho: {', '.join(sorted(desconhecidos))}")
+
+    trabalho = dict(CAMPOS_TRABALHO)
+    trabalho.update(padrao or {})
+    trabalho.update(dados)
+
+    faltando = [campo for campo in CAMPOS_OBRIGATORIOS if not trabalho[campo]]
+    if faltando:
+        raise ValueError(f"Trabalho sem {', '.join(faltando)}")
+
+    for campo in CAMPOS_CAMINHO:
+        if trabalho[campo] and pasta_base and not os.path.isabs(trabalho[campo]):
+            trabalho[campo] = os.path.join(pasta_base, trabalho[campo])
+
+    if isinstance(trabalho['colunar'], str):
+        trabalho['colunar'] = trabalho['colunar'].split(',')
+    if trabalho['colunar']:
+        invalidos = set(trabalho['colunar']) - set(FORMATOS_SUPORTADOS)
+        if invalidos:
+            raise ValueError(f"Formato(s) colunar(es) nao suportado(s): {', '.join(sorted(invalidos))}")
+
+    trabalho['codigo_prestador'] = str(trabalho['codigo_prestador'])
+    trabalho['contas_ignorar'] = {int(conta) for conta in trabalho['contas_ignorar']}
+    trabalho['tolerancia_preco'] = float(trabalho['tolerancia_preco'])
+    trabalho['usar_executante'] = bool(trabalho['usar_executante'])
+    trabalho['em_camadas'] = bool(trabalho['em_camadas'])
+    trabalho['verificar_hash'] = bool(trabalho['verificar_hash'])
+    if trabalho['pasta_estado'] and (trabalho['em_camadas'] or not trabalho['verificar_hash']):
+        raise ValueError("Trabalho incremental (pasta_estado) nao aceita em_camadas nem verificar_hash false")
+
+    metricas = trabalho['metricas']
+    if metricas is True or metricas == '':
+        metricas = f"{os.path.splitext(trabalho['arquivo_saida'])[0]}_metricas.json"
+    elif metricas and pasta_base and not os.path.isabs(metricas):
+        metricas = os.path.join(pasta_base, metricas)
+    trabalho['metricas'] = metricas or None
+
+    if not trabalho['nome']:
+        trabalho['nome'] = os.path.splitext(os.path.basename(trabalho['arquivo_saida']))[0]
+    return trabalho
+
+
+def carregar_configuracao(caminho):
+    """Lê o arquivo JSON e retorna (trabalhos, pasta_cache, workers, arquivo_indice)"""
+    with open(caminho, encoding='utf-8') as f:
+        configuracao = json.load(f)
+
+    desconhecidos = set(configuracao) - set(CAMPOS_CONFIGURACAO)
+    if desconhecidos:
+        raise ValueError(f"Campo(s) desconhecido(s) na configuracao: {', '.join(sorted(desconhecidos))}")
+    if not configuracao.get('trabalhos'):
+        raise ValueError("A configuracao nao tem trabalhos")
+
+    pasta_base = os.path.dirname(os.path.abspath(caminho))
+    padrao = configuracao.get('padrao', {})
+    trabalhos = [montar_trabalho(dados, padrao, pasta_base) for dados in configuracao['trabalhos']]
+
+    pasta_cache = configuracao.get('pasta_cache', '.cache_xml')
+    if pasta_cache and not os.path.isabs(pasta_cache):
+        pasta_cache = os.path.join(pasta_base, pasta_cache)
+    arquivo_indice = configuracao.get('arquivo_indice')
+    if arquivo_indice and not os.path.isabs(arquivo_indice):
+        arquivo_indice = os.path.join(pasta_base, arquivo_indice)
+    return trabalhos, pasta_cache, configuracao.get('workers', 1), arquivo_indice
+
+
+def trabalhos_da_linha_de_comando(args):
+    """Um trabalho por --prestador; com mais de um, o código entra no nome dos arquivos"""
+    prestadores = args.prestador or [v3.CODIGO_PRESTADOR_VALIDO]
+    trabalhos = []
+    for prestador in prestadores:
+        saida, word, metricas, pasta_estado = args.saida, args.word, args.metricas, args.pasta_estado
+        if len(prestadores) > 1:
+            saida, word, metricas, pasta_estado = (
+                f"{os.path.splitext(caminho)[0]}_{prestador}{os.path.splitext(caminho)[1]}" if caminho else caminho
+                for caminho in (saida, word, metricas, pasta_estado)
+            )
+        dados = {
+            'nome': prestador,
+            'pasta_xml': args.pasta_xml,
+            'arquivo_excel': args.excel,
+            'arquivo_saida': saida,
+            'codigo_prestador': prestador,
+            'colunar': args.colunar.split(',') if args.colunar else None,
+            'word': word,
+            'usar_executante': args.usar_executante,
+            'em_camadas': args.em_camadas,
+            'verificar_hash': not args.sem_verificar_hash,
+            'metricas': metricas,
+            'pasta_estado': pasta_estado,
+        }
+        if args.contas_ignorar is not None:
+            dados['contas_ignorar'] = [conta for conta in args.contas_ignorar.split(',') if conta]
+        if args.tolerancia is not None:
+            dados['tolerancia_preco'] = args.tolerancia
+        trabalhos.append(montar_trabalho(dados))
+    return trabalhos
+
+
+def ler_pasta_xml(pasta_xml, workers=1, pasta_cache=None, verificar_hash=True, metricas=None):
+    """Lê (ou carrega do cache) todos os XMLs da pasta: (resultados por arquivo, estatisticas)"""
+    print("=" * 70)
+    print(f"ETAPA 1: Extraindo dados dos arquivos XML de {pasta_xml}")
+    print("=" * 70)
+    estatisticas = {} if pasta_cache else None
+    caminhos = v3.listar_arquivos_xml(pasta_xml)
+    if workers > 1:
+        print(f"  Usando {workers} processos")
+    resultados = v3.processar_arquivos_xml(caminhos, workers, pasta_cache, estatisticas, verificar_hash, metricas)
+    return list(resultados), estatisticas
+
+
+def imprimir_resumo_prestadores(resultados, arquivo_csv=None):
+    """Mostra as contagens por prestador e, com arquivo_csv, grava a tabela"""
+    resumo = v3.resumir_prestadores(resultados)
+    print("\n  Itens por codigo de prestador (procedimento; so na guia = pelo executante):")
+    print(resumo.to_string(index=False, max_rows=40))
+    if arquivo_csv:
+        resumo.to_csv(arquivo_csv, index=False, encoding='utf-8')
+        print(f"  Resumo por prestador salvo em: {arquivo_csv}")
+
+
+def executar_incremental(trabalho, workers=1, pasta_cache=None):
+    """Trabalho com pasta_estado: comparação incremental (comparar_contas_incremental)"""
+    metricas = Metricas() if trabalho['metricas'] else None
+    with medir_etapa(metricas, 'incremental'):
+        resultados_comparacao = incremental.executar(
+            workers=workers, usar_cache=pasta_cache is not None, formatos_colunares=trabalho['colunar'],
+            trabalho=trabalho, pasta_cache=pasta_cache
+        )
+    if trabalho['word']:
+        with medir_etapa(metricas, 'word'):
+            v3.gerar_relatorio_executivo(resultados_comparacao[0], resultados_comparacao[1], trabalho['word'],
+                                         df_duplicados=resultados_comparacao[6])
+    gravar_metricas(metricas, trabalho['metricas'])
+
+
+def gravar_metricas(metricas, arquivo_metricas):
+    """Mostra e grava as métricas de um trabalho (nada sem metricas)"""
+    if metricas is None:
+        return
+    metricas.imprimir_resumo()
+    arquivo_csv = metricas.gravar(arquivo_metricas)
+    print(f"\n  Metricas salvas em: {arquivo_metricas} e {arquivo_csv}")
+
+
+def executar_trabalhos(trabalhos, workers=1, pasta_cache=None, leituras=None):
+    """
+    Executa os trabalhos na ordem, lendo cada pasta de XMLs uma única vez.
+    leituras pode trazer pastas já lidas ({pasta_xml: ler_pasta_xml(...)}).
+    Os trabalhos incrementais (com pasta_estado) leem as pastas de mês pelo
+    próprio estado e não entram na leitura compartilhada.
+    """
+    # Quantos trabalhos ainda vão usar cada pasta: a leitura é liberada
+    # depois do último. O hash só é conferido se algum deles usar a aba 8.
+    usos_restantes = {}
+    verificar_hash = {}
+    for trabalho in trabalhos:
+        if trabalho['pasta_estado']:
+            continue
+        pasta_xml = trabalho['pasta_xml']
+        usos_restantes[pasta_xml] = usos_restantes.get(pasta_xml, 0) + 1
+        verificar_hash[pasta_xml] = verificar_hash.get(pasta_xml, False) or trabalho['verificar_hash']
+
+    leituras = dict(leituras or {})
+    for numero, trabalho in enumerate(trabalhos, start=1):
+        pasta_xml = trabalho['pasta_xml']
+
+        print("\n" + "#" * 70)
+        print(f"TRABALHO {numero}/{len(trabalhos)}: {trabalho['nome']} "
+              f"(prestador {trabalho['codigo_prestador']})")
+        print("#" * 70)
+
+        if trabalho['pasta_estado']:
+            executar_incremental(trabalho, workers, pasta_cache)
+            continue
+
+        metricas = Metricas() if trabalho['metricas'] else None
+        if pasta_xml not in leituras:
+            with medir_etapa(metricas, 'extracao'):
+                leituras[pasta_xml] = ler_pasta_xml(pasta_xml, workers, pasta_cache, verificar_hash[pasta_xml],
+                                                    metricas)
+        else:
+            print("=" * 70)
+            print(f"ETAPA 1: Reaproveitando a leitura dos XMLs de {pasta_xml}")
+            print("=" * 70)
+        resultados, estatisticas = leituras[pasta_xml]
+
+        with medir_etapa(metricas, 'consolidacao'):
+            (itens_xml, protocolos_xml, contas_xml, arquivos_por_protocolo,
+             protocolos_duplicados, protocolo_por_conta_xml, contas_por_arquivo,
+             assinaturas_por_protocolo, hashes_por_arquivo, posicoes_guias,
+             totais_guias) = v3.consolidar_arquivos_xml(
+                resultados, estatisticas,
+                cod_prestador=trabalho['codigo_prestador'],
+                contas_ignorar=trabalho['contas_ignorar'],
+                usar_executante=trabalho['usar_executante']
+            )
+
+        usos_restantes[pasta_xml] -= 1
+        if not usos_restantes[pasta_xml]:
+            del leituras[pasta_xml]
+
+        with medir_etapa(metricas, 'excel') as etapa:
+            (df_excel_agrupado, df_excel_original, protocolos_excel,
+             contas_excel, protocolo_por_conta_excel) = v3.processar_excel(
+                pasta_cache=pasta_cache,
+                arquivo_excel=trabalho['arquivo_excel'],
+                contas_ignorar=trabalho['contas_ignorar']
+            )
+            etapa.contar(linhas=len(df_excel_original))
+
+        with medir_etapa(metricas, 'comparacao') as etapa:
+            resultados_comparacao = v3.comparar_dados(
+                df_excel_agrupado, itens_xml,
+                protocolos_excel, protocolos_xml,
+                contas_excel, contas_xml,
+                arquivos_por_protocolo, protocolos_duplicados,
+                protocolo_por_conta_xml, protocolo_por_conta_excel,
+                contas_por_arquivo,
+                tolerancia_preco=trabalho['tolerancia_preco'],
+                cod_prestador=trabalho['codigo_prestador'],
+                assinaturas_por_protocolo=assinaturas_por_protocolo,
+                hashes_por_arquivo=hashes_por_arquivo if trabalho['verificar_hash'] else None,
+                posicoes_guias=posicoes_guias,
+                totais_guias=totais_guias,
+                em_camadas=trabalho['em_camadas']
+            )
+            etapa.contar(itens=len(itens_xml), linhas_excel=len(df_excel_agrupado))
+
+        pasta_saida = os.path.dirname(trabalho['arquivo_saida'])
+        if pasta_saida:
+            os.makedirs(pasta_saida, exist_ok=True)
+        with medir_etapa(metricas, 'relatorio') as etapa:
+            v3.gerar_relatorio(*resultados_comparacao,
+                               formatos_colunares=trabalho['colunar'],
+                               arquivo_saida=trabalho['arquivo_saida'])
+            etapa.contar(linhas=sum(len(df) for df in resultados_comparacao if df is not None))
+
+        if trabalho['word']:
+            with medir_etapa(metricas, 'word'):
+                v3.gerar_relatorio_executivo(resultados_comparacao[0], resultados_comparacao[1], trabalho['word'],
+                                             df_duplicados=resultados_comparacao[6])
+
+        gravar_metricas(metricas, trabalho['metricas'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Executa comparacoes Excel (TASY) vs XML (TISS)')
+    parser.add_argument('--config', help='arquivo JSON com os trabalhos (ver o cabecalho deste script)')
+    parser.add_argument('--pasta-xml', help='pasta com os XMLs TISS (recursiva)')
+    parser.add_argument('--excel', help='exportacao de contas do TASY (xlsx)')
+    parser.add_argument('--saida', help='relatorio xlsx de saida')
+    parser.add_argument('--prestador', action='append',
+                        help='codigo do prestador na operadora; pode ser repetido (um relatorio por codigo)')
+    parser.add_argument('--contas-ignorar', metavar='CONTAS',
+                        help='contas a ignorar, separadas por virgula')
+    parser.add_argument('--tolerancia', type=float, help='tolerancia de preco (padrao: 0.01)')
+    parser.add_argument('--usar-executante', action='store_true',
+                        help='item sem codigo no procedimento conta como do prestador executante da guia')
+    parser.add_argument('--resumo-prestadores', nargs='?', const='', metavar='ARQUIVO_CSV',
+                        help='mostra (e opcionalmente grava) as contagens por prestador da pasta de XMLs')
+    parser.add_argument('--colunar', nargs='?', const=','.join(FORMATOS_PADRAO), metavar='FORMATOS',
+                        help='grava tambem cada aba em formato colunar ao lado do xlsx')
+    parser.add_argument('--word', metavar='ARQUIVO_DOCX', help='gera tambem o relatorio executivo Word')
+    parser.add_argument('--workers', type=int, help='processos para leitura dos XMLs')
+    parser.add_argument('--pasta-cache', help='pasta do cache de leitura (padrao: .cache_xml)')
+    parser.add_argument('--sem-cache', action='store_true', help='nao usa nem grava cache de leitura')
+    parser.add_argument('--em-camadas', action='store_true',
+                        help='compara primeiro a assinatura de cada conta e so detalha item a item '
+                             'as contas que diferem')
+    parser.add_argument('--sem-verificar-hash', action='store_true',
+                        help='nao confere o hash TISS (epilogo) dos XMLs nem gera a aba 8')
+    parser.add_argument('--metricas', nargs='?', const='', metavar='ARQUIVO_JSON',
+                        help='mede cada etapa e cada XML e grava o resumo em JSON '
+                             '(padrao: <relatorio>_metricas.json)')
+    parser.add_argument('--pasta-estado', help='compara no modo incremental, com o estado nesta pasta')
+    parser.add_argument('--indice', metavar='ARQUIVO_SQLITE',
+                        help='atualiza tambem o indice das contas (indice_xml.py) das pastas de XMLs')
+    args = parser.parse_args()
+
+    try:
+        if args.config:
+            trabalhos, pasta_cache, workers, arquivo_indice = carregar_configuracao(args.config)
+        else:
+            if args.resumo_prestadores is not None and args.pasta_xml and not (args.excel or args.saida):
+                # Só o resumo por prestador, sem comparação
+                trabalhos = []
+            elif not (args.pasta_xml and args.excel and args.saida):
+                parser.error('informe --config, ou --pasta-xml, --excel e --saida')
+            else:
+                trabalhos = trabalhos_da_linha_de_comando(args)
+            pasta_cache, workers, arquivo_indice = '.cache_xml', 1, None
+    except (OSError, ValueError) as e:
+        print(f"Erro na configuracao: {e}")
+        sys.exit(2)
+
+    if args.pasta_cache:
+        pasta_cache = args.pasta_cache
+    if args.sem_cache:
+        pasta_cache = None
+    if args.workers:
+        workers = args.workers
+    if args.indice:
+        arquivo_indice = args.indice
+
+    print("\n" + "=" * 70)
+    print(f"COMPARACAO DE CONTAS MEDICAS - {len(trabalhos)} trabalho(s)")
+    print("=" * 70)
+
+    leituras = {}
+    if args.resumo_prestadores is not None:
+        pastas = [trabalho['pasta_xml'] for trabalho in trabalhos] or [args.pasta_xml]
+        for pasta_xml in dict.fromkeys(pastas):
+            leituras[pasta_xml] = ler_pasta_xml(pasta_xml, workers, pasta_cache)
+            arquivo_csv = args.resumo_prestadores
+            if arquivo_csv and len(leituras) > 1:
+                base, extensao = os.path.splitext(arquivo_csv)
+                arquivo_csv = f"{base}_{len(leituras)}{extensao}"
+            imprimir_resumo_prestadores(leituras[pasta_xml][0], arquivo_csv)
+
+    executar_trabalhos(trabalhos, workers=workers, pasta_cache=pasta_cache, leituras=leituras)
+
+    if arquivo_indice:
+        pastas = [trabalho['pasta_xml'] for trabalho in trabalhos] or [args.pasta_xml]
+        for pasta_xml in dict.fromkeys(pastas):
+            indice_xml.atualizar_indice(arquivo_indice, pasta_xml, workers, pasta_cache)
+
+    print("\n" + "=" * 70)
+    print("PROCESSAMENTO CONCLUIDO!")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
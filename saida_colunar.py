@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Cópia das abas do relatório em formatos colunares
+
+Grava cada DataFrame do relatório em Parquet (ou Feather) e CSV, numa pasta
+ao lado do xlsx, com um manifesto (manifesto.json) que lista as abas, os
+arquivos, o número de linhas e as colunas. Quem precisa dos resultados
+(ex.: o relatório Word) carrega esses arquivos com ler_abas_colunares em
+vez de abrir o xlsx com pd.read_excel.
+
+Parquet e Feather dependem do pyarrow; sem ele, só o CSV é gravado.
+"""
+
+import os
+import re
+import json
+import importlib.util
+from datetime import datetime
+
+import pandas as pd
+
+MANIFESTO = 'manifesto.json'
+FORMATOS_SUPORTADOS = ('parquet', 'feather', 'csv')
+FORMATOS_PADRAO = ('parquet', 'csv')
+
+
+def pasta_padrao(caminho_xlsx):
+    """Pasta dos arquivos colunares de um relatório: <relatorio>_dados"""
+    return os.path.splitext(caminho_xlsx)[0] + '_dados'
+
+
+def _nome_arquivo(nome_aba):
+    # '3-Diferenca Quantidade' -> '3_diferenca_quantidade'
+    return re.sub(r'[^0-9a-z]+', '_', nome_aba.lower()).strip('_')
+
+
+def _formatos_disponiveis(formatos):
+    invalidos = set(formatos) - set(FORMATOS_SUPORTADOS)
+    if invalidos:
+        raise ValueError(f"Formato(s) nao suportado(s): {', '.join(sorted(invalidos))}")
+    if importlib.util.find_spec('pyarrow') is None:
+        return [formato for formato in formatos if formato == 'csv']
+    return list(formatos)
+
+
+def _gravar(df, caminho, formato):
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    if formato == 'parquet':
+        df.to_parquet(temporario, index=False)
+    elif formato == 'feather':
+        df.reset_index(drop=True).to_feather(temporario)
+    else:
+        df.to_csv(temporario, index=False, encoding='utf-8')
+    os.replace(temporario, caminho)
+
+
+def gravar_abas_colunares(pasta, abas, formatos=FORMATOS_PADRAO, relatorio_xlsx=None):
+    """
+    Grava cada (nome_da_aba, DataFrame) de abas nos formatos pedidos e o
+    manifesto. Abas sem dados são gravadas vazias (sem a mensagem do xlsx).
+    Retorna o caminho do manifesto.
+    """
+    formatos = _formatos_disponiveis(formatos)
+    os.makedirs(pasta, exist_ok=True)
+
+    manifesto = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'relatorio_xlsx': os.path.basename(relatorio_xlsx) if relatorio_xlsx else None,
+        'abas': [],
+    }
+
+    for nome_aba, df in abas:
+        if df is None:
+            df = pd.DataFrame()
+        base = _nome_arquivo(nome_aba)
+        arquivos = {}
+        for formato in formatos:
+            arquivos[formato] = f"{base}.{formato}"
+            _gravar(df, os.path.join(pasta, arquivos[formato]), formato)
+        manifesto['abas'].append({
+            'aba': nome_aba,
+            'linhas': len(df),
+            'colunas': [str(coluna) for coluna in df.columns],
+            'arquivos': arquivos,
+        })
+
+    caminho_manifesto = os.path.join(pasta, MANIFESTO)
+    temporario = f"{caminho_manifesto}.{os.getpid()}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho_manifesto)
+    return caminho_manifesto
+
+
+def ler_abas_colunares(pasta, abas=None):
+    """
+    Carrega as abas gravadas por gravar_abas_colunares como
+    {nome_da_aba: DataFrame}. Com abas, só carrega as abas indicadas. Usa
+    o formato mais rápido disponível de cada aba (Parquet, Feather, CSV).
+    """
+    with open(os.path.join(pasta, MANIFESTO), encoding='utf-8') as f:
+        manifesto = json.load(f)
+
+    frames = {}
+    for entrada in manifesto['abas']:
+        if abas is not None and entrada['aba'] not in abas:
+            continue
+        arquivos = entrada['arquivos']
+        if 'parquet' in arquivos:
+            df = pd.read_parquet(os.path.join(pasta, arquivos['parquet']))
+        elif 'feather' in arquivos:
+            df = pd.read_feather(os.path.join(pasta, arquivos['feather']))
+        elif entrada['colunas']:
+            # O CSV não guarda tipos: códigos só com dígitos voltam como número
+            df = pd.read_csv(os.path.join(pasta, arquivos['csv']))
+        else:
+            df = pd.DataFrame()
+        frames[entrada['aba']] = df
+    return frames
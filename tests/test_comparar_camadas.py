@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""A comparação em camadas gera as mesmas abas 3 a 6 que a comparação completa"""
+
+import pandas as pd
+import pytest
+
+from acumulador_itens import AcumuladorItens
+from comparar_contas_v3 import agrupar_acumulador, comparar_dados, contas_com_assinatura_igual, processar_excel
+from precos import ESCALA_QTD, ESCALA_VALOR
+
+# (protocolo, conta, item, quantidade, preço unitário)
+ITENS_EXCEL = [
+    ('10', '1', 'A', 1, 10.00), ('10', '1', 'B', 2, 5.00),     # igual nos dois lados
+    ('10', '2', 'A', 1, 10.00),                                # quantidade diferente
+    ('10', '3', 'C', 1, 7.01), ('10', '3', 'C', 1, 7.02),      # média 7.015 contra 7.01
+    ('10', '4', 'D', 1, 3.00), ('11', '4', 'D', 2, 3.00),      # REPETIDA: mesma assinatura,
+    ('10', '5', 'F', 1, 1.00),                                 # quantidades trocadas
+    ('10', '7', 'E', 3, 2.00),
+]
+# (protocolo, conta, item, quantidade, preço unitário, arquivo[, valor total])
+ITENS_XML = [
+    ('10', '1', 'A', 1, 10.00, 'a.xml'), ('10', '1', 'B', 2, 5.00, 'a.xml'),
+    ('10', '2', 'A', 2, 10.00, 'a.xml'),
+    ('10', '3', 'C', 2, 7.01, 'a.xml', 14.03),                # mesmo total, outra média
+    ('10', '4', 'D', 2, 3.00, 'a.xml'), ('11', '4', 'D', 1, 3.00, 'b.xml'),
+    ('10', '6', 'G', 1, 4.00, 'a.xml'),                        # só no XML
+    ('10', '7', 'E', 1, 2.00, 'a.xml'), ('10', '7', 'E', 1, 2.00, 'b.xml'),
+    (None, '8', 'H', 1, 1.00, 'c.xml'),                        # arquivo sem numeroLote
+]
+
+
+@pytest.fixture
+def dados(tmp_path, capsys):
+    linhas = [{'NR_SEQ_PROTOCOLO': protocolo, 'NR_INTERNO_CONTA': conta, 'ITEM_CD_CONVENIO': item,
+               'DS_ITEM': item, 'QT_ITEM': qtd, 'PRECO_UNITARIO': preco, 'PRECO_TOTAL': round(qtd * preco, 2)}
+              for protocolo, conta, item, qtd, preco in ITENS_EXCEL]
+    caminho = tmp_path / 'tasy.xlsx'
+    pd.DataFrame(linhas).to_excel(caminho, index=False)
+    df_excel = processar_excel(arquivo_excel=str(caminho), contas_ignorar=set())[0]
+
+    itens = AcumuladorItens()
+    for protocolo, conta, item, qtd, preco, arquivo, *total in ITENS_XML:
+        total = total[0] if total else qtd * preco
+        itens.adicionar(protocolo, conta, item, round(qtd * ESCALA_QTD), round(preco * ESCALA_VALOR),
+                        round(total * ESCALA_VALOR), arquivo, '110020')
+    return df_excel, itens
+
+
+def _abas_itens(df_excel, itens, tolerancia, em_camadas):
+    protocolos = set(df_excel['NR_SEQ_PROTOCOLO'])
+    contas = set(df_excel['NR_INTERNO_CONTA'])
+    abas = comparar_dados(df_excel, itens, protocolos, protocolos, contas, contas, {}, {}, {}, {}, {},
+                          tolerancia_preco=tolerancia, em_camadas=em_camadas)[2:6]
+    # A ordem dos nomes dentro de ARQUIVO_XML vem de um set
+    return [aba.assign(ARQUIVO_XML=[', '.join(sorted(str(nomes).split(', '))) for nomes in aba['ARQUIVO_XML']])
+            if 'ARQUIVO_XML' in aba else aba for aba in abas]
+
+
+@pytest.mark.parametrize('tolerancia', [0.01, 0.004])
+def test_abas_3_a_6_iguais_a_comparacao_completa(dados, tolerancia):
+    df_excel, itens = dados
+    completa = _abas_itens(df_excel, itens, tolerancia, em_camadas=False)
+    camadas = _abas_itens(df_excel, itens, tolerancia, em_camadas=True)
+    for aba_completa, aba_camadas in zip(completa, camadas):
+        pd.testing.assert_frame_equal(aba_completa.reset_index(drop=True), aba_camadas.reset_index(drop=True),
+                                      check_dtype=False)
+
+    df_dif_qtd, df_dif_preco, df_apenas_excel, df_apenas_xml = camadas
+    assert set(df_dif_qtd['NR_INTERNO_CONTA']) == {'2', '4', '7'}
+    assert 'a.xml, b.xml' in set(df_dif_qtd['ARQUIVO_XML'])
+    assert set(df_dif_preco['NR_INTERNO_CONTA']) == (set() if tolerancia >= 0.01 else {'3'})
+    assert set(df_apenas_excel['NR_INTERNO_CONTA']) == {'5'}
+    assert df_apenas_xml[['NR_SEQ_PROTOCOLO', 'NR_INTERNO_CONTA']].values.tolist() == [['10', '6'], ['None', '8']]
+
+
+@pytest.mark.parametrize('tolerancia, esperadas', [(0.01, {'1', '3'}), (0.004, {'1'})])
+def test_contas_dispensadas(dados, tolerancia, esperadas):
+    df_excel, itens = dados
+    df_xml_agrupado, _ = agrupar_acumulador(itens)
+    # A conta 4 tem a mesma assinatura nos dois lados, mas é REPETIDA
+    assert set(contas_com_assinatura_igual(df_excel, df_xml_agrupado, tolerancia)) == esperadas
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Aba 7: conteúdo dos arquivos de um protocolo duplicado"""
+
+import xml.etree.ElementTree as ET
+
+from acumulador_itens import AcumuladorItens
+from comparar_contas_v3 import (LIMITE_ITENS_DETALHE, assinar_guias, comparar_conteudo_duplicados,
+                                processar_guia)
+from leitor_tiss import NS_TISS
+
+
+def _guia(numero, itens):
+    """Guia com itens (codigo, quantidade, unitario, total)"""
+    procedimentos = ''.join(f"""
+    <ans:procedimentoExecutado>
+      <ans:procedimento><ans:codigoProcedimento>{codigo}</ans:codigoProcedimento></ans:procedimento>
+      <ans:quantidadeExecutada>{qtd}</ans:quantidadeExecutada>
+      <ans:valorUnitario>{unitario}</ans:valorUnitario>
+      <ans:valorTotal>{total}</ans:valorTotal>
+    </ans:procedimentoExecutado>""" for codigo, qtd, unitario, total in itens)
+    return f"""
+<ans:guiaResumoInternacao xmlns:ans="{NS_TISS}">
+  <ans:dadosGuia><ans:numeroGuiaPrestador>{numero}</ans:numeroGuiaPrestador></ans:dadosGuia>
+  <ans:procedimentosExecutados>{procedimentos}
+  </ans:procedimentosExecutados>
+</ans:guiaResumoInternacao>
+"""
+
+
+def _assinaturas(guias):
+    conteudo = {}
+    for numero, itens in guias.items():
+        processar_guia(ET.fromstring(_guia(numero, itens)), '77', 'lote.xml', AcumuladorItens(), conteudo)
+    return assinar_guias(conteudo)
+
+
+def test_detalhe_lista_itens_acrescentados_e_removidos():
+    primeiro = _assinaturas({
+        '1': [('A', '1', '10.00', '10.00'), ('B', '2', '1.50', '3.00')],
+        '2': [('C', '1', '5.00', '5.00')],
+    })
+    # Mesmos itens em outra ordem na guia 2; na guia 1, B trocou de
+    # quantidade e entrou um segundo A
+    segundo = _assinaturas({
+        '1': [('A', '1', '10.00', '10.00'), ('A', '1', '10.00', '10.00'), ('B', '0.5', '1.50', '0.75')],
+        '2': [('C', '1', '5.00', '5.00')],
+    })
+
+    df = comparar_conteudo_duplicados(
+        {'77': ['a.xml', 'b.xml']}, {'77': [('a.xml', primeiro), ('b.xml', segundo)]})
+
+    linha = df.iloc[0]
+    assert (linha['CONTEUDO'], linha['GUIAS_IGUAIS'], linha['GUIAS_DIVERGENTES']) == ('DIVERGENTE', 1, 1)
+    assert linha['DETALHE'] == ("1: b.xml em relacao a a.xml: +A 1 x 10.00 = 10.00, +B 0.5 x 1.50 = 0.75, "
+                                "-B 2 x 1.50 = 3.00")
+
+
+def test_detalhe_limita_itens_listados():
+    itens = [(f'X{i:02d}', '1', '1.00', '1.00') for i in range(LIMITE_ITENS_DETALHE + 3)]
+    primeiro = _assinaturas({'1': []})
+    segundo = _assinaturas({'1': itens})
+
+    df = comparar_conteudo_duplicados(
+        {'77': ['a.xml', 'b.xml']}, {'77': [('a.xml', primeiro), ('b.xml', segundo)]})
+
+    mudancas = df.iloc[0]['DETALHE'].split(': ', 2)[2].split(', ')
+    assert len(mudancas) == LIMITE_ITENS_DETALHE + 1
+    assert mudancas[0] == '+X00 1 x 1.00 = 1.00'
+    assert mudancas[-1] == '... mais 3'
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Estados por pasta de mês do modo incremental"""
+
+import pandas as pd
+
+from acumulador_itens import AcumuladorItens
+from comparar_contas_incremental import consolidar_mes, juntar_aba, juntar_meses
+from comparar_contas_v3 import consolidar_arquivos_xml
+
+# (protocolo, arquivo, {conta: [(item, quantidade)]})
+MES_1 = [
+    ('10', 'a.xml', {'1': [('A', 1)], '2': [('B', 2)]}),
+    ('11', 'b.xml', {'3': [('C', 1)]}),
+]
+MES_2 = [
+    ('10', 'c.xml', {'1': [('A', 2)]}),      # protocolo 10 reenviado em outro mês
+    ('12', 'd.xml', {'4': [('D', 1)], '3': [('C', 3)]}),
+]
+
+
+def _resultados(arquivos):
+    resultados = []
+    for protocolo, nome, contas in arquivos:
+        itens = AcumuladorItens()
+        for conta, itens_conta in contas.items():
+            for item, qtd in itens_conta:
+                itens.adicionar(protocolo, conta, item, qtd * 10000, 100, qtd * 100, nome, '110020')
+        assinaturas = {conta: '\n'.join(f'{item}|{qtd}' for item, qtd in itens_conta)
+                       for conta, itens_conta in contas.items()}
+        guias = [(conta, None, 0, 1, None) for conta in contas]
+        resultados.append((protocolo, set(contas), itens, nome, assinaturas, None, guias))
+    return resultados
+
+
+def test_juntar_meses_igual_a_consolidar_todos(capsys):
+    estados = [consolidar_mes(_resultados(mes))[0] for mes in (MES_1, MES_2)]
+    contas = {'1', '3'}
+    (itens, arquivos_por_protocolo, protocolo_por_conta, contas_por_arquivo,
+     assinaturas_por_protocolo, posicoes_guias) = juntar_meses(estados, contas)
+
+    completo = consolidar_arquivos_xml(_resultados(MES_1 + MES_2), todas_assinaturas=True)
+    df_completo = completo[0].para_dataframe()
+    df_completo = df_completo[df_completo['NR_INTERNO_CONTA'].isin(contas)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(itens.para_dataframe().astype(object), df_completo.astype(object))
+
+    assert arquivos_por_protocolo == completo[3]
+    assert protocolo_por_conta == completo[5]
+    assert contas_por_arquivo == completo[6]
+    assert assinaturas_por_protocolo == completo[7]
+    assert posicoes_guias == completo[9]
+
+
+def test_juntar_aba_troca_so_as_chaves_afetadas():
+    salva = pd.DataFrame({'NR_INTERNO_CONTA': ['1', '2', '3'], 'VALOR': [1, 2, 3]})
+    nova = pd.DataFrame({'NR_INTERNO_CONTA': ['2', '0'], 'VALOR': [20, 0]})
+
+    aba = juntar_aba(salva, nova, 'NR_INTERNO_CONTA', {'0', '2', '3'}, ['NR_INTERNO_CONTA'])
+    assert aba.to_dict('list') == {'NR_INTERNO_CONTA': ['0', '1', '2'], 'VALOR': [0, 1, 20]}
+
+    # Sem linhas novas nem restantes, a aba fica vazia com as mesmas colunas
+    aba = juntar_aba(salva, None, 'NR_INTERNO_CONTA', {'1', '2', '3'})
+    assert len(aba) == 0 and list(aba.columns) == ['NR_INTERNO_CONTA', 'VALOR']
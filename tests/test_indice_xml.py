@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Procedimentos do índice de contas (indice_xml)"""
+
+from types import SimpleNamespace
+
+from acumulador_itens import AcumuladorItens
+from indice_xml import _inserir_arquivo, abrir_indice, consultar
+
+
+def test_procedimentos_de_guias_com_o_mesmo_numero(tmp_path):
+    # A conta 1 aparece em duas guias do lote, cada uma com seus itens
+    itens = AcumuladorItens()
+    for posicao, (conta, item) in enumerate([('1', 'P1'), ('1', 'P2'), ('2', 'P3')]):
+        itens.adicionar('77', conta, item, 10000, 100, 100, 'a.xml', '110020', guia=posicao)
+    guias = [('1', None, 0, 99, None), ('1', None, 100, 199, None), ('2', None, 200, 299, None)]
+
+    banco = str(tmp_path / 'indice.sqlite')
+    conexao = abrir_indice(banco)
+    with conexao:
+        _inserir_arquivo(conexao, str(tmp_path / 'a.xml'), SimpleNamespace(st_size=300, st_mtime_ns=0),
+                         ('77', {'1', '2'}, itens, 'a.xml', {}, None, guias))
+    conexao.close()
+
+    assert [(linha['INICIO'], linha['FIM']) for linha in consultar('procedimento', 'P2', banco)] == [(100, 199)]
+    assert [linha['INICIO'] for linha in consultar('conta', '1', banco)] == [0, 100]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""Aba 8: integridade do hash TISS dos arquivos"""
+
+from comparar_contas_v3 import contar_integridade, verificar_integridade
+
+HASH = '0123456789abcdef0123456789abcdef'
+OUTRO = 'fedcba9876543210fedcba9876543210'
+
+
+def test_nome_divergente_nao_e_falha_de_integridade():
+    df = verificar_integridade([
+        (f'1_{HASH}.xml', '1', HASH.upper(), HASH),       # confere
+        (f'2_{OUTRO}.xml', '2', HASH, HASH),              # só o nome traz outro hash
+        (f'3_{HASH}.xml', '3', OUTRO, HASH),
+        ('4.xml', '4', None, HASH),
+        ('5.xml', '5', None, None),
+    ])
+    assert df['STATUS'].tolist() == ['NOME DIVERGENTE', 'HASH DIVERGENTE', 'SEM HASH', 'ARQUIVO INVALIDO']
+    assert contar_integridade(df) == (3, 1)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Guias, numeroLote e hash lidos por LeitorTISS"""
+
+import pytest
+
+from leitor_tiss import TAG_NUMERO_GUIA, LeitorTISS, NS_TISS
+
+LOTE = f"""<?xml version="1.0" encoding="ISO-8859-1"?>
+<ans:mensagemTISS xmlns:ans="{NS_TISS}">
+  <ans:prestadorParaOperadora><ans:loteGuias>
+    <ans:numeroLote>77</ans:numeroLote>
+    <ans:guiasTISS>{{antes}}
+      <ans:guiaSP-SADT><ans:cabecalhoGuia><ans:numeroGuiaPrestador>1</ans:numeroGuiaPrestador></ans:cabecalhoGuia></ans:guiaSP-SADT>{{meio}}
+      <ans:guiaSP-SADT><ans:cabecalhoGuia><ans:numeroGuiaPrestador>2</ans:numeroGuiaPrestador></ans:cabecalhoGuia></ans:guiaSP-SADT>
+    </ans:guiasTISS>
+  </ans:loteGuias></ans:prestadorParaOperadora>
+  <ans:epilogo><ans:hash>abc</ans:hash></ans:epilogo>
+</ans:mensagemTISS>
+"""
+FALSA = '<ans:guiaSP-SADT><ans:numeroGuiaPrestador>9</ans:numeroGuiaPrestador></ans:guiaSP-SADT>'
+
+
+def _ler(tmp_path, antes='', meio=''):
+    caminho = tmp_path / 'lote.xml'
+    caminho.write_text(LOTE.format(antes=antes, meio=meio), encoding='iso-8859-1')
+    leitor = LeitorTISS(str(caminho), verificar_hash=True)
+    guias = [(guia.find(f'.//{TAG_NUMERO_GUIA}').text, leitor.posicao_guia) for guia in leitor]
+    return guias, leitor
+
+
+@pytest.mark.parametrize('antes, meio', [
+    (f'<!-- {FALSA} -->', ''),
+    ('', f'<![CDATA[{FALSA}]]>'),
+    ('<?instrucao ?>', ''),
+])
+def test_guia_em_comentario_ou_cdata_nao_conta(tmp_path, antes, meio):
+    guias, simples = _ler(tmp_path)
+    assert [numero for numero, _ in guias] == ['1', '2'] and all(guias[0][1])
+
+    guias, leitor = _ler(tmp_path, antes, meio)
+    # Lido pelo parser completo: as mesmas guias, sem posição
+    assert guias == [('1', None), ('2', None)]
+    assert (leitor.numero_lote, leitor.hash_epilogo) == ('77', 'abc')
+    assert leitor.hash_calculado == simples.hash_calculado
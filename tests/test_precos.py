@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Aritmética de ponto fixo de precos.py e a comparação de preços de comparar_itens"""
+
+import math
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from acumulador_itens import AcumuladorItens
+from comparar_contas_v3 import comparar_itens, processar_excel
+from precos import (ESCALA_FATOR, ESCALA_QTD, ESCALA_VALOR, arredondar_centavos_com_tolerancia, para_inteiros,
+                    texto_para_inteiro, totais_conferem)
+
+
+@pytest.mark.parametrize('texto, escala, esperado', [
+    ('155.7', ESCALA_VALOR, 15570),
+    ('155.70', ESCALA_VALOR, 15570),
+    ('155', ESCALA_VALOR, 15500),
+    ('0.01', ESCALA_VALOR, 1),
+    ('.5', ESCALA_VALOR, 50),
+    ('5.', ESCALA_VALOR, 500),
+    ('728.3318', ESCALA_QTD, 7283318),
+    ('1.3', ESCALA_FATOR, 130),
+    # Sinais e espaços
+    ('-155.7', ESCALA_VALOR, -15570),
+    ('+155.7', ESCALA_VALOR, 15570),
+    ('  -0.01 ', ESCALA_VALOR, -1),
+    (' 42\n', ESCALA_VALOR, 4200),
+    # Casas além da escala: meio para longe do zero
+    ('0.005', ESCALA_VALOR, 1),
+    ('0.0049', ESCALA_VALOR, 0),
+    ('-0.005', ESCALA_VALOR, -1),
+    ('-0.0049', ESCALA_VALOR, 0),
+    ('10.125', ESCALA_VALOR, 1013),
+    ('2.00005', ESCALA_QTD, 20001),
+    # Notação que só o Decimal aceita
+    ('1e2', ESCALA_VALOR, 10000),
+])
+def test_texto_para_inteiro(texto, escala, esperado):
+    assert texto_para_inteiro(texto, escala) == esperado
+
+
+@pytest.mark.parametrize('texto', ['', '   ', '-', '.', 'abc', '1.2.3', '1,50'])
+def test_texto_para_inteiro_invalido(texto):
+    with pytest.raises(ValueError):
+        texto_para_inteiro(texto, ESCALA_VALOR)
+
+
+def test_para_inteiros_sem_ruido_do_float():
+    # 0.29 * 100 = 28.999999999999996 e 1.1 * 10000 = 11000.000000000002
+    assert para_inteiros([0.29, 1.15, 155.7, -0.07, 0.0], ESCALA_VALOR).tolist() == [29, 115, 15570, -7, 0]
+    assert para_inteiros([1.1, 728.3318, 0.0001], ESCALA_QTD).tolist() == [11000, 7283318, 1]
+    assert para_inteiros(pd.Series([2.675]), ESCALA_VALOR).dtype == np.int64
+
+
+def test_para_inteiros_arredonda_casas_a_mais():
+    # Mais casas que a escala não deveriam chegar, mas viram o inteiro mais próximo
+    assert para_inteiros([0.014, 0.016, -0.016], ESCALA_VALOR).tolist() == [1, 2, -2]
+
+
+@pytest.mark.parametrize('centavos, esperado', [
+    (0, 0), (1, 2), (2, 2), (3, 4), (25, 26), (26, 26), (27, 28),
+    (-1, 0), (-2, -2), (-3, -2),
+])
+def test_arredondar_centavos_com_tolerancia_bordas(centavos, esperado):
+    assert arredondar_centavos_com_tolerancia(np.array([centavos])).tolist() == [esperado]
+
+
+def test_arredondar_centavos_com_tolerancia_contra_ceil_do_float():
+    centavos = np.arange(-1000, 1001)
+    resultado = arredondar_centavos_com_tolerancia(centavos)
+
+    # Critério exato: próximo múltiplo de 2 centavos
+    assert resultado.tolist() == [math.ceil(Fraction(int(c), 2)) * 2 for c in centavos]
+
+    # O antigo ceil(preco / 0.02) * 0.02 só difere onde a divisão em float
+    # passa de um inteiro exato (ex.: 0.14 / 0.02 = 7.000000000000001)
+    for c, novo in zip(centavos.tolist(), resultado.tolist()):
+        antigo = round(math.ceil((c / 100) / 0.02) * 0.02, 2)
+        if round(antigo * 100) != novo:
+            assert c % 2 == 0 and (c / 100) / 0.02 != c // 2
+
+
+def test_arredondar_centavos_com_tolerancia_preserva_series():
+    serie = pd.Series([25, 26], index=[10, 20], name='PRECO_UNITARIO')
+    resultado = arredondar_centavos_com_tolerancia(serie)
+    assert resultado.index.tolist() == [10, 20]
+    assert resultado.name == 'PRECO_UNITARIO'
+    assert resultado.tolist() == [26, 26]
+
+
+def test_totais_conferem():
+    # (quantidade, unitário, fator, total) nas escalas de precos.py
+    casos = [
+        (20000, 1550, 100, 3100, True),        # 2 x 15.50 = 31.00
+        (20000, 1550, 100, 3101, True),        # meio centavo no unitário x 2
+        (20000, 1550, 100, 3102, False),
+        (10000, 1000, 130, 1300, True),        # acréscimo de 30%
+        (20000, 1300, 130, 2600, True),        # unitário 13.00 já com o acréscimo de 30%
+        (20000, 1300, 130, 3380, True),        # e o fator aplicado sobre ele
+        (20000, 1300, 130, 3000, False),
+        (10000, 1000, 70, 700, True),          # redução de 30%
+        (15000, 333, 100, 500, True),          # 1.5 x 3.33 = 4.995 -> 5.00
+        (15000, 333, 100, 499, True),          # e 4.99 também (meio centavo)
+        (15000, 333, 100, 498, False),
+        (7283318, 0, 100, 69, True),           # unitário de fato abaixo de meio centavo
+        (7283318, 0, 100, 400, False),         # 728.3318 x 0.005 = 3.64 no máximo
+        (-10000, 1000, 100, -1000, True),      # estorno
+        (-10000, 1000, 100, 1000, False),
+    ]
+    qtd, unit, fator, total, esperado = (np.array(coluna) for coluna in zip(*casos))
+    assert totais_conferem(qtd, unit, fator, total).tolist() == esperado.tolist()
+
+
+# -- Comparação de preços (aba 4) contra o cálculo antigo em float -----------
+
+# Itens de uma conta: (item, quantidade, preço unitário) em reais, como no
+# Excel e no XML
+ITENS_EXCEL = [
+    ('A', 1, 10.00), ('A', 1, 10.01),          # média 10.005
+    ('B', 2, 5.00),
+    ('C', 1, 7.33), ('C', 1, 7.34), ('C', 1, 7.33),
+    ('D', 1, 100.00),
+    ('E', 1, 3.01), ('E', 1, 3.02),            # média 3.015
+    ('F', 3, 0.99),
+]
+ITENS_XML = [
+    ('A', 1, 10.00), ('A', 1, 10.01),          # mesma média: sem diferença
+    ('B', 2, 4.99),                            # mesma faixa, 1 centavo: dentro da tolerância
+    ('C', 1, 7.34), ('C', 1, 7.34), ('C', 1, 7.33),   # 7.3333 contra 7.3367
+    ('D', 1, 100.03),                          # outra faixa: não casa
+    ('E', 2, 3.01),                            # 3.015 contra 3.01
+    ('F', 3, 0.98), ('F', 1, 0.97),            # faixa 0.98 contra 1.00: não casa
+]
+
+
+def _df_excel(tmp_path, itens, conta='900'):
+    linhas = [{'NR_SEQ_PROTOCOLO': '1', 'NR_INTERNO_CONTA': conta, 'ITEM_CD_CONVENIO': item, 'DS_ITEM': item,
+               'QT_ITEM': qtd, 'PRECO_UNITARIO': preco, 'PRECO_TOTAL': round(qtd * preco, 2)}
+              for item, qtd, preco in itens]
+    caminho = tmp_path / 'tasy.xlsx'
+    pd.DataFrame(linhas).to_excel(caminho, index=False)
+    return processar_excel(arquivo_excel=str(caminho), contas_ignorar=set())[0]
+
+
+def _df_xml(itens, conta='900'):
+    acumulador = AcumuladorItens()
+    for item, qtd, preco in itens:
+        acumulador.adicionar('1', conta, item, round(qtd * ESCALA_QTD), round(preco * ESCALA_VALOR),
+                             round(qtd * preco * ESCALA_VALOR), 'lote.xml', '110020')
+    return acumulador.para_dataframe()
+
+
+def _diferencas_float(tolerancia):
+    """Aba 4 calculada como antes: médias em float por item e faixa, |diferença| > tolerância"""
+    def medias(itens):
+        grupos = {}
+        for item, _, preco in itens:
+            faixa = round(math.ceil(round(preco * 100) / 2) * 0.02, 2)
+            grupos.setdefault((item, faixa), []).append(preco)
+        return {chave: sum(precos) / len(precos) for chave, precos in grupos.items()}
+
+    excel, xml = medias(ITENS_EXCEL), medias(ITENS_XML)
+    return {item: excel[(item, faixa)] - xml[(item, faixa)]
+            for item, faixa in excel.keys() & xml.keys()
+            if abs(excel[(item, faixa)] - xml[(item, faixa)]) > tolerancia}
+
+
+@pytest.mark.parametrize('tolerancia', [0.01, 0.005, 0.004, 0.001])
+def test_diferenca_de_preco_igual_ao_float(tmp_path, capsys, tolerancia):
+    _, df_dif_preco, _, _ = comparar_itens(_df_excel(tmp_path, ITENS_EXCEL), _df_xml(ITENS_XML), tolerancia)
+
+    esperado = _diferencas_float(tolerancia)
+    obtido = dict(zip(df_dif_preco['ITEM_CD_CONVENIO'], df_dif_preco['DIFERENCA_PRECO']))
+    assert obtido.keys() == esperado.keys()
+    for item, diferenca in esperado.items():
+        assert obtido[item] == pytest.approx(diferenca, abs=1e-9)
+
+    medias = df_dif_preco.set_index('ITEM_CD_CONVENIO')
+    for item in obtido:
+        assert medias.loc[item, 'PRECO_UNITARIO_EXCEL'] - medias.loc[item, 'PRECO_UNITARIO_XML'] == \
+            pytest.approx(obtido[item], abs=1e-9)
+
+
+def test_diferenca_de_preco_exatamente_na_tolerancia(tmp_path, capsys):
+    # Diferença de exatamente 1 centavo na mesma faixa não entra na aba. Em
+    # float dependia do ruído: 5.02 - 5.01 = 0.009999999999999787 ficava de
+    # fora, mas 0.28 - 0.27 = 0.010000000000000009 entrava
+    excel = [('X', 1, 0.28), ('Y', 1, 5.02)]
+    xml = [('X', 1, 0.27), ('Y', 1, 5.01)]
+    assert abs(0.28 - 0.27) > 0.01 and abs(5.02 - 5.01) <= 0.01
+    df_dif_qtd, df_dif_preco, apenas_excel, apenas_xml = comparar_itens(_df_excel(tmp_path, excel), _df_xml(xml),
+                                                                        0.01)
+    assert len(df_dif_preco) == 0
+    assert len(df_dif_qtd) == 0 and len(apenas_excel) == 0 and len(apenas_xml) == 0
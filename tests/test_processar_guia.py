@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Itens lidos de uma guia por processar_guia"""
+
+import xml.etree.ElementTree as ET
+
+from acumulador_itens import AcumuladorItens
+from comparar_contas_v3 import processar_guia
+from leitor_tiss import NS_TISS
+
+GUIA = f"""
+<ans:guiaResumoInternacao xmlns:ans="{NS_TISS}">
+  <ans:dadosGuia><ans:numeroGuiaPrestador>123</ans:numeroGuiaPrestador></ans:dadosGuia>
+  <ans:procedimentosExecutados>
+    <ans:procedimentoExecutado>
+      <ans:procedimento><ans:codigoProcedimento>P1</ans:codigoProcedimento></ans:procedimento>
+      <ans:quantidadeExecutada>1</ans:quantidadeExecutada>
+      <ans:valorUnitario>10.00</ans:valorUnitario>
+      <ans:valorTotal>10.00</ans:valorTotal>
+    </ans:procedimentoExecutado>
+  </ans:procedimentosExecutados>
+  <ans:outrasDespesas>
+    <ans:despesa>
+      <ans:codigoDespesa>03</ans:codigoDespesa>
+      <ans:servicosExecutados>
+        <ans:codigoProcedimento>M1</ans:codigoProcedimento>
+        <ans:quantidadeExecutada>2</ans:quantidadeExecutada>
+        <ans:valorUnitario>1.50</ans:valorUnitario>
+        <ans:valorTotal>3.00</ans:valorTotal>
+      </ans:servicosExecutados>
+    </ans:despesa>
+  </ans:outrasDespesas>
+  <ans:servicosExecutados>
+    <ans:codigoProcedimento>S1</ans:codigoProcedimento>
+    <ans:quantidadeExecutada>1</ans:quantidadeExecutada>
+    <ans:valorUnitario>5.00</ans:valorUnitario>
+  </ans:servicosExecutados>
+</ans:guiaResumoInternacao>
+"""
+
+
+def test_servicos_dentro_e_fora_de_despesa():
+    itens = AcumuladorItens()
+    assert processar_guia(ET.fromstring(GUIA), '77', 'lote.xml', itens) == '123'
+
+    df = itens.para_dataframe()
+    linhas = list(zip(df['ITEM_CD_CONVENIO'], df['QT_ITEM'], df['PRECO_TOTAL'], df['CD_DESPESA'].astype(object).fillna('')))
+    assert linhas[0] == ('P1', 10000, 1000, '')
+    # O serviço fora de uma despesa também é lido, sem codigoDespesa
+    assert sorted(linhas[1:]) == sorted([('M1', 20000, 300, '03'), ('S1', 10000, 500, '')])
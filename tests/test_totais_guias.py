@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Conferência dos totais das guias e dos itens (abas 9 e 10)"""
+
+from acumulador_itens import AcumuladorItens
+from leitor_tiss import CAMPOS_VALOR_TOTAL
+from totais_guias import TotaisGuias
+
+
+def _valores(**campos):
+    return tuple(campos.get(campo) for campo in CAMPOS_VALOR_TOTAL)
+
+
+def _arquivo(nome, guias):
+    """Resultado de um arquivo: guias como (numero_guia, valores, [(item, qtd, unit, fator, total, despesa)])"""
+    itens = AcumuladorItens()
+    for posicao, (numero_guia, _, itens_guia) in enumerate(guias):
+        for item, qtd, unitario, fator, total, despesa in itens_guia:
+            itens.adicionar('77', numero_guia, item, qtd, unitario, total, nome, '110020',
+                            reducao=fator, cd_despesa=despesa, guia=posicao)
+    # Guias de 100 bytes, uma depois da outra
+    return itens, [(numero_guia, None, 100 * posicao, 100 * posicao + 99, valores)
+                   for posicao, (numero_guia, valores, _) in enumerate(guias)]
+
+
+def test_acrescimo_ja_no_unitario_confere():
+    totais = TotaisGuias()
+    # 2 x 13.00 (10.00 com o acréscimo de 1.30 já aplicado) = 26.00
+    itens, guias = _arquivo('a.xml', [
+        ('1', _valores(valorMateriais=2600, valorTotalGeral=2600), [('M1', 20000, 1300, 130, 2600, '03')]),
+    ])
+    totais.adicionar('77', 'a.xml', itens, guias)
+
+    df_guias, df_itens = totais.conferir()
+    assert len(totais) == 1
+    assert len(df_guias) == 0 and len(df_itens) == 0
+
+
+def test_guias_repetidas_conferidas_cada_uma():
+    totais = TotaisGuias()
+    # O mesmo numeroGuiaPrestador em duas guias do lote, e outro arquivo depois
+    itens, guias = _arquivo('a.xml', [
+        ('1', _valores(valorProcedimentos=1000, valorTotalGeral=1000), [('P1', 10000, 1000, 100, 1000, None)]),
+        ('1', _valores(valorMateriais=500, valorTotalGeral=600), [('M1', 10000, 600, 100, 600, '03')]),
+    ])
+    totais.adicionar('77', 'a.xml', itens, guias)
+    itens, guias = _arquivo('b.xml', [
+        ('2', _valores(valorProcedimentos=900, valorTotalGeral=900), [('P1', 10000, 1000, 100, 950, None)]),
+    ])
+    totais.adicionar('78', 'b.xml', itens, guias)
+
+    df_guias, df_itens = totais.conferir()
+    assert len(totais) == 3
+    # O trecho é o da guia conferida, não o da primeira guia com o número
+    assert df_guias[['TRECHO_XML', 'NR_INTERNO_CONTA', 'CAMPO', 'VALOR_DECLARADO', 'SOMA_ITENS']].values.tolist() == [
+        ['a.xml@100-199', '1', 'valorMateriais', 5.0, 6.0],
+        ['b.xml@0-99', '2', 'valorProcedimentos', 9.0, 9.5],
+        ['b.xml@0-99', '2', 'valorTotalGeral', 9.0, 9.5],
+    ]
+    assert df_itens[['TRECHO_XML', 'ITEM_CD_CONVENIO', 'VALOR_CALCULADO', 'DIFERENCA']].values.tolist() == [
+        ['b.xml@0-99', 'P1', 10.0, -0.5],
+    ]
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Conferência dos totais declarados nas guias TISS
+
+Cada guia de SP-SADT ou de internação declara, no bloco valorTotal, o
+total por grupo (valorProcedimentos, valorMateriais, valorMedicamentos,
+...) e o valorTotalGeral. Cada item declara quantidadeExecutada,
+valorUnitario, reducaoAcrescimo e valorTotal. Tudo isso é lido na mesma
+passada da extração (processar_arquivo_xml), juntado arquivo a arquivo
+durante a consolidação e conferido aqui de uma vez, sobre as colunas de
+todos os arquivos:
+- guias: soma dos valorTotal dos itens de cada grupo contra o campo do
+  grupo, e de todos os itens contra o valorTotalGeral
+- itens: valorTotal contra quantidade x valor unitário, com ou sem o
+  reducaoAcrescimo (precos.totais_conferem)
+
+Os procedimentos somam em valorProcedimentos e cada despesa no campo do
+seu codigoDespesa. Campo ausente no bloco conta como zero.
+"""
+
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from acumulador_itens import AcumuladorItens
+from leitor_tiss import CAMPOS_VALOR_TOTAL
+from precos import ESCALA_FATOR, ESCALA_QTD, ESCALA_VALOR, produtos_dos_itens, totais_conferem
+
+# Campo do bloco valorTotal em que cada codigoDespesa é somado (tabela 25
+# da TISS). Despesa de código desconhecido entra só no valorTotalGeral.
+CAMPO_POR_DESPESA = {
+    '01': 'valorGasesMedicinais',
+    '02': 'valorMedicamentos',
+    '03': 'valorMateriais',
+    '05': 'valorDiarias',
+    '07': 'valorTaxasAlugueis',
+    '08': 'valorOPME',
+}
+CAMPO_PROCEDIMENTOS = 'valorProcedimentos'
+CAMPO_TOTAL_GERAL = 'valorTotalGeral'
+CAMPOS_GRUPOS = tuple(campo for campo in CAMPOS_VALOR_TOTAL if campo != CAMPO_TOTAL_GERAL)
+_POSICAO_CAMPO = {campo: i for i, campo in enumerate(CAMPOS_VALOR_TOTAL)}
+_POSICAO_TOTAL_GERAL = _POSICAO_CAMPO[CAMPO_TOTAL_GERAL]
+# Coluna extra das somas, para as despesas de código desconhecido
+_POSICAO_SEM_CAMPO = len(CAMPOS_VALOR_TOTAL)
+
+COLUNAS_GUIAS = ['NR_SEQ_PROTOCOLO', 'NR_INTERNO_CONTA', 'CAMPO', 'VALOR_DECLARADO', 'SOMA_ITENS',
+                 'DIFERENCA', 'ITENS', 'ARQUIVO_XML', 'TRECHO_XML']
+COLUNAS_ITENS = ['NR_SEQ_PROTOCOLO', 'NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'CD_DESPESA', 'QT_ITEM',
+                 'PRECO_UNITARIO', 'REDUCAO_ACRESCIMO', 'PRECO_TOTAL', 'VALOR_CALCULADO', 'DIFERENCA',
+                 'ARQUIVO_XML', 'TRECHO_XML']
+
+
+class TotaisGuias:
+    """
+    Conferência dos totais das guias e dos itens de uma consolidação. Os
+    itens e os blocos valorTotal de cada arquivo são juntados ao entrar
+    (adicionar) e conferidos de uma vez em conferir, na ordem da
+    consolidação. A guia é identificada pela posição dela na consolidação
+    (o mesmo numeroGuiaPrestador pode aparecer em mais de uma guia do lote),
+    e cada linha divergente traz em TRECHO_XML o 'arquivo@inicio-fim' da
+    guia conferida.
+    """
+
+    def __init__(self):
+        # Itens de todos os prestadores, com a guia de cada um numerada na
+        # consolidação (-1 sem guia)
+        self._itens = AcumuladorItens()
+        self._guia_dos_itens = array('q')
+        self._total_guias = 0
+        # (inicio, fim) em bytes de cada guia no arquivo (-1 se não lido)
+        self._inicios = array('q')
+        self._fins = array('q')
+        # Guias com bloco valorTotal: posição na consolidação, (protocolo,
+        # numero_guia, arquivo) e os valores do bloco (None se ausente)
+        self._posicoes_blocos = array('q')
+        self._guias = []
+        self._valores_blocos = []
+
+    def __len__(self):
+        """Guias com bloco valorTotal"""
+        return len(self._guias)
+
+    def adicionar(self, numero_lote, nome_arquivo, itens, guias, excluir_contas=None):
+        """
+        Junta um arquivo a partir do resultado de processar_arquivo_xml
+        (AcumuladorItens de todos os prestadores e lista de guias), sem as
+        contas de excluir_contas
+        """
+        excluir_contas = excluir_contas or set()
+        base = self._total_guias
+        self._total_guias += len(guias)
+
+        for posicao, (numero_guia, _, inicio, fim, valores) in enumerate(guias):
+            self._inicios.append(-1 if inicio is None else inicio)
+            self._fins.append(-1 if fim is None else fim)
+            if valores is not None and numero_guia not in excluir_contas:
+                self._posicoes_blocos.append(base + posicao)
+                self._guias.append((numero_lote, numero_guia, nome_arquivo))
+                self._valores_blocos.append(valores)
+
+        if not len(itens):
+            return
+        self._itens.estender(itens, excluir_contas=excluir_contas)
+        guia_dos_itens = itens.coluna('GUIA')
+        manter = itens.manter_contas(excluir_contas)
+        if manter is not None:
+            guia_dos_itens = guia_dos_itens[manter]
+        self._guia_dos_itens.frombytes(np.where(guia_dos_itens >= 0, guia_dos_itens + base, -1).tobytes())
+
+    def conferir_guias(self):
+        """
+        Guias cujo bloco valorTotal não confere com a soma dos itens: uma
+        linha por campo divergente, com VALOR_DECLARADO, SOMA_ITENS e
+        DIFERENCA (declarado - soma) em reais e ITENS, os itens da guia
+        """
+        if not self._guias:
+            return pd.DataFrame(columns=COLUNAS_GUIAS)
+
+        # Campo de cada item: o do codigoDespesa, valorProcedimentos sem
+        # codigoDespesa, ou a coluna extra para código desconhecido
+        campo_por_codigo = np.array(
+            [_POSICAO_CAMPO[CAMPO_POR_DESPESA[codigo]] if codigo in CAMPO_POR_DESPESA else _POSICAO_SEM_CAMPO
+             for codigo in self._itens.textos('CD_DESPESA')] + [_POSICAO_CAMPO[CAMPO_PROCEDIMENTOS]],
+            dtype=np.intp
+        )
+        # Item sem guia (-1) cai na linha extra do fim, que não é lida
+        guia_dos_itens = np.frombuffer(self._guia_dos_itens, dtype=np.int64)
+        somas = np.zeros((self._total_guias + 1, _POSICAO_SEM_CAMPO + 1), dtype=np.int64)
+        np.add.at(somas, (guia_dos_itens, campo_por_codigo[self._itens.coluna('CD_DESPESA')]),
+                  self._itens.coluna('PRECO_TOTAL'))
+        somas[:, _POSICAO_TOTAL_GERAL] = somas.sum(axis=1)
+        contagens = np.bincount(guia_dos_itens + 1, minlength=self._total_guias + 1)[1:]
+
+        # Campo ausente no bloco (None) conta como zero
+        declarados = np.nan_to_num(np.array(self._valores_blocos, dtype=np.float64)).astype(np.int64)
+        posicoes = np.frombuffer(self._posicoes_blocos, dtype=np.int64)
+        calculados = somas[posicoes, :_POSICAO_SEM_CAMPO]
+        linhas, campos = np.nonzero(declarados != calculados)
+        if not len(linhas):
+            return pd.DataFrame(columns=COLUNAS_GUIAS)
+
+        protocolos, contas, arquivos = zip(*[self._guias[linha] for linha in linhas.tolist()])
+        guias = posicoes[linhas]
+        resultado = pd.DataFrame({
+            'NR_SEQ_PROTOCOLO': protocolos,
+            'NR_INTERNO_CONTA': contas,
+            'CAMPO': [CAMPOS_VALOR_TOTAL[campo] for campo in campos.tolist()],
+            'VALOR_DECLARADO': declarados[linhas, campos] / ESCALA_VALOR,
+            'SOMA_ITENS': calculados[linhas, campos] / ESCALA_VALOR,
+            'DIFERENCA': (declarados[linhas, campos] - calculados[linhas, campos]) / ESCALA_VALOR,
+            'ITENS': contagens[guias],
+            'ARQUIVO_XML': arquivos,
+            'TRECHO_XML': self._trechos(arquivos, guias),
+        })
+        return resultado[COLUNAS_GUIAS]
+
+    def conferir_itens(self):
+        """
+        Itens cujo valorTotal não confere com quantidade x valor unitário,
+        nem com nem sem o reducaoAcrescimo (fora da tolerância de
+        arredondamento), com o VALOR_CALCULADO mais próximo do declarado e a
+        DIFERENCA (declarado - calculado) em reais
+        """
+        quantidades = self._itens.coluna('QT_ITEM')
+        unitarios = self._itens.coluna('PRECO_UNITARIO')
+        fatores = self._itens.coluna('REDUCAO_ACRESCIMO')
+        totais = self._itens.coluna('PRECO_TOTAL')
+
+        divergentes = np.flatnonzero(~totais_conferem(quantidades, unitarios, fatores, totais))
+        if not len(divergentes):
+            return pd.DataFrame(columns=COLUNAS_ITENS)
+
+        # O None no fim do vocabulário faz o código -1 (ausente) virar None
+        resultado = pd.DataFrame({
+            nome: np.array(self._itens.textos(nome) + [None], dtype=object)[self._itens.coluna(nome)[divergentes]]
+            for nome in ('NR_SEQ_PROTOCOLO', 'NR_INTERNO_CONTA', 'ITEM_CD_CONVENIO', 'CD_DESPESA', 'ARQUIVO_XML')
+        })
+        quantidades = quantidades[divergentes]
+        unitarios = unitarios[divergentes]
+        fatores = fatores[divergentes]
+        totais = totais[divergentes]
+
+        escala = ESCALA_QTD * ESCALA_FATOR
+        com_fator = produtos_dos_itens(quantidades, unitarios, fatores)
+        sem_fator = produtos_dos_itens(quantidades, unitarios, ESCALA_FATOR)
+        produtos = np.where(np.abs(totais * escala - sem_fator) < np.abs(totais * escala - com_fator),
+                            sem_fator, com_fator)
+        resultado['VALOR_CALCULADO'] = np.round(produtos / escala) / ESCALA_VALOR
+        resultado['QT_ITEM'] = quantidades / ESCALA_QTD
+        resultado['PRECO_UNITARIO'] = unitarios / ESCALA_VALOR
+        resultado['REDUCAO_ACRESCIMO'] = fatores / ESCALA_FATOR
+        resultado['PRECO_TOTAL'] = totais / ESCALA_VALOR
+        resultado['DIFERENCA'] = (resultado['PRECO_TOTAL'] - resultado['VALOR_CALCULADO']).round(2)
+        resultado['TRECHO_XML'] = self._trechos(
+            resultado['ARQUIVO_XML'], np.frombuffer(self._guia_dos_itens, dtype=np.int64)[divergentes])
+        return resultado[COLUNAS_ITENS]
+
+    def _trechos(self, arquivos, guias):
+        """'arquivo@inicio-fim' de cada guia (posição na consolidação), ou '' sem a posição"""
+        inicios = np.frombuffer(self._inicios, dtype=np.int64)
+        fins = np.frombuffer(self._fins, dtype=np.int64)
+        return [f"{arquivo}@{inicios[guia]}-{fins[guia]}" if guia >= 0 and inicios[guia] >= 0 else ''
+                for arquivo, guia in zip(arquivos, guias.tolist())]
+
+    def conferir(self):
+        """(guias divergentes, itens divergentes): conferir_guias e conferir_itens"""
+        return self.conferir_guias(), self.conferir_itens()